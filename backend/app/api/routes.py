@@ -1,16 +1,29 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, HTTPException, UploadFile, File, Header, Query, Response
 from fastapi.responses import FileResponse
-from ..models.schemas import SearchRequest, SearchResponse, IngestRequest, IngestResponse, Segment, HistoryResponse, VideoInfo, UploadVideoResponse
-from ..services import transcript as transcript_service
-from ..services.search import index_segments, semantic_search, get_video_history
+from ..models.schemas import SearchRequest, SearchResponse, IngestRequest, IngestResponse, Segment, HistoryResponse, VideoInfo, UploadVideoResponse, EmbeddingMigrationStatus, ResegmentRequest, ResegmentResponse, ResegmentedVideo, LibraryImportResponse
+from ..services.search import semantic_search, get_video_history, embed_query, index_state, index_version
+from ..services.ingest import ingest_media, resegment_video
+from ..services.media import faststart_path, hls_dir, prepare_playback
+from ..services.migration import progress as migration_progress
+from ..services.library_io import SEGMENTS_FILE, TABLES as LIBRARY_TABLES, VIDEOS_FILE, export_library, import_library
 from ..services.agent import generate_answer
+from ..services.admission import Overloaded, limiter
+from ..services.answer_cache import answer_cache
+from ..services.query_log import query_log, traffic
+from ..services.db import decode_cursor, encode_cursor
+from ..services.deadline import resolve_deadline
+from ..config import settings
+from typing import Optional
 from uuid import uuid4
 import urllib.parse as urlparse
 import logging
 import os
 import tempfile
 import aiofiles
+import asyncio
+import hashlib
 import shutil
+import subprocess
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -23,31 +36,102 @@ def _rid() -> str:
     return uuid4().hex[:12]
 
 
+def _overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+
+
+def _download_video(video_url: str, tmpdir: str, rid: str) -> str:
+    """Download with yt-dlp into `tmpdir` (blocking). Tries bestaudio+bestvideo, then audio only."""
+    import yt_dlp
+
+    video_path = None
+    yt_dlp_errors = []
+    for ydl_format in [
+        'bestaudio+bestvideo/best',
+        'bestaudio/best',
+        'best'
+    ]:
+        ydl_opts = {
+            'format': ydl_format,
+            'outtmpl': os.path.join(tmpdir, '%(id)s.%(ext)s'),
+            'quiet': True,
+            'merge_output_format': 'mp4',
+        }
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(video_url, download=True)
+                video_path = ydl.prepare_filename(info)
+            logger.info(f"[{rid}] Downloaded YouTube video to {video_path} with format {ydl_format}")
+            break
+        except Exception as e:
+            yt_dlp_errors.append(f"Format {ydl_format}: {e}")
+            video_path = None
+    if not video_path or not os.path.exists(video_path):
+        logger.error(f"[{rid}] yt-dlp failed for all formats: {yt_dlp_errors}")
+        raise Exception(f"Failed to download video. yt-dlp errors: {yt_dlp_errors}")
+    return video_path
+
+
+def _check_audio_stream(video_path: str, rid: str) -> None:
+    """Check for an audio stream using ffprobe before Whisper (blocking)."""
+    ffprobe_cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'a', '-show_entries', 'stream=index',
+        '-of', 'csv=p=0', video_path
+    ]
+    try:
+        result = subprocess.run(ffprobe_cmd, capture_output=True, text=True, check=True)
+        logger.info(f"[{rid}] ffprobe output: {result.stdout.strip()}")
+        if not result.stdout.strip():
+            raise Exception("Downloaded video file does not contain an audio stream. Try a different video or check yt-dlp options.")
+    except Exception as ffprobe_error:
+        logger.error(f"[{rid}] ffprobe audio check failed: {ffprobe_error}")
+        raise Exception(f"Audio stream check failed: {ffprobe_error}")
+
+
 @router.post("/search_timestamps", response_model=SearchResponse)
-async def search_timestamps(payload: SearchRequest):
+async def search_timestamps(payload: SearchRequest, x_deadline_ms: Optional[float] = Header(default=None)):
     if not payload.query:
         raise HTTPException(status_code=400, detail="Query is required")
+    deadline = resolve_deadline(payload.deadline_ms, x_deadline_ms, settings.SEARCH_DEADLINE_MS)
     rid = _rid()
-    logger.info(f"[{rid}] search: query='{payload.query}' video_id={payload.video_id}")
+    logger.info(f"[{rid}] search: query='{payload.query}' video_id={payload.video_id} t=[{payload.t_min}, {payload.t_max}]")
 
     try:
-        docs = await semantic_search(payload.query, k=payload.k, video_id=payload.video_id)
-        results = [
-            Segment(
-                video_id=d.get("video_id"),
-                t_start=float(d.get("start_time", 0.0)),
-                t_end=float(d.get("end_time", 0.0)),
-                title=d.get("title"),
-                snippet=d.get("snippet") or d.get("text", ""),
-                score=float(d.get("score", 0.0)),
-            )
-            for d in docs
-        ]
+        with traffic.live():
+            version, model = await index_state()
+            qv = embed_query(payload.query, model)
+            scope = (payload.video_id, payload.k, payload.t_min, payload.t_max)
+            cached = answer_cache.lookup(scope, version, qv)
+            if cached:
+                docs, answer = cached
+            else:
+                docs = await semantic_search(
+                    payload.query, k=payload.k, video_id=payload.video_id, t_min=payload.t_min, t_max=payload.t_max,
+                    deadline=deadline, query_embedding=qv,
+                )
+            results = [
+                Segment(
+                    video_id=d.get("video_id"),
+                    t_start=float(d.get("start_time", 0.0)),
+                    t_end=float(d.get("end_time", 0.0)),
+                    title=d.get("title"),
+                    snippet=d.get("snippet") or d.get("text", ""),
+                    score=float(d.get("score", 0.0)),
+                )
+                for d in docs
+            ]
 
-        answer = await generate_answer(payload.query, docs)
-        resp = SearchResponse(results=results, answer=answer)
-        logger.info(f"[{rid}] search returned {len(results)} results")
-        return resp
+            if not cached:
+                answer = await generate_answer(payload.query, docs, deadline)
+                # a degraded answer is not worth replaying to the next asker
+                if not deadline.degradations:
+                    answer_cache.store(scope, version, qv, docs, answer)
+            resp = SearchResponse(results=results, answer=answer, degraded=deadline.degradations)
+            logger.info(f"[{rid}] search returned {len(results)} results cached={bool(cached)} degraded={deadline.degradations}")
+            # replayed by the cache warmer after restarts and re-ingests (time-ranged queries are not)
+            if payload.t_min is None and payload.t_max is None:
+                query_log.record(payload.video_id, payload.query, payload.k)
+            return resp
 
     except Exception as e:
         logger.exception(f"[{rid}] search_timestamps failed")
@@ -61,81 +145,27 @@ async def ingest_video(payload: IngestRequest):
     rid = _rid()
     logger.info(f"[{rid}] ingest_video url={payload.video_url}")
 
-    transcript_method = "unknown"
+    transcript_method = "whisper_downloaded"
     try:
-        # Always use Whisper transcription for public YouTube videos
-        import yt_dlp
-        import tempfile, os, subprocess
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Try bestaudio+bestvideo, fallback to bestaudio if video fails
-            video_path = None
-            yt_dlp_errors = []
-            for ydl_format in [
-                'bestaudio+bestvideo/best',
-                'bestaudio/best',
-                'best'
-            ]:
-                ydl_opts = {
-                    'format': ydl_format,
-                    'outtmpl': os.path.join(tmpdir, '%(id)s.%(ext)s'),
-                    'quiet': True,
-                    'merge_output_format': 'mp4',
-                }
-                try:
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(str(payload.video_url), download=True)
-                        video_path = ydl.prepare_filename(info)
-                    logger.info(f"[{rid}] Downloaded YouTube video to {video_path} with format {ydl_format}")
-                    break
-                except Exception as e:
-                    yt_dlp_errors.append(f"Format {ydl_format}: {e}")
-                    video_path = None
-            if not video_path or not os.path.exists(video_path):
-                logger.error(f"[{rid}] yt-dlp failed for all formats: {yt_dlp_errors}")
-                raise Exception(f"Failed to download video. yt-dlp errors: {yt_dlp_errors}")
-
-            # Check for audio stream using ffprobe before Whisper
-            ffprobe_cmd = [
-                'ffprobe', '-v', 'error', '-select_streams', 'a', '-show_entries', 'stream=index',
-                '-of', 'csv=p=0', video_path
-            ]
-            try:
-                result = subprocess.run(ffprobe_cmd, capture_output=True, text=True, check=True)
-                logger.info(f"[{rid}] ffprobe output: {result.stdout.strip()}")
-                if not result.stdout.strip():
-                    raise Exception("Downloaded video file does not contain an audio stream. Try a different video or check yt-dlp options.")
-            except Exception as ffprobe_error:
-                logger.error(f"[{rid}] ffprobe audio check failed: {ffprobe_error}")
-                raise Exception(f"Audio stream check failed: {ffprobe_error}")
-
-            raw_segments = transcript_service.load_whisper_transcript_from_file(video_path)
-            logger.info(f"[{rid}] Successfully loaded Whisper transcript from downloaded video")
-            transcript_method = "whisper_downloaded"
-
-        # Validate segments
-        if not raw_segments:
-            raise Exception("No transcript content was extracted from the video. The video might be silent, contain only music, or have processing restrictions.")
-
-        # Normalize format
-        if raw_segments and isinstance(raw_segments[0], dict) and "text" in raw_segments[0]:
-            segments = raw_segments
-        else:
-            segments = transcript_service.segment_transcript(raw_segments)
-
-        if not segments:
-            raise Exception("No meaningful content segments were created from the transcript. The video might not contain speech or the content might be too short.")
-
         # Parse video ID
         parsed = urlparse.urlparse(str(payload.video_url))
         qs = urlparse.parse_qs(parsed.query)
         video_id = qs.get("v", [None])[0] or parsed.path.split("/")[-1] or str(payload.video_url)
         title = f"YouTube {video_id} ({transcript_method})"
 
-        # Index in vector store
-        await index_segments(video_id, title, segments, str(payload.video_url), False)
-        logger.info(f"[{rid}] Successfully indexed {len(segments)} segments for {video_id} using {transcript_method}")
-        return IngestResponse(video_id=video_id)
+        # Always use Whisper transcription for public YouTube videos
+        with tempfile.TemporaryDirectory() as tmpdir:
+            async with limiter("download").slot():
+                video_path = await asyncio.to_thread(_download_video, str(payload.video_url), tmpdir, rid)
+            await asyncio.to_thread(_check_audio_stream, video_path, rid)
 
+            # transcribe, embed and index overlapped, chunk by chunk
+            report = await ingest_media(video_id, title, video_path, str(payload.video_url), False)
+        logger.info(f"[{rid}] Successfully indexed {report['segments']} segments for {video_id} using {transcript_method}")
+        return IngestResponse(video_id=video_id, skipped_audio_pct=report["audio"]["skipped_pct"])
+
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         error_msg = str(e)
         logger.exception(f"[{rid}] ingest_video failed with method {transcript_method}")
@@ -158,28 +188,151 @@ async def ingest_video(payload: IngestRequest):
 
 
 @router.get("/history", response_model=HistoryResponse)
-async def get_history():
-    """Get list of all processed videos"""
+async def get_history(
+    response: Response,
+    limit: int = Query(default=settings.HISTORY_PAGE_SIZE, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """
+    Processed videos, newest first, `limit` per page; follow `next_cursor` for the next page.
+    Pages carry an ETag derived from the library version, so an unchanged library answers 304.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        videos_data = await get_video_history()
+        version = await index_version()
+        etag = 'W/"' + hashlib.sha1(f"{version}:{limit}:{cursor or ''}".encode()).hexdigest()[:20] + '"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+
+        videos_data = await get_video_history(limit=limit, after=after)
         videos = [
             VideoInfo(
                 video_id=v["video_id"],
                 title=v["title"],
                 url=v.get("url"),
                 created_at=v.get("created_at"),
+                segmented_at=v.get("segmented_at"),
                 is_local_file=v.get("is_local_file", False)
             )
             for v in videos_data
         ]
-        return HistoryResponse(videos=videos)
+        response.headers.update(headers)
+        next_cursor = encode_cursor(videos_data[-1]) if len(videos_data) == limit else None
+        return HistoryResponse(videos=videos, next_cursor=next_cursor)
     except Exception as e:
         logger.exception("get_history failed")
         raise HTTPException(status_code=500, detail=f"Failed to get history: {e}")
 
 
+@router.post("/resegment", response_model=ResegmentResponse)
+async def resegment(payload: ResegmentRequest):
+    """
+    Rebuild the windows of one video (or all) from the stored sentence-level transcripts with a new
+    window/overlap. Nothing is transcribed again and only windows with new text are embedded.
+    """
+    if payload.overlap >= payload.window:
+        raise HTTPException(status_code=400, detail="overlap must be smaller than window")
+    rid = _rid()
+    logger.info(f"[{rid}] resegment video_id={payload.video_id} window={payload.window} overlap={payload.overlap}")
+    try:
+        video_ids = [payload.video_id] if payload.video_id else [v["video_id"] for v in await get_video_history()]
+        done, skipped = [], []
+        for video_id in video_ids:
+            try:
+                done.append(ResegmentedVideo(**await resegment_video(video_id, payload.window, payload.overlap)))
+            except ValueError as e:
+                if payload.video_id:
+                    raise HTTPException(status_code=400, detail=str(e))
+                skipped.append(video_id)
+        return ResegmentResponse(videos=done, skipped=skipped)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.exception(f"[{rid}] resegment failed")
+        raise HTTPException(status_code=500, detail=f"Re-segmentation failed: {e}")
+
+
+@router.get("/embedding_migration", response_model=EmbeddingMigrationStatus)
+async def embedding_migration_status():
+    """Progress of the background re-embedding after an EMBEDDING_MODEL change."""
+    _, model = await index_state()
+    return EmbeddingMigrationStatus(**migration_progress.report(), serving_model=model)
+
+
+@router.get("/library/export/{table}")
+async def export_library_table(
+    table: str,
+    background_tasks: BackgroundTasks,
+    version: Optional[int] = Query(default=None, ge=0),
+):
+    """
+    Download one table of the library as Parquet: `videos` (metadata and transcripts) or
+    `segments` (windows with float32 embeddings). POST both to /library/import on another node.
+
+    The library version the table was read at is returned in X-Library-Version. Pass it as
+    `version` when downloading the other table; if the library has changed since, the request
+    fails with 409 instead of returning a table that does not match the first.
+    """
+    if table not in LIBRARY_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table!r}; expected videos or segments")
+    rid = _rid()
+    if version is not None and await index_version() != version:
+        raise HTTPException(status_code=409, detail=f"Library is no longer at version {version}; export both tables again")
+    out_dir = tempfile.mkdtemp(prefix="library_export_")
+    try:
+        report = await export_library(out_dir, tables=[table])
+        if version is not None and report["library_version"] != version:
+            raise HTTPException(status_code=409, detail=f"Library is no longer at version {version}; export both tables again")
+    except HTTPException:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        logger.exception(f"[{rid}] library export failed")
+        raise HTTPException(status_code=500, detail=f"Export failed: {e}")
+    logger.info(f"[{rid}] exported {table} at library version {report['library_version']}: "
+                f"{report['videos'] if table == 'videos' else report['segments']} rows")
+    background_tasks.add_task(shutil.rmtree, out_dir, True)
+    return FileResponse(
+        os.path.join(out_dir, LIBRARY_TABLES[table]),
+        media_type="application/vnd.apache.parquet",
+        filename=LIBRARY_TABLES[table],
+        headers={"X-Library-Version": str(report["library_version"])},
+    )
+
+
+@router.post("/library/import", response_model=LibraryImportResponse)
+async def import_library_files(videos: UploadFile = File(...), segments: UploadFile = File(...)):
+    """Load a library exported by /library/export (both tables) into this node's store."""
+    rid = _rid()
+    in_dir = tempfile.mkdtemp(prefix="library_import_")
+    try:
+        for upload, name in ((videos, VIDEOS_FILE), (segments, SEGMENTS_FILE)):
+            with open(os.path.join(in_dir, name), "wb") as f:
+                await asyncio.to_thread(shutil.copyfileobj, upload.file, f, 1 << 20)
+        report = await import_library(in_dir)
+        logger.info(f"[{rid}] imported {report['videos']} videos, {report['segments']} segments")
+        return LibraryImportResponse(**report)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception(f"[{rid}] library import failed")
+        raise HTTPException(status_code=400, detail=f"Import failed: {e}")
+    finally:
+        shutil.rmtree(in_dir, ignore_errors=True)
+
+
 @router.post("/upload_video", response_model=UploadVideoResponse)
-async def upload_video(file: UploadFile = File(...)):
+async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Upload and process a local video file"""
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
@@ -205,22 +358,16 @@ async def upload_video(file: UploadFile = File(...)):
             await f.write(content)
         
         try:
-            # Process with Whisper (since it's a local file)
-            raw_segments = transcript_service.load_whisper_transcript_from_file(permanent_path)
-            
-            # Normalize format
-            if raw_segments and isinstance(raw_segments[0], dict) and "text" in raw_segments[0]:
-                segments = raw_segments
-            else:
-                segments = transcript_service.segment_transcript(raw_segments)
-            
+            # Process with Whisper (since it's a local file), indexing chunks as they are transcribed
             title = f"Local: {file.filename}"
+            report = await ingest_media(video_id, title, permanent_path, safe_filename, True)
+            logger.info(f"[{rid}] indexed {report['segments']} segments for local file {file.filename}")
+            # remux / segment for cheap seeking once the response is out (MEDIA_PLAYBACK)
+            background_tasks.add_task(prepare_playback, video_id, UPLOADS_DIR, safe_filename)
             
-            # Index in vector store with file path for later retrieval
-            await index_segments(video_id, title, segments, safe_filename, True)
-            logger.info(f"[{rid}] indexed {len(segments)} segments for local file {file.filename}")
-            
-            return UploadVideoResponse(video_id=video_id, filename=file.filename)
+            return UploadVideoResponse(
+                video_id=video_id, filename=file.filename, skipped_audio_pct=report["audio"]["skipped_pct"]
+            )
             
         except Exception as e:
             # If processing fails, clean up the saved file
@@ -230,6 +377,8 @@ async def upload_video(file: UploadFile = File(...)):
                 pass
             raise e
                 
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.exception(f"[{rid}] upload_video failed")
         raise HTTPException(status_code=400, detail=f"Failed to process video: {e}")
@@ -246,6 +395,11 @@ async def serve_video(filename: str):
     
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Video file not found")
+
+    # Prefer the fast-start MP4 prepared after ingest, if there is one
+    faststart = faststart_path(UPLOADS_DIR, filename)
+    if os.path.exists(faststart):
+        file_path, filename = faststart, os.path.basename(faststart)
     
     # Get file extension to set proper content type
     ext = os.path.splitext(filename)[1].lower()
@@ -267,3 +421,23 @@ async def serve_video(filename: str):
         media_type=media_type,
         headers={"Accept-Ranges": "bytes"}
     )
+
+
+@router.get("/hls/{video_id}/{name}")
+async def serve_hls(video_id: str, name: str):
+    """Serve the HLS rendition of an uploaded video (index.m3u8 and its .ts segments)"""
+    for part in (video_id, name):
+        if not part or ".." in part or "/" in part or "\\" in part:
+            raise HTTPException(status_code=400, detail="Invalid path")
+    ext = os.path.splitext(name)[1].lower()
+    if ext not in (".m3u8", ".ts"):
+        raise HTTPException(status_code=400, detail="Invalid path")
+
+    file_path = os.path.join(hls_dir(UPLOADS_DIR, video_id), name)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="HLS rendition not found")
+
+    if ext == ".m3u8":
+        return FileResponse(file_path, media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": "no-cache"})
+    # segments never change once written
+    return FileResponse(file_path, media_type="video/mp2t", headers={"Cache-Control": "public, max-age=31536000, immutable"})
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,6 +17,132 @@ class Settings(BaseSettings):
     MONGODB_URI: str = Field(default="mongodb://localhost:27017")
     MONGODB_DB: str = Field(default="lecture_navigator")
     MONGODB_COLLECTION: str = Field(default="segments")
+    BULK_WRITE_CHUNK: int = Field(default=500)
+
+    # In-memory store persistence (used when Mongo is unavailable)
+    SNAPSHOT_DIR: str | None = None
+    SNAPSHOT_INTERVAL_S: float = Field(default=300.0)
+    # Share one memory-mapped index between uvicorn workers through SNAPSHOT_DIR; workers pick up
+    # each other's upserts and new generations every SHARED_INDEX_POLL_S
+    SHARED_INDEX: bool = False
+    SHARED_INDEX_POLL_S: float = Field(default=1.0)
+
+    # In-memory embedding storage: "float32", "float16" or "int8" (per-row scaled).
+    # With lossy storage the top RESCORE_CANDIDATES are re-scored against exact float32 vectors.
+    EMBEDDING_STORAGE: str = Field(default="float32")
+    EMBEDDING_RESCORE: bool = True
+    RESCORE_CANDIDATES: int = Field(default=50)
+
+    # In-memory first-pass dimensionality reduction (0 = off): once the library has
+    # PROJECTION_MIN_ROWS segments, a PCA fit on up to PROJECTION_SAMPLE stored vectors reduces every
+    # row to PROJECTION_DIM dims for the scan, and the top RESCORE_CANDIDATES are re-scored on the
+    # full vectors. Refit in the background when the library grows PROJECTION_REFIT_GROWTH-fold.
+    PROJECTION_DIM: int = Field(default=0)
+    PROJECTION_MIN_ROWS: int = Field(default=5000)
+    PROJECTION_SAMPLE: int = Field(default=20000)
+    PROJECTION_REFIT_GROWTH: float = Field(default=2.0)
+
+    # In-memory index partitioning: videos are hashed into SEARCH_SHARDS shards (0 = one per CPU);
+    # library-wide queries over at least SEARCH_PARALLEL_MIN_ROWS rows fan out to SEARCH_WORKERS threads
+    SEARCH_SHARDS: int = Field(default=0)
+    SEARCH_WORKERS: int = Field(default=0)
+    SEARCH_PARALLEL_MIN_ROWS: int = Field(default=50000)
+
+    # Merge hits on overlapping windows into one time span while selecting the top-k, so results
+    # cover k distinct moments; both stores fetch k * COLLAPSE_OVERFETCH hits to merge and keep
+    # doubling that until k distinct spans are complete or the candidates run out
+    SEARCH_COLLAPSE_OVERLAPS: bool = True
+    COLLAPSE_OVERFETCH: int = Field(default=3)
+
+    # Library-wide search first picks this many videos by centroid similarity, then searches
+    # their segments only (0 = always scan every segment)
+    ROUTING_TOP_VIDEOS: int = Field(default=0)
+
+    # Optional cross-encoder re-ranking (e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"): the top
+    # RERANK_CANDIDATES vector hits are re-scored in one batched CPU call, as many as the measured
+    # per-pair cost lets fit in RERANK_BUDGET_MS (and the request deadline); scores are cached
+    RERANK_MODEL: str | None = None
+    RERANK_CANDIDATES: int = Field(default=20)
+    RERANK_BUDGET_MS: float = Field(default=150.0)
+    RERANK_CACHE_SIZE: int = Field(default=20000)
+
+    # Latency budget (ms) for /search_timestamps; requests may tighten it with `deadline_ms` or the
+    # X-Deadline-Ms header. Stages degrade when less than their minimum remains.
+    SEARCH_DEADLINE_MS: float | None = None
+    DEADLINE_MIN_LLM_MS: float = Field(default=1500.0)
+    DEADLINE_MIN_FUSION_MS: float = Field(default=100.0)
+    DEADLINE_MIN_COLLAPSE_MS: float = Field(default=50.0)
+
+    # Admission control for heavy work: concurrent slots per resource class, then a bounded
+    # queue; a full queue answers 429 and a queue wait over the timeout 503, both with Retry-After
+    DOWNLOAD_CONCURRENCY: int = Field(default=2)
+    TRANSCRIBE_CONCURRENCY: int = Field(default=1)
+    EMBED_CONCURRENCY: int = Field(default=2)
+    TRANSCODE_CONCURRENCY: int = Field(default=1)
+    ADMISSION_QUEUE_SIZE: int = Field(default=4)
+    ADMISSION_QUEUE_TIMEOUT_S: float = Field(default=600.0)
+    ADMISSION_RETRY_AFTER_S: int = Field(default=30)
+
+    # Pipelined ingest: Whisper transcribes INGEST_AUDIO_CHUNK_S of audio at a time; windows are
+    # embedded INGEST_EMBED_BATCH at a time and written in chunks, with at most INGEST_QUEUE_SIZE
+    # batches waiting between stages
+    INGEST_AUDIO_CHUNK_S: float = Field(default=300.0)
+    INGEST_EMBED_BATCH: int = Field(default=64)
+    INGEST_QUEUE_SIZE: int = Field(default=4)
+
+    # Speech-to-text: TRANSCRIBE_BACKEND is "openai-whisper", "faster-whisper" (CTranslate2, int8 by
+    # default) or "auto" (faster-whisper when installed). Unless WHISPER_MODEL pins one, each file gets
+    # the largest of WHISPER_MODELS expected to transcribe its speech within TRANSCRIBE_CPU_BUDGET_S,
+    # using per-backend real-time factors (measured ones once available).
+    TRANSCRIBE_BACKEND: str = Field(default="auto")
+    WHISPER_MODELS: List[str] = Field(default=["tiny", "base", "small"])
+    WHISPER_MODEL: str | None = None
+    TRANSCRIBE_CPU_BUDGET_S: float = Field(default=900.0)
+    TRANSCRIBE_CPU_THREADS: int = Field(default=0)
+    FASTER_WHISPER_COMPUTE_TYPE: str = Field(default="int8")
+
+    # Silence skipping before Whisper: frames louder than the recording's noise floor by
+    # VAD_MARGIN_DB are speech; pauses under VAD_MIN_SILENCE_S are kept, regions padded by VAD_PAD_S
+    VAD_ENABLED: bool = True
+    VAD_MARGIN_DB: float = Field(default=12.0)
+    VAD_MIN_SILENCE_S: float = Field(default=1.0)
+    VAD_PAD_S: float = Field(default=0.3)
+
+    # Post-ingest playback preparation of uploads (needs ffmpeg): "faststart" remuxes to an MP4 with
+    # the index up front, "hls" re-encodes to HLS_SEGMENT_S chunks with keyframes at segment starts
+    MEDIA_PLAYBACK: str = Field(default="none")
+    HLS_SEGMENT_S: float = Field(default=6.0)
+
+    # Default page size of /history (keyset-paginated, newest first)
+    HISTORY_PAGE_SIZE: int = Field(default=100)
+
+    # Semantic answer cache: a question whose embedding is within ANSWER_CACHE_THRESHOLD cosine of
+    # a cached one (same video, k, time range and index version) reuses its segments and answer
+    ANSWER_CACHE_SIZE: int = Field(default=1024)
+    ANSWER_CACHE_THRESHOLD: float = Field(default=0.95)
+
+    # Query vectors cached per (model, query), so repeated questions skip the embedder
+    QUERY_EMBED_CACHE_SIZE: int = Field(default=1024)
+
+    # Query log: up to QUERY_LOG_SIZE anonymized queries per video (QUERY_LOG_VIDEOS videos) with
+    # how often each was asked, saved to SNAPSHOT_DIR. After startup and after a video is indexed,
+    # its QUERY_WARM_TOP most frequent queries are replayed to refill the caches, only once no live
+    # search has run for QUERY_WARM_IDLE_S and QUERY_WARM_PAUSE_S apart (QUERY_WARM_TOP=0 disables).
+    # Replays warm the query-embedding and re-rank caches; QUERY_WARM_ANSWERS also generates answers
+    # for the answer cache, one LLM call each, at most QUERY_WARM_ANSWER_MAX per warming pass
+    QUERY_LOG_SIZE: int = Field(default=200)
+    QUERY_LOG_VIDEOS: int = Field(default=1000)
+    QUERY_WARM_TOP: int = Field(default=5)
+    QUERY_WARM_IDLE_S: float = Field(default=2.0)
+    QUERY_WARM_PAUSE_S: float = Field(default=0.5)
+    QUERY_WARM_ANSWERS: bool = False
+    QUERY_WARM_ANSWER_MAX: int = Field(default=20)
+
+    # Startup preloads, run in the background after the app starts; /ready answers 200 once done.
+    # PRELOAD_WHISPER_MODEL names a Whisper model ("tiny", "base", "small"), unset to skip.
+    PRELOAD_INDEX: bool = True
+    PRELOAD_EMBEDDING_MODEL: bool = True
+    PRELOAD_WHISPER_MODEL: str | None = None
 
     # API Keys
     OPENAI_API_KEY: str | None = None
@@ -24,6 +150,19 @@ class Settings(BaseSettings):
 
     # Models
     EMBEDDING_MODEL: str = Field(default="sentence-transformers/all-MiniLM-L6-v2")
+
+    # When EMBEDDING_MODEL differs from the model the library was embedded with, re-embed it in the
+    # background (MIGRATION_BATCH texts per embed call, pausing MIGRATION_PAUSE_S between calls)
+    # while searches keep using the old model, then switch over at once. Old Mongo documents are
+    # deleted MIGRATION_GC_GRACE_S after the switch. A switch that keeps losing to concurrent writes
+    # with nothing left to re-embed backs off and gives up after MIGRATION_COMMIT_RETRIES attempts.
+    MIGRATE_EMBEDDINGS: bool = True
+    MIGRATION_BATCH: int = Field(default=256)
+    MIGRATION_PAUSE_S: float = Field(default=0.05)
+    MIGRATION_GC_GRACE_S: float = Field(default=60.0)
+    MIGRATION_COMMIT_RETRIES: int = Field(default=20)
+    # Atlas vector index per embedding model (see scripts/atlas_index.py); others use "vector_index"
+    VECTOR_INDEX_NAMES: Dict[str, str] = Field(default_factory=dict)
     LLM_MODEL: str = Field(default="gpt-4o-mini")
 
     # pydantic-settings v2 config
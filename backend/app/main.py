@@ -1,11 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
+import asyncio
 import time
 
 from .api.routes import router as api_router
 from .config import settings
+from .services.db import close_store
 from .services.metrics import inc_counter, observe_histogram, snapshot
+from .services.migration import run_migration
+from .services.query_log import load_query_log, save_query_log, stop_warming
+from .services.warmup import readiness, warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # logged queries are replayed once the preloads are done
+    load_query_log()
+    # preload models and the index in the background so the server accepts /health right away
+    warmup = asyncio.create_task(warm_up())
+    # re-embed the library in the background if EMBEDDING_MODEL changed
+    migration = asyncio.create_task(run_migration()) if settings.MIGRATE_EMBEDDINGS else None
+    yield
+    warmup.cancel()
+    stop_warming()
+    if migration is not None:
+        migration.cancel()
+    save_query_log()
+    # flush the in-memory store snapshot (no-op for Mongo)
+    await close_store()
 
 
 def create_app() -> FastAPI:
@@ -16,6 +41,7 @@ def create_app() -> FastAPI:
         openapi_url="/openapi.json",
         docs_url="/docs",
         redoc_url="/redoc",
+        lifespan=lifespan,
     )
 
     # CORS middleware
@@ -47,6 +73,11 @@ def create_app() -> FastAPI:
     async def health():
         return {"status": "ok"}
 
+    # Readiness endpoint: 503 until the startup preloads have finished
+    @app.get("/ready")
+    async def ready():
+        return JSONResponse(readiness.report(), status_code=200 if readiness.done else 503)
+
     # Metrics endpoint
     @app.get("/metrics")
     async def metrics():
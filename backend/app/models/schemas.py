@@ -1,4 +1,4 @@
-from pydantic import BaseModel, AnyUrl, Field
+from pydantic import BaseModel, AnyUrl, Field, model_validator
 from typing import List, Optional
 
 
@@ -14,11 +14,21 @@ class SearchRequest(BaseModel):
     query: str
     k: int = 3
     video_id: Optional[str] = None
+    t_min: Optional[float] = Field(default=None, ge=0, description="Only segments ending at or after this time (seconds)")
+    t_max: Optional[float] = Field(default=None, ge=0, description="Only segments starting at or before this time (seconds)")
+    deadline_ms: Optional[float] = Field(default=None, gt=0, description="Latency budget; slow stages degrade to meet it")
+
+    @model_validator(mode="after")
+    def _check_time_range(self) -> "SearchRequest":
+        if self.t_min is not None and self.t_max is not None and self.t_min > self.t_max:
+            raise ValueError(f"t_min ({self.t_min}) must not be greater than t_max ({self.t_max})")
+        return self
 
 
 class SearchResponse(BaseModel):
     results: List[Segment]
     answer: str
+    degraded: List[str] = Field(default_factory=list, description="Shortcuts taken to meet the deadline")
 
 
 class IngestRequest(BaseModel):
@@ -27,6 +37,7 @@ class IngestRequest(BaseModel):
 
 class IngestResponse(BaseModel):
     video_id: str
+    skipped_audio_pct: Optional[float] = Field(default=None, description="Share of the audio skipped as silence")
 
 
 class VideoInfo(BaseModel):
@@ -34,11 +45,52 @@ class VideoInfo(BaseModel):
     title: str
     url: Optional[str] = None
     created_at: Optional[str] = None
+    segmented_at: Optional[str] = None
     is_local_file: bool = False
 
 
 class HistoryResponse(BaseModel):
     videos: List[VideoInfo]
+    next_cursor: Optional[str] = Field(default=None, description="Pass as `cursor` to fetch the next page")
+
+
+class ResegmentRequest(BaseModel):
+    video_id: Optional[str] = Field(default=None, description="Video to re-segment; every video when omitted")
+    window: float = Field(default=30.0, gt=0, description="Window length in seconds")
+    overlap: float = Field(default=15.0, ge=0, description="Overlap of consecutive windows in seconds")
+
+
+class ResegmentedVideo(BaseModel):
+    video_id: str
+    segments: int
+    embedded: int = Field(description="Windows that were new and had to be embedded")
+    reused: int = Field(description="Windows whose stored vectors were reused")
+
+
+class ResegmentResponse(BaseModel):
+    videos: List[ResegmentedVideo]
+    skipped: List[str] = Field(default_factory=list, description="Videos without a stored transcript")
+
+
+class EmbeddingMigrationStatus(BaseModel):
+    state: str = Field(description="idle, running, done or failed")
+    source_model: Optional[str] = None
+    target_model: Optional[str] = None
+    segments_total: int = 0
+    segments_done: int = 0
+    videos_done: int = 0
+    progress: float = Field(default=0.0, description="Share of the library re-embedded so far")
+    segments_per_s: float = 0.0
+    elapsed_s: float = 0.0
+    started_at: Optional[str] = None
+    error: Optional[str] = None
+    serving_model: str = Field(description="Model whose vectors searches currently use")
+
+
+class LibraryImportResponse(BaseModel):
+    videos: int
+    segments: int
+    embedding_model: str
 
 
 class UploadVideoRequest(BaseModel):
@@ -48,6 +100,7 @@ class UploadVideoRequest(BaseModel):
 class UploadVideoResponse(BaseModel):
     video_id: str
     filename: str
+    skipped_audio_pct: Optional[float] = Field(default=None, description="Share of the audio skipped as silence")
 
 
 
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+import asyncio
+import time
+
+from ..config import settings
+from .metrics import inc_counter, observe_histogram, set_gauge
+
+
+class Overloaded(Exception):
+    """Raised when a resource class cannot admit more work; maps to 429/503 + Retry-After."""
+
+    def __init__(self, resource: str, status_code: int, retry_after_s: int) -> None:
+        super().__init__(f"{resource} is at capacity, retry in {retry_after_s}s")
+        self.resource = resource
+        self.status_code = status_code
+        self.retry_after_s = retry_after_s
+
+
+class ResourceLimiter:
+    """
+    At most `concurrency` holders of a resource class, plus a bounded queue of waiters.
+    A full queue rejects immediately (429); a waiter that cannot start within
+    `queue_timeout_s` gives up (503).
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout_s: float, retry_after_s: int) -> None:
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout_s = queue_timeout_s
+        self.retry_after_s = retry_after_s
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._waiting = 0
+        self._active = 0
+
+    def _publish(self) -> None:
+        set_gauge(f"admission_active:{self.name}", self._active)
+        set_gauge(f"admission_queued:{self.name}", self._waiting)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._sem.locked() and self._waiting >= self.queue_size:
+            inc_counter(f"admission_rejected:{self.name}")
+            raise Overloaded(self.name, 429, self.retry_after_s)
+        self._waiting += 1
+        self._publish()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            inc_counter(f"admission_timeout:{self.name}")
+            raise Overloaded(self.name, 503, self.retry_after_s)
+        finally:
+            self._waiting -= 1
+            observe_histogram(f"admission_queue_wait_ms:{self.name}", (time.perf_counter() - start) * 1000)
+        self._active += 1
+        self._publish()
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._sem.release()
+            self._publish()
+
+
+_limiters: Dict[str, ResourceLimiter] = {}
+
+
+def limiter(resource: str) -> ResourceLimiter:
+    """Process-wide limiter for a resource class: "download", "transcribe", "embed" or "transcode"."""
+    if resource not in _limiters:
+        concurrency = {
+            "download": settings.DOWNLOAD_CONCURRENCY,
+            "transcribe": settings.TRANSCRIBE_CONCURRENCY,
+            "embed": settings.EMBED_CONCURRENCY,
+            "transcode": settings.TRANSCODE_CONCURRENCY,
+        }[resource]
+        _limiters[resource] = ResourceLimiter(
+            resource,
+            concurrency,
+            settings.ADMISSION_QUEUE_SIZE,
+            settings.ADMISSION_QUEUE_TIMEOUT_S,
+            settings.ADMISSION_RETRY_AFTER_S,
+        )
+    return _limiters[resource]
@@ -1,26 +1,36 @@
 from __future__ import annotations
 
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple
+from functools import lru_cache
 from loguru import logger
-
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableConfig
+import asyncio
 
 from ..config import settings  # ✅ import your .env settings
+from .deadline import Deadline
 
-# Try import provider-specific LLM wrapper (OpenAI)
-try:
-    from langchain_openai import ChatOpenAI
-except Exception:  # pragma: no cover
-    ChatOpenAI = None  # type: ignore
-
-
-PROMPT = ChatPromptTemplate.from_messages([
+# langchain is only imported once an LLM answer is actually requested
+PROMPT_MESSAGES = [
     ("system", "You are a concise teaching assistant. Answer in ONE clear sentence. "
                "Use only the provided context snippets. Always append the most relevant timestamp(s) as citation(s) "
                "in the format [STARTs-ENDs]. If unsure, say you couldn't find a relevant timestamp."),
     ("human", "Question: {question}\n\nContext:\n{context}")
-])
+]
+
+
+@lru_cache(maxsize=1)
+def _llm_classes() -> Optional[Tuple[Any, Any, Any]]:
+    """(ChatPromptTemplate, RunnableConfig, ChatOpenAI), or None when langchain_openai is missing."""
+    try:
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.runnables import RunnableConfig
+        from langchain_openai import ChatOpenAI
+    except Exception:  # pragma: no cover
+        return None
+    return ChatPromptTemplate, RunnableConfig, ChatOpenAI
+
+
+def llm_enabled() -> bool:
+    return bool(settings.OPENAI_API_KEY) and settings.LLM_MODEL.lower() != "none"
 
 
 def build_context(results: List[Dict]) -> str:
@@ -38,10 +48,21 @@ def build_context(results: List[Dict]) -> str:
     return "\n".join(lines)
 
 
-async def generate_answer(question: str, results: List[Dict]) -> str:
+def snippet_answer(results: List[Dict]) -> str:
+    """Extractive answer: first sentence of the best segment plus its timestamp."""
+    snippet = results[0].get("text", "")
+    first_sent = snippet.split(". ")[0].strip()[:200]
+    ts = results[0].get("start_time")
+    ts_str = f" [{int(ts)}s]" if ts is not None else ""
+    return f"{first_sent}{ts_str}"
+
+
+async def generate_answer(question: str, results: List[Dict], deadline: Optional[Deadline] = None) -> str:
     """
     Generate a concise one-sentence answer from `results` as context.
     Uses OpenAI if API key is configured, else falls back to snippet-based answer.
+    With a `deadline`, the LLM is skipped when less than DEADLINE_MIN_LLM_MS remain and
+    is cut off (snippet answer) when the budget runs out.
     """
     if not results:
         return "I couldn't find a relevant timestamp in the provided lectures."
@@ -49,14 +70,16 @@ async def generate_answer(question: str, results: List[Dict]) -> str:
     context = build_context(results)
 
     # Fallback if no OpenAI key is configured
-    if not settings.OPENAI_API_KEY or ChatOpenAI is None or settings.LLM_MODEL.lower() == "none":
-        snippet = results[0].get("text", "")
-        first_sent = snippet.split(". ")[0].strip()[:200]
-        ts = results[0].get("start_time")
-        ts_str = f" [{int(ts)}s]" if ts is not None else ""
+    classes = _llm_classes() if llm_enabled() else None
+    if classes is None:
         logger.info("⚠️ Falling back to snippet answer (no LLM configured).")
-        return f"{first_sent}{ts_str}"
+        return snippet_answer(results)
+
+    if deadline is not None and not deadline.has(settings.DEADLINE_MIN_LLM_MS):
+        deadline.degrade("extractive_answer")
+        return snippet_answer(results)
 
+    ChatPromptTemplate, RunnableConfig, ChatOpenAI = classes
     try:
         # ✅ Pass API key + model from settings
         llm = ChatOpenAI(
@@ -64,13 +87,15 @@ async def generate_answer(question: str, results: List[Dict]) -> str:
             temperature=0.2,
             api_key=settings.OPENAI_API_KEY,
         )
-        chain = PROMPT | llm
+        chain = ChatPromptTemplate.from_messages(PROMPT_MESSAGES) | llm
 
         if hasattr(chain, "ainvoke"):
-            out = await chain.ainvoke(
+            call = chain.ainvoke(
                 {"question": question, "context": context},
                 config=RunnableConfig(max_concurrency=1),
             )
+            remaining = deadline.remaining_ms() if deadline is not None else None
+            out = await (asyncio.wait_for(call, remaining / 1000.0) if remaining is not None else call)
         else:
             out = chain.invoke(
                 {"question": question, "context": context},
@@ -81,11 +106,13 @@ async def generate_answer(question: str, results: List[Dict]) -> str:
         logger.info("✅ Answer generated using OpenAI LLM.")
         return content.strip()
 
+    except asyncio.TimeoutError:
+        logger.warning("⏱️ LLM call exceeded the request deadline, using fallback snippet.")
+        if deadline is not None:
+            deadline.degrade("llm_timeout")
+        return snippet_answer(results)
+
     except Exception as e:
         logger.warning(f"❌ LLM call failed, using fallback snippet. error={e}")
-        snippet = results[0].get("text", "")
-        first_sent = snippet.split(". ")[0].strip()[:200]
-        ts = results[0].get("start_time")
-        ts_str = f" [{int(ts)}s]" if ts is not None else ""
-        return f"{first_sent}{ts_str}"
+        return snippet_answer(results)
 
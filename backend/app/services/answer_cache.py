@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .metrics import inc_counter, set_gauge
+
+
+class _Scope:
+    """Cached questions for one (video, k, time range) at one index version."""
+
+    def __init__(self, version: int, dim: int) -> None:
+        self.version = version
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.entries: List[Tuple[List[Dict[str, Any]], str]] = []
+
+
+class SemanticAnswerCache:
+    """
+    Reuses the segments and answer of an earlier question when a new query embedding lies within
+    `threshold` cosine similarity of it. Entries are grouped by scope, and a scope is dropped as
+    soon as the index version moves, so a re-ingest never serves stale segments. Each scope keeps
+    its query vectors as one normalized matrix; a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, max_entries: int, threshold: float) -> None:
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._scopes: "OrderedDict[Hashable, _Scope]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def _publish(self) -> None:
+        set_gauge("answer_cache_entries", self._size)
+        total = self.hits + self.misses
+        set_gauge("answer_cache_hit_rate", self.hits / total if total else 0.0)
+
+    def _drop(self, key: Hashable) -> None:
+        scope = self._scopes.pop(key, None)
+        if scope is not None:
+            self._size -= len(scope.entries)
+
+    def lookup(
+        self, key: Hashable, version: int, vector: List[float], count: bool = True
+    ) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        """(results, answer) of the closest cached question in scope, or None. Background lookups
+        pass count=False to stay out of the hit rate."""
+        if self.max_entries <= 0:
+            return None
+        scope = self._scopes.get(key)
+        if scope is not None and scope.version != version:
+            self._drop(key)
+            scope = None
+        hit = None
+        if scope is not None and scope.entries:
+            q = self._normalize(vector)
+            if q.shape[0] == scope.vectors.shape[1]:
+                sims = scope.vectors @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    hit = scope.entries[best]
+                    self._scopes.move_to_end(key)
+        if count and hit is None:
+            self.misses += 1
+            inc_counter("answer_cache_miss")
+        elif count:
+            self.hits += 1
+            inc_counter("answer_cache_hit")
+        self._publish()
+        if hit is None:
+            return None
+        results, answer = hit
+        return [dict(d) for d in results], answer
+
+    def store(self, key: Hashable, version: int, vector: List[float], results: List[Dict[str, Any]], answer: str) -> None:
+        if self.max_entries <= 0:
+            return
+        q = self._normalize(vector)
+        scope = self._scopes.get(key)
+        if scope is None or scope.version != version or scope.vectors.shape[1] != q.shape[0]:
+            self._drop(key)
+            scope = self._scopes[key] = _Scope(version, q.shape[0])
+        self._scopes.move_to_end(key)
+        scope.vectors = np.vstack([scope.vectors, q[None, :]])
+        scope.entries.append(([dict(d) for d in results], answer))
+        self._size += 1
+        # evict the oldest questions of the least recently used scopes
+        while self._size > self.max_entries and self._scopes:
+            old_key, old = next(iter(self._scopes.items()))
+            old.vectors = old.vectors[1:]
+            old.entries.pop(0)
+            self._size -= 1
+            if not old.entries:
+                self._scopes.pop(old_key)
+        self._publish()
+
+    def clear(self) -> None:
+        self._scopes.clear()
+        self._size = 0
+        self._publish()
+
+
+answer_cache = SemanticAnswerCache(settings.ANSWER_CACHE_SIZE, settings.ANSWER_CACHE_THRESHOLD)
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+import importlib.util
+import os
+import threading
+
+import numpy as np
+from loguru import logger
+
+from ..config import settings
+from .metrics import set_gauge
+
+# Pluggable speech-to-text backends for Whisper checkpoints. Every backend transcribes 16 kHz mono
+# float32 audio and returns raw (start, end, text) segments; transcript.WhisperSource does the VAD,
+# chunking and timestamp mapping around it.
+#
+#   openai-whisper: the reference PyTorch implementation, float32 on CPU
+#   faster-whisper: CTranslate2 with int8 weights (FASTER_WHISPER_COMPUTE_TYPE), several times faster on CPU
+
+SAMPLE_RATE = 16000
+RawSegments = List[Tuple[float, float, str]]
+
+
+class TranscriptionBackend(ABC):
+    name = ""
+    module = ""
+    # CPU seconds per second of audio, per model, until this process has measured its own
+    PRIOR_RTF: Dict[str, float] = {}
+
+    def available(self) -> bool:
+        return importlib.util.find_spec(self.module) is not None
+
+    @abstractmethod
+    def load_model(self, model_name: str) -> Any:
+        ...
+
+    @abstractmethod
+    def load_audio(self, path: str) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def transcribe(self, model: Any, audio: np.ndarray) -> RawSegments:
+        ...
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    name = "openai-whisper"
+    module = "whisper"
+    PRIOR_RTF = {"tiny": 0.1, "base": 0.2, "small": 0.6, "medium": 1.8, "large": 3.5}
+
+    def load_model(self, model_name: str) -> Any:
+        import whisper
+
+        return whisper.load_model(model_name)
+
+    def load_audio(self, path: str) -> np.ndarray:
+        import whisper
+
+        return whisper.load_audio(path)
+
+    def transcribe(self, model: Any, audio: np.ndarray) -> RawSegments:
+        result = model.transcribe(audio)
+        return [(float(s["start"]), float(s["end"]), s["text"]) for s in result.get("segments") or []]
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    name = "faster-whisper"
+    module = "faster_whisper"
+    PRIOR_RTF = {"tiny": 0.03, "base": 0.06, "small": 0.18, "medium": 0.5, "large": 1.0}
+
+    def load_model(self, model_name: str) -> Any:
+        from faster_whisper import WhisperModel
+
+        return WhisperModel(
+            model_name,
+            device="cpu",
+            compute_type=settings.FASTER_WHISPER_COMPUTE_TYPE,
+            cpu_threads=settings.TRANSCRIBE_CPU_THREADS or os.cpu_count() or 1,
+        )
+
+    def load_audio(self, path: str) -> np.ndarray:
+        from faster_whisper import decode_audio
+
+        return decode_audio(path, sampling_rate=SAMPLE_RATE)
+
+    def transcribe(self, model: Any, audio: np.ndarray) -> RawSegments:
+        # greedy decoding like openai-whisper's transcribe(); silence is already cut out upstream
+        segments, _ = model.transcribe(audio, beam_size=1, vad_filter=False)
+        return [(float(s.start), float(s.end), s.text) for s in segments]
+
+
+BACKENDS: Dict[str, TranscriptionBackend] = {
+    b.name: b for b in (OpenAIWhisperBackend(), FasterWhisperBackend())
+}
+
+
+def get_backend(name: Optional[str] = None) -> TranscriptionBackend:
+    """The TRANSCRIBE_BACKEND backend; "auto" prefers faster-whisper when it is installed."""
+    name = (name or settings.TRANSCRIBE_BACKEND or "auto").lower()
+    if name == "auto":
+        fast = BACKENDS["faster-whisper"]
+        return fast if fast.available() else BACKENDS["openai-whisper"]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name!r}; expected one of {sorted(BACKENDS)} or 'auto'")
+    return BACKENDS[name]
+
+
+_models: Dict[Tuple[str, str], Any] = {}
+_models_lock = threading.Lock()
+
+
+def load_model(backend: TranscriptionBackend, model_name: str) -> Any:
+    """Load a model once per process and backend, and reuse it across transcriptions."""
+    with _models_lock:
+        key = (backend.name, model_name)
+        if key not in _models:
+            logger.info(f"Loading Whisper model {model_name} with {backend.name}")
+            _models[key] = backend.load_model(model_name)
+        return _models[key]
+
+
+# measured real-time factors, (backend, model) -> moving average
+_observed_rtf: Dict[Tuple[str, str], float] = {}
+
+
+def record_rtf(backend: TranscriptionBackend, model_name: str, audio_s: float, seconds: float) -> None:
+    if audio_s <= 0:
+        return
+    rtf = seconds / audio_s
+    key = (backend.name, model_name)
+    prev = _observed_rtf.get(key)
+    _observed_rtf[key] = rtf if prev is None else 0.8 * prev + 0.2 * rtf
+    set_gauge(f"transcribe_rtf:{backend.name}:{model_name}", _observed_rtf[key])
+
+
+def expected_rtf(backend: TranscriptionBackend, model_name: str) -> float:
+    return _observed_rtf.get((backend.name, model_name), backend.PRIOR_RTF.get(model_name, 1.0))
+
+
+def choose_model(backend: TranscriptionBackend, speech_s: float, budget_s: Optional[float] = None) -> str:
+    """
+    WHISPER_MODEL if set, else the largest of WHISPER_MODELS (smallest first) expected to transcribe
+    `speech_s` seconds of audio within `budget_s` (TRANSCRIBE_CPU_BUDGET_S) on this backend; the
+    smallest one when none fits.
+    """
+    if settings.WHISPER_MODEL:
+        return settings.WHISPER_MODEL
+    budget_s = settings.TRANSCRIBE_CPU_BUDGET_S if budget_s is None else budget_s
+    models = list(settings.WHISPER_MODELS) or ["base"]
+    picked = models[0]
+    for name in models:
+        if expected_rtf(backend, name) * speech_s <= budget_s:
+            picked = name
+    return picked
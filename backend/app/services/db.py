@@ -1,143 +1,1821 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import asyncio
+import base64
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+from uuid import uuid4
+import numpy as np
 from loguru import logger
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING
+from pymongo import ASCENDING, DESCENDING, InsertOne, ReturnDocument, UpdateMany
 from datetime import datetime
 
 from ..config import settings
+from .deadline import Deadline
+from .metrics import set_gauge
+from .snapshot import SnapshotManager, decode_array, encode_array
+
+
+SNIPPET_CHARS = 300
+# fields returned for the library listing (/history)
+VIDEO_FIELDS = ("video_id", "title", "url", "created_at", "segmented_at", "is_local_file")
+# v_to of a segment document that has not been retired yet
+LIVE_VERSION = 2 ** 62
+# v_from of a document written by an ingest that has not committed; above every library version
+STAGED_VERSION = LIVE_VERSION
+# ingest_id prefix of documents staged by an embedding migration
+MIGRATION_PREFIX = "migrate:"
+
+
+class EmbeddingSpaceChanged(Exception):
+    """An ingest's vectors were computed with a model the library has since migrated away from."""
+
+
+def encode_cursor(video: Dict[str, Any]) -> str:
+    """Opaque keyset cursor positioned after `video` in newest-first library order."""
+    key = [video.get("created_at") or "", video["video_id"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, video_id) of a cursor from encode_cursor; ValueError if it is malformed."""
+    try:
+        created_at, video_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    return str(created_at), str(video_id)
+
+
+def encode_sentences(sentences: Iterable[tuple]) -> str:
+    """Compact form of a sentence-level transcript: zlib-compressed JSON with times in ms, base64."""
+    starts, ends, texts = [], [], []
+    for start, end, text in sentences:
+        starts.append(round(float(start) * 1000))
+        ends.append(round(float(end) * 1000))
+        texts.append(text)
+    raw = json.dumps({"s": starts, "e": ends, "x": texts}, separators=(",", ":")).encode("utf-8")
+    return base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+
+
+def decode_sentences(blob: str) -> List[tuple]:
+    data = json.loads(zlib.decompress(base64.b64decode(blob)))
+    return [(s / 1000.0, e / 1000.0, t) for s, e, t in zip(data["s"], data["e"], data["x"])]
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def segment_key(segment: Dict[str, Any]) -> str:
+    """Stable identity of a segment within its video: (start, end, text hash)."""
+    return f"{float(segment.get('start_time', 0.0)):.3f}-{float(segment.get('end_time', 0.0)):.3f}-{text_hash(segment.get('text', ''))}"
+
+
+def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def collapse_overlaps(hits: Iterable[tuple], k: int) -> tuple[List[list], bool]:
+    """
+    Fold best-first hits `(score, ref, video_id, start, end)` into at most k distinct time spans.
+
+    A hit overlapping the window of a span's best hit (its anchor) widens that span, as long as
+    the widened span stays clear of the other spans; any other hit overlapping a span is absorbed
+    without widening it, so spans cannot chain across a whole lecture. Returns
+    `[score, ref, video_id, start, end, merged, anchor_start, anchor_end]` groups and whether k
+    distinct spans were found.
+    """
+    groups: List[list] = []
+    for score, ref, vid, start, end in hits:
+        hit_groups = [g for g in groups if g[2] == vid and start < g[4] and end > g[3]]
+        if not hit_groups:
+            if len(groups) == k:
+                # every later hit is worse than the k chosen spans
+                return groups, True
+            groups.append([score, ref, vid, start, end, 1, start, end])
+            continue
+        g = hit_groups[0]
+        g[5] += 1
+        if len(hit_groups) == 1 and start < g[7] and end > g[6]:
+            lo, hi = min(g[3], start), max(g[4], end)
+            if not any(o is not g and o[2] == vid and lo < o[4] and hi > o[3] for o in groups):
+                g[3], g[4] = lo, hi
+    return groups, len(groups) >= k
+
+
+def centroid(embeddings: np.ndarray) -> Optional[np.ndarray]:
+    """Normalized mean direction of a video's segment vectors, used as its routing summary."""
+    emb = np.asarray(embeddings, dtype=np.float32)
+    if emb.ndim != 2 or not emb.size:
+        return None
+    norms = np.linalg.norm(emb, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    c = (emb / norms).mean(axis=0)
+    n = float(np.linalg.norm(c))
+    return c / n if n else c
+
+
+def route_videos(video_ids: List[str], centroids: np.ndarray, query: np.ndarray, n: int) -> List[str]:
+    """Coarse stage of library-wide search: the n videos whose centroid is closest to the query."""
+    scores = centroids @ query
+    return [video_ids[i] for i in _top_indices(scores, n)]
+
+
+def quantize(embeddings: np.ndarray, storage: str) -> tuple[np.ndarray, np.ndarray]:
+    """Encode float32 rows as `storage` codes plus a per-row scale (1.0 unless int8)."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = embeddings.shape[0]
+    if storage == "float16":
+        return embeddings.astype(np.float16), np.ones(n, dtype=np.float32)
+    if storage == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0 if embeddings.size else np.zeros(n, dtype=np.float32)
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return embeddings, np.ones(n, dtype=np.float32)
+
+
+class Projection:
+    """
+    Per-library PCA of the stored embeddings, used for first-pass scoring on `dim` dimensions.
+
+    For a row x = mean + r, x·q = mean·q + r·q: the first term is the same for every row, and r·q is
+    approximated on the kept components as P(x - mean)·Pq. Ranking thus only loses the variance
+    outside them, and the top candidates are re-scored against the full vectors anyway.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, version: int, model: str, rows: int) -> None:
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.version = version
+        self.model = model
+        self.rows = rows
+
+    @property
+    def dim(self) -> int:
+        return int(self.components.shape[0])
+
+    @property
+    def input_dim(self) -> int:
+        return int(self.components.shape[1])
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int, version: int, model: str, rows: int) -> "Projection":
+        """Fit on a sample of stored `vectors` (float32 rows) with scikit-learn's randomized PCA."""
+        from sklearn.decomposition import PCA
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = max(1, min(dim, vectors.shape[0], vectors.shape[1]))
+        pca = PCA(n_components=dim, svd_solver="randomized", random_state=0).fit(vectors)
+        return cls(pca.mean_, pca.components_, version, model, rows)
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        return ((np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T).astype(np.float32)
+
+    def query(self, query: np.ndarray) -> tuple:
+        """(projected query, mean·query, |query|) for SegmentTable.reduced_scores()."""
+        return self.components @ query, float(self.mean @ query), float(np.linalg.norm(query))
+
+    def header(self) -> Dict[str, Any]:
+        return {"version": self.version, "model": self.model, "dim": self.dim, "rows": self.rows}
+
+
+class SegmentTable:
+    """
+    Immutable struct-of-arrays segment store.
+
+    Titles are interned per video (`video_ids`/`titles` + a per-row `video_idx`), texts live in one
+    UTF-8 buffer addressed by `text_offsets`, snippets are derived on read, and embeddings are kept as
+    float32, float16 or per-row scaled int8 `codes`. When the codes are lossy, `exact` optionally keeps
+    float32 vectors for re-scoring the top candidates. With a library Projection, `proj` holds each
+    row reduced to the projection's dimensions for the first-pass scan.
+
+    Each video's rows are contiguous and sorted by start time; `end_cummax` is the running maximum of
+    end times within the video, so a time window is narrowed to a row range by binary search.
+    """
+
+    ARRAYS = ("video_idx", "start", "end", "end_cummax", "text_offsets", "text_buf", "codes", "scales", "norms", "exact", "proj")
+    OPTIONAL = ("exact", "proj")
+
+    def __init__(
+        self,
+        video_ids: List[str],
+        titles: List[Optional[str]],
+        video_idx: np.ndarray,
+        start: np.ndarray,
+        end: np.ndarray,
+        end_cummax: np.ndarray,
+        text_offsets: np.ndarray,
+        text_buf: np.ndarray,
+        metadata: List[Optional[Dict[str, Any]]],
+        codes: np.ndarray,
+        scales: np.ndarray,
+        norms: np.ndarray,
+        exact: Optional[np.ndarray],
+        storage: str,
+        proj: Optional[np.ndarray] = None,
+    ) -> None:
+        self.video_ids = video_ids
+        self.titles = titles
+        self.video_idx = video_idx
+        self.start = start
+        self.end = end
+        self.end_cummax = end_cummax
+        self.text_offsets = text_offsets
+        self.text_buf = text_buf
+        self.metadata = metadata
+        self.codes = codes
+        self.scales = scales
+        self.norms = norms
+        self.exact = exact
+        self.storage = storage
+        self.proj = proj
+        self._ranges: Optional[Dict[str, tuple]] = None
+
+    def __len__(self) -> int:
+        return int(self.start.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.codes.shape[1]) if self.codes.ndim == 2 else 0
+
+    @classmethod
+    def empty(cls, storage: str = "float32") -> "SegmentTable":
+        return cls.from_segments("", None, [], np.zeros((0, 0), dtype=np.float32), storage, keep_exact=False)
+
+    @classmethod
+    def from_segments(
+        cls,
+        video_id: str,
+        title: Optional[str],
+        segments: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        storage: str,
+        keep_exact: bool,
+        projection: Optional[Projection] = None,
+    ) -> "SegmentTable":
+        order = sorted(range(len(segments)), key=lambda i: float(segments[i].get("start_time", 0.0)))
+        segments = [segments[i] for i in order]
+        encoded = [(s.get("text") or "").encode("utf-8") for s in segments]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(segments), -1)[order] if segments else np.zeros((0, 0), dtype=np.float32)
+        codes, scales = quantize(embeddings, storage)
+        end = np.array([float(s.get("end_time", 0.0)) for s in segments], dtype=np.float64)
+        return cls(
+            video_ids=[video_id] if segments else [],
+            titles=[title] if segments else [],
+            video_idx=np.zeros(len(segments), dtype=np.int32),
+            start=np.array([float(s.get("start_time", 0.0)) for s in segments], dtype=np.float64),
+            end=end,
+            end_cummax=np.maximum.accumulate(end) if end.size else end,
+            text_offsets=offsets,
+            text_buf=np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(),
+            metadata=[s.get("metadata") or None for s in segments],
+            codes=codes,
+            scales=scales,
+            norms=np.linalg.norm(embeddings, axis=1).astype(np.float32) if embeddings.size else np.zeros(len(segments), dtype=np.float32),
+            exact=embeddings if keep_exact and storage != "float32" else None,
+            storage=storage,
+            proj=(
+                projection.transform(embeddings)
+                if projection is not None and segments and embeddings.shape[1] == projection.input_dim else None
+            ),
+        )
+
+    def with_projection(self, projection: Projection, chunk: int = 65536) -> "SegmentTable":
+        """The same rows with `proj` computed by `projection` (columns shared, not copied)."""
+        if not len(self) or self.dim != projection.input_dim:
+            return self
+        proj = np.concatenate([projection.transform(self.vectors(i, min(i + chunk, len(self))))
+                               for i in range(0, len(self), chunk)])
+        return SegmentTable(
+            video_ids=self.video_ids, titles=self.titles, video_idx=self.video_idx, start=self.start,
+            end=self.end, end_cummax=self.end_cummax, text_offsets=self.text_offsets, text_buf=self.text_buf,
+            metadata=self.metadata, codes=self.codes, scales=self.scales, norms=self.norms, exact=self.exact,
+            storage=self.storage, proj=proj,
+        )
+
+    def text(self, i: int) -> str:
+        return bytes(self.text_buf[self.text_offsets[i]:self.text_offsets[i + 1]]).decode("utf-8")
+
+    def row(self, i: int) -> Dict[str, Any]:
+        i = int(i)
+        text = self.text(i)
+        vi = int(self.video_idx[i])
+        return {
+            "video_id": self.video_ids[vi],
+            "title": self.titles[vi],
+            "start_time": float(self.start[i]),
+            "end_time": float(self.end[i]),
+            "text": text,
+            "snippet": text[:SNIPPET_CHARS],
+            "metadata": self.metadata[i] or {},
+        }
+
+    def vector(self, i: int) -> np.ndarray:
+        """Best available float32 vector of row i (exact if kept, else decoded codes)."""
+        if self.exact is not None:
+            return np.asarray(self.exact[i], dtype=np.float32)
+        return np.asarray(self.codes[i], dtype=np.float32) * self.scales[i]
+
+    def vectors(self, start: int, stop: int) -> np.ndarray:
+        """vector() of rows [start, stop) as one (n, dim) float32 array."""
+        if self.exact is not None:
+            return np.asarray(self.exact[start:stop], dtype=np.float32)
+        return np.asarray(self.codes[start:stop], dtype=np.float32) * np.asarray(self.scales[start:stop], dtype=np.float32)[:, None]
+
+    def take_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """vector() of `rows` as one (n, dim) float32 array."""
+        if self.exact is not None:
+            return np.asarray(self.exact[rows], dtype=np.float32)
+        return np.asarray(self.codes[rows], dtype=np.float32) * np.asarray(self.scales[rows], dtype=np.float32)[:, None]
+
+    def video_range(self, video_id: str) -> Optional[tuple]:
+        """[lo, hi) rows of `video_id` (rows of a video are contiguous)."""
+        if self._ranges is None:
+            bounds = np.concatenate([[0], np.flatnonzero(np.diff(self.video_idx)) + 1, [len(self)]]) if len(self) else []
+            self._ranges = {
+                self.video_ids[int(self.video_idx[lo])]: (int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])
+            }
+        return self._ranges.get(video_id)
+
+    def video_rows(self, video_id: str) -> np.ndarray:
+        rng = self.video_range(video_id)
+        return np.arange(*rng) if rng else np.zeros(0, dtype=np.int64)
+
+    def time_rows(self, video_id: Optional[str], t_min: Optional[float], t_max: Optional[float]) -> np.ndarray:
+        """Rows (of `video_id`, or all) whose [start, end] overlaps [t_min, t_max]."""
+        if video_id is None:
+            mask = np.ones(len(self), dtype=bool)
+            if t_max is not None:
+                mask &= self.start <= t_max
+            if t_min is not None:
+                mask &= self.end >= t_min
+            return np.flatnonzero(mask)
+        rng = self.video_range(video_id)
+        if not rng:
+            return np.zeros(0, dtype=np.int64)
+        lo, hi = rng
+        if t_max is not None:
+            hi = lo + int(np.searchsorted(self.start[lo:hi], t_max, side="right"))
+        if t_min is not None:
+            lo = lo + int(np.searchsorted(self.end_cummax[lo:hi], t_min, side="left"))
+        rows = np.arange(lo, max(lo, hi))
+        return rows[self.end[rows] >= t_min] if t_min is not None else rows
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None, exact: bool = False) -> np.ndarray:
+        """Cosine similarity of `query` against `rows` (all rows if None), from codes or exact vectors."""
+        if exact and self.exact is not None:
+            mat, scales = self.exact, None
+        else:
+            mat, scales = self.codes, (self.scales if self.storage == "int8" else None)
+        norms = self.norms
+        if rows is not None:
+            mat, norms = mat[rows], norms[rows]
+            scales = scales[rows] if scales is not None else None
+        raw = mat.astype(np.float32, copy=False) @ query
+        if scales is not None:
+            raw = raw * scales
+        denom = norms * (np.linalg.norm(query) or 1e-9)
+        denom[denom == 0] = 1e-9
+        return raw / denom
+
+    def reduced_scores(self, reduced: tuple, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """First-pass cosine estimate from `proj`, with `reduced` = Projection.query(query)."""
+        qp, mean_q, qnorm = reduced
+        mat, norms = (self.proj, self.norms) if rows is None else (self.proj[rows], self.norms[rows])
+        denom = norms * (qnorm or 1e-9)
+        denom[denom == 0] = 1e-9
+        return (mat @ qp + mean_q) / denom
+
+    def select(self, rows: np.ndarray) -> "SegmentTable":
+        """New table containing only `rows`; unused videos are dropped from the intern list."""
+        video_idx = self.video_idx[rows]
+        used = np.unique(video_idx)
+        remap = np.zeros(len(self.video_ids) or 1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        lengths = (self.text_offsets[1:] - self.text_offsets[:-1])[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        text_buf = (
+            np.concatenate([self.text_buf[self.text_offsets[i]:self.text_offsets[i + 1]] for i in rows])
+            if len(rows) else np.zeros(0, dtype=np.uint8)
+        )
+        return SegmentTable(
+            video_ids=[self.video_ids[i] for i in used],
+            titles=[self.titles[i] for i in used],
+            video_idx=remap[video_idx],
+            start=self.start[rows],
+            end=self.end[rows],
+            end_cummax=self.end_cummax[rows],
+            text_offsets=offsets,
+            text_buf=text_buf,
+            metadata=[self.metadata[i] for i in rows],
+            codes=self.codes[rows],
+            scales=self.scales[rows],
+            norms=self.norms[rows],
+            exact=self.exact[rows] if self.exact is not None else None,
+            storage=self.storage,
+            proj=self.proj[rows] if self.proj is not None else None,
+        )
+
+    def concat(self, other: "SegmentTable") -> "SegmentTable":
+        if not len(self):
+            return other
+        if not len(other):
+            return self
+        if self.dim != other.dim:
+            raise ValueError(f"Embedding dimension {other.dim} does not match stored dimension {self.dim}")
+        exact = proj = None
+        if self.exact is not None and other.exact is not None:
+            exact = np.concatenate([self.exact, other.exact])
+        if self.proj is not None and other.proj is not None and self.proj.shape[1] == other.proj.shape[1]:
+            proj = np.concatenate([self.proj, other.proj])
+        return SegmentTable(
+            video_ids=self.video_ids + other.video_ids,
+            titles=self.titles + other.titles,
+            video_idx=np.concatenate([self.video_idx, other.video_idx + len(self.video_ids)]).astype(np.int32),
+            start=np.concatenate([self.start, other.start]),
+            end=np.concatenate([self.end, other.end]),
+            end_cummax=np.concatenate([self.end_cummax, other.end_cummax]),
+            text_offsets=np.concatenate([self.text_offsets[:-1], other.text_offsets + self.text_offsets[-1]]),
+            text_buf=np.concatenate([self.text_buf, other.text_buf]),
+            metadata=self.metadata + other.metadata,
+            codes=np.concatenate([self.codes, other.codes]),
+            scales=np.concatenate([self.scales, other.scales]),
+            norms=np.concatenate([self.norms, other.norms]),
+            exact=exact,
+            storage=self.storage,
+            proj=proj,
+        )
+
+    def slice(self, start: int, stop: int, video_start: int, video_stop: int) -> "SegmentTable":
+        """Rows [start, stop) referencing videos [video_start, video_stop); column views, no copies."""
+        base = int(self.text_offsets[start])
+        return SegmentTable(
+            video_ids=self.video_ids[video_start:video_stop],
+            titles=self.titles[video_start:video_stop],
+            video_idx=(self.video_idx[start:stop] - video_start).astype(np.int32),
+            start=self.start[start:stop],
+            end=self.end[start:stop],
+            end_cummax=self.end_cummax[start:stop],
+            text_offsets=self.text_offsets[start:stop + 1] - base,
+            text_buf=self.text_buf[base:int(self.text_offsets[stop])],
+            metadata=self.metadata[start:stop],
+            codes=self.codes[start:stop],
+            scales=self.scales[start:stop],
+            norms=self.norms[start:stop],
+            exact=self.exact[start:stop] if self.exact is not None else None,
+            storage=self.storage,
+            proj=self.proj[start:stop] if self.proj is not None else None,
+        )
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS if getattr(self, name) is not None}
+
+    def header(self) -> Dict[str, Any]:
+        return {"video_ids": self.video_ids, "titles": self.titles, "storage": self.storage}
+
+    @classmethod
+    def from_arrays(cls, header: Dict[str, Any], arrays: Dict[str, np.ndarray], metadata: List[Optional[Dict[str, Any]]]) -> "SegmentTable":
+        if "end_cummax" not in arrays:
+            # snapshots written before time-range search
+            cummax = np.array(arrays["end"], dtype=np.float64)
+            bounds = np.concatenate([[0], np.flatnonzero(np.diff(arrays["video_idx"])) + 1, [len(cummax)]])
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                cummax[lo:hi] = np.maximum.accumulate(cummax[lo:hi])
+            arrays = {**arrays, "end_cummax": cummax}
+        return cls(
+            video_ids=list(header["video_ids"]),
+            titles=list(header["titles"]),
+            metadata=metadata,
+            storage=header["storage"],
+            exact=arrays.get("exact"),
+            proj=arrays.get("proj"),
+            **{name: arrays[name] for name in cls.ARRAYS if name not in cls.OPTIONAL},
+        )
+
+
+def stack_tables(tables: List[SegmentTable]) -> tuple[Dict[str, Any], Dict[str, List[np.ndarray]], List[Any]]:
+    """
+    Describe `tables` as one logical table without concatenating them: returns a header (with
+    per-table row/video bounds), per-column lists of parts to be written back to back, and metadata.
+    """
+    header: Dict[str, Any] = {"video_ids": [], "titles": [], "storage": tables[0].storage if tables else "float32",
+                              "shard_rows": [0], "shard_videos": [0]}
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in SegmentTable.ARRAYS}
+    metadata: List[Any] = []
+    keep_exact = all(t.exact is not None for t in tables if len(t))
+    keep_proj = all(t.proj is not None for t in tables if len(t))
+    text_base = 0
+    for t in tables:
+        if len(t):
+            parts["video_idx"].append(t.video_idx + len(header["video_ids"]))
+            parts["text_offsets"].append(t.text_offsets[:-1] + text_base)
+            for name in ("start", "end", "end_cummax", "text_buf", "codes", "scales", "norms"):
+                parts[name].append(getattr(t, name))
+            if keep_exact:
+                parts["exact"].append(t.exact)
+            if keep_proj:
+                parts["proj"].append(t.proj)
+            text_base += int(t.text_offsets[-1])
+        header["video_ids"] += t.video_ids
+        header["titles"] += t.titles
+        header["shard_rows"].append(header["shard_rows"][-1] + len(t))
+        header["shard_videos"].append(len(header["video_ids"]))
+        metadata += t.metadata
+    parts["text_offsets"].append(np.array([text_base], dtype=np.int64))
+    if not keep_exact or not parts["exact"]:
+        del parts["exact"]
+    if not keep_proj or not parts["proj"]:
+        del parts["proj"]
+    return header, parts, metadata
+
+
+def concat_tables(tables: List[SegmentTable], storage: str) -> SegmentTable:
+    """Concatenate many tables by pairwise merging, so each row is copied O(log n) times."""
+    tables = [t for t in tables if len(t)]
+    if not tables:
+        return SegmentTable.empty(storage)
+    while len(tables) > 1:
+        tables = [tables[i].concat(tables[i + 1]) if i + 1 < len(tables) else tables[i] for i in range(0, len(tables), 2)]
+    return tables[0]
+
+
+_search_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    global _search_pool
+    if _search_pool is None:
+        _search_pool = ThreadPoolExecutor(
+            max_workers=settings.SEARCH_WORKERS or os.cpu_count() or 1, thread_name_prefix="search"
+        )
+    return _search_pool
 
 
 class InMemoryStore:
-    def __init__(self) -> None:
+    """
+    Segments are hash-partitioned by video into `shards` SegmentTables. A scoped query scores one
+    shard; a library-wide query scores every shard (in a thread pool once the library is large
+    enough, NumPy releases the GIL) and merges the per-shard top-k. Re-ingesting a video only
+    rebuilds its shard.
+
+    With `shared`, several processes (uvicorn workers) use one snapshot dir: each maps the current
+    generation read-only, so the page cache holds a single copy of the index; upserts are appended
+    to the shared log and every process tails it. The process holding the dir's writer lock folds
+    the log into new generations, which the others pick up and re-map.
+
+    Every vector in the store comes from one embedding model (`_model`, recorded in snapshots and
+    log records); begin_migration() re-embeds the library into another and swaps it in whole.
+
+    With PROJECTION_DIM, a PCA fit on the stored vectors (`_projection`, versioned and recorded in
+    snapshots) gives every row a reduced copy; scans score those and re-score the top candidates
+    against the full vectors. The writer refits it in the background as the library grows.
+    """
+
+    def __init__(
+        self,
+        snapshot_dir: Optional[str] = None,
+        storage: Optional[str] = None,
+        rescore: Optional[bool] = None,
+        shards: Optional[int] = None,
+        shared: Optional[bool] = None,
+    ) -> None:
         self._videos: Dict[str, Dict[str, Any]] = {}
-        self._segments: List[Dict[str, Any]] = []
+        self._storage = storage or settings.EMBEDDING_STORAGE
+        self._rescore = settings.EMBEDDING_RESCORE if rescore is None else rescore
+        # tables are replaced, never mutated, so a snapshot-loaded np.memmap stays on disk
+        # until its shard is rewritten
+        self._nshards = max(1, shards or settings.SEARCH_SHARDS or os.cpu_count() or 1)
+        self._shards: List[SegmentTable] = [SegmentTable.empty(self._storage) for _ in range(self._nshards)]
+        self._centroids: Dict[str, np.ndarray] = {}
+        self._projection: Optional[Projection] = None
+        self._projection_task: Optional[asyncio.Task] = None
+        self._snapshots = SnapshotManager(snapshot_dir) if snapshot_dir else None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        # held from logging an upsert until it is applied, and by snapshot() from sealing the log
+        # until the state is captured: each upsert is in the snapshot or in the next log, not both
+        self._log_lock = asyncio.Lock()
+        self._dirty = False
+        # bumped on every applied upsert; lets caches tell whether results may have changed
+        self._version = 0
+        self._history: Optional[tuple] = None
+        self._model = settings.EMBEDDING_MODEL
+        self._shared = bool(self._snapshots) and (settings.SHARED_INDEX if shared is None else shared)
+        # log records written by this process are applied at write time, not again when tailed
+        self._origin = uuid4().hex
+        self._log_cursor: Dict[int, int] = {}
+        self._writer = not self._shared or self._snapshots.try_lock_writer()
+        if self._snapshots and not self._restore():
+            # start from the log alone rather than not at all
+            self._apply_log(skip_own=False)
+        if self._snapshots and self._writer and self._snapshots.library_model() not in (None, self._model):
+            # a model switch whose snapshot never got written (crash mid-migration): the snapshot wins
+            logger.warning(f"Library model reset to {self._model} from the last snapshot")
+            self._snapshots.switch_model(self._model)
+
+    def _shard_of(self, video_id: str) -> int:
+        return zlib.crc32(video_id.encode("utf-8")) % self._nshards
 
-    async def upsert_segments(self, video_id: str, title: str, segments: List[Dict[str, Any]], url: Optional[str] = None, is_local_file: bool = False) -> None:
-        self._videos[video_id] = {
-            "video_id": video_id, 
-            "title": title, 
+    def _restore(self, gen: Optional[int] = None) -> bool:
+        """
+        Map snapshot generation `gen` (default the current one) and replay its log. The new state is
+        built aside and swapped in only once loaded, so if the generation cannot be read (e.g. the
+        writer replaced it mid-load) this returns False and the state served so far is kept.
+        """
+        gen = self._snapshots.generation if gen is None else gen
+        videos: Dict[str, Dict[str, Any]] = {}
+        shards = [SegmentTable.empty(self._storage) for _ in range(self._nshards)]
+        centroids: Dict[str, np.ndarray] = {}
+        projection: Optional[Projection] = None
+        version = 0
+        model = settings.EMBEDDING_MODEL
+        try:
+            loaded = self._snapshots.load(gen)
+            if loaded is None and gen:
+                raise FileNotFoundError(f"generation {gen} is gone")
+            if loaded is not None:
+                videos, header, arrays, metadata = loaded
+                version = int(header.get("version", 0))
+                # snapshots from before migrations were always in the configured model
+                model = header.get("embedding_model") or settings.EMBEDDING_MODEL
+                table = SegmentTable.from_arrays(header, arrays, metadata)
+                bounds = header.get("shard_rows") or []
+                if len(bounds) == self._nshards + 1:
+                    vbounds = header["shard_videos"]
+                    shards = [
+                        table.slice(bounds[i], bounds[i + 1], vbounds[i], vbounds[i + 1]) for i in range(self._nshards)
+                    ]
+                else:
+                    logger.warning(f"Snapshot has {max(len(bounds) - 1, 1)} shards, re-partitioning into {self._nshards}")
+                    for vid in table.video_ids:
+                        i = self._shard_of(vid)
+                        shards[i] = shards[i].concat(table.select(table.video_rows(vid)))
+                if table.storage != self._storage:
+                    logger.warning(f"Snapshot uses {table.storage} embeddings; keeping it until the next snapshot")
+                p = header.get("projection")
+                if p and p.get("model") == model and "projection_components" in arrays:
+                    projection = Projection(
+                        arrays["projection_mean"][0], arrays["projection_components"], p["version"], p["model"], p["rows"]
+                    )
+                if "centroids" in arrays:
+                    centroids = {vid: np.asarray(c) for vid, c in zip(header["centroid_ids"], arrays["centroids"])}
+                else:
+                    for vid in table.video_ids:
+                        c = centroid(np.stack([table.vector(int(r)) for r in table.video_rows(vid)]))
+                        if c is not None:
+                            centroids[vid] = c
+        except Exception as e:
+            logger.warning(f"Could not map snapshot generation {gen}, keeping the current index: {e}")
+            return False
+        # fresh containers: searches running in the pool keep the ones they started with
+        self._videos, self._shards, self._centroids, self._projection = videos, shards, centroids, projection
+        self._version, self._model = version, model
+        self._history = None
+        self._log_cursor = {}
+        self._snapshots.generation = gen
+        replayed = self._apply_log(skip_own=False)
+        if replayed:
+            logger.info(f"Replayed {replayed} logged upserts")
+        return True
+
+    def _apply_log(self, skip_own: bool = True) -> int:
+        """Apply log records not seen yet (by default not this process's own); returns how many."""
+        applied = 0
+        for rec in self._snapshots.read_log(self._log_cursor):
+            if skip_own and rec.get("origin") == self._origin:
+                continue
+            if rec.get("model", self._model) != self._model:
+                logger.warning(f"Dropping logged upsert of {rec['video']['video_id']}: embedded with "
+                               f"{rec['model']}, library is in {self._model}; re-ingest it")
+                continue
+            self._apply_upsert(rec["video"], rec["segments"], decode_array(rec["embeddings"]))
+            applied += 1
+        if applied:
+            self._dirty = True
+        return applied
+
+    def sync(self) -> None:
+        """Shared mode: re-map a generation published by the writer, else apply new log records."""
+        if not self._shared:
+            return
+        if not self._writer and self._snapshots.try_lock_writer():
+            logger.info("Took over as snapshot writer")
+            self._writer = True
+        gen = self._snapshots.refresh()
+        if gen is not None and self._restore(gen):
+            logger.info(f"Mapped generation {gen} (version {self._version})")
+        else:
+            # also while a newly published generation cannot be mapped yet: retried on the next sync
+            self._apply_log()
+
+    def _apply_upsert(self, video: Dict[str, Any], segments: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        video_id = video["video_id"]
+        i = self._shard_of(video_id)
+        table = self._shards[i]
+        existing = table.video_rows(video_id)
+        if existing.size:
+            keep = np.setdiff1d(np.arange(len(table)), existing, assume_unique=True)
+            table = table.select(keep)
+        new = SegmentTable.from_segments(
+            video_id, video.get("title"), segments, embeddings, table.storage, keep_exact=self._rescore,
+            projection=self._projection,
+        )
+        self._shards[i] = table.concat(new)
+        self._videos[video_id] = video
+        self._version += 1
+        c = centroid(embeddings)
+        if c is not None:
+            self._centroids[video_id] = c
+        else:
+            self._centroids.pop(video_id, None)
+
+    async def library_version(self) -> int:
+        return self._version
+
+    async def library_state(self) -> tuple:
+        """(version, embedding model) of the searchable library."""
+        return self._version, self._model
+
+    async def embedding_model(self) -> str:
+        return self._model
+
+    async def count_segments(self) -> int:
+        return sum(len(t) for t in self._shards)
+
+    async def begin_ingest(self, video_id: str, title: str) -> "MemoryIngest":
+        return MemoryIngest(self, video_id, title, self._model)
+
+    async def begin_migration(self, model: str) -> Optional["MemoryMigration"]:
+        """Start re-embedding into `model`; None in shared mode unless this is the writer process."""
+        if not self._writer:
+            return None
+        return MemoryMigration(self, model)
+
+    async def upsert_segments(
+        self,
+        video_id: str,
+        title: str,
+        segments: List[Dict[str, Any]],
+        url: Optional[str] = None,
+        is_local_file: bool = False,
+        sentences: Optional[List[tuple]] = None,
+        created_at: Optional[str] = None,
+        segmented_at: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> None:
+        """`model` is the one the segments were embedded with (default: the library's)."""
+        video = {
+            "video_id": video_id,
+            "title": title,
             "url": url,
-            "created_at": datetime.now().isoformat(),
+            "created_at": created_at or datetime.now().isoformat(),
             "is_local_file": is_local_file
         }
-        self._segments = [s for s in self._segments if s.get("video_id") != video_id]
-        for s in segments:
-            s["video_id"] = video_id
-        self._segments.extend(segments)
+        if segmented_at:
+            video["segmented_at"] = segmented_at
+        if sentences:
+            video["transcript"] = encode_sentences(sentences)
+        rows = [
+            {"start_time": s.get("start_time", 0.0), "end_time": s.get("end_time", 0.0),
+             "text": s.get("text", ""), "metadata": s.get("metadata") or {}}
+            for s in segments
+        ]
+        dim = len(segments[0].get("embedding") or []) if segments else 0
+        embeddings = np.array(
+            [s.get("embedding") or [0.0] * dim for s in segments], dtype=np.float32
+        ).reshape(len(segments), dim)
+        await self._upsert(video, rows, embeddings, model)
+
+    async def import_video(self, video: Dict[str, Any], rows: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        """Bulk path for a whole exported video: its record as exported, rows and an (n, dim) array."""
+        await self._upsert(dict(video), rows, np.asarray(embeddings, dtype=np.float32))
+
+    async def _upsert(
+        self, video: Dict[str, Any], rows: List[Dict[str, Any]], embeddings: np.ndarray, model: Optional[str] = None
+    ) -> None:
+        async with self._log_lock:
+            if self._shared:
+                # another process may have switched the library to a new model since the last poll
+                self.sync()
+            model = model or self._model
+            if model != self._model:
+                raise EmbeddingSpaceChanged(f"Library moved to {self._model} during ingest of {video['video_id']}; retry")
+            if self._snapshots:
+                logged = await asyncio.to_thread(
+                    self._snapshots.append,
+                    {"video": video, "segments": rows, "embeddings": encode_array(embeddings),
+                     "model": model, "origin": self._origin},
+                )
+                if not logged:
+                    raise EmbeddingSpaceChanged(
+                        f"Library moved to {self._snapshots.library_model()} during ingest of {video['video_id']}; retry"
+                    )
+            self._apply_upsert(video, rows, embeddings)
+            self._dirty = True
+        self.schedule_projection_fit()
+
+    def schedule_projection_fit(self) -> None:
+        """Refit the projection in the background if _projection_due() (one fit at a time)."""
+        if self._projection_due() and (self._projection_task is None or self._projection_task.done()):
+            self._projection_task = asyncio.create_task(self._refit_projection())
+
+    def _projection_due(self) -> bool:
+        """PROJECTION_DIM is set, this process fits, and there is no current fit for this library."""
+        dim = settings.PROJECTION_DIM
+        if dim <= 0 or not self._writer:
+            return False
+        rows = sum(len(t) for t in self._shards)
+        if rows < max(settings.PROJECTION_MIN_ROWS, dim):
+            return False
+        p = self._projection
+        return (p is None or p.model != self._model or p.dim != dim
+                or rows >= p.rows * settings.PROJECTION_REFIT_GROWTH)
+
+    async def _refit_projection(self) -> None:
+        try:
+            await self.fit_projection()
+        except Exception as e:
+            logger.warning(f"Fitting the embedding projection failed; scanning full vectors: {e}")
+
+    async def fit_projection(self, dim: Optional[int] = None, sample: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fit a PCA to `dim` (PROJECTION_DIM) dimensions on up to `sample` (PROJECTION_SAMPLE) stored
+        vectors and give every shard the reduced rows; returns the new projection's header, or None
+        if the library is empty or switched models meanwhile.
+        """
+        dim = dim or settings.PROJECTION_DIM
+        sample = sample or settings.PROJECTION_SAMPLE
+        shards, model = list(self._shards), self._model
+        total = sum(len(t) for t in shards)
+        if dim <= 0 or not total or len({t.dim for t in shards if len(t)}) != 1:
+            return None
+        start = time.perf_counter()
+        rng = np.random.default_rng(0)
+
+        def build() -> tuple:
+            take = min(1.0, sample / total)
+            parts = [
+                t.take_vectors(np.sort(rng.choice(len(t), max(1, int(round(len(t) * take))), replace=False)))
+                for t in shards if len(t)
+            ]
+            version = self._projection.version + 1 if self._projection is not None else 1
+            projection = Projection.fit(np.concatenate(parts), dim, version, model, total)
+            return projection, [t.with_projection(projection) for t in shards]
 
-    async def search(self, query_embedding: List[float], k: int, video_id: Optional[str]) -> List[Dict[str, Any]]:
-        import numpy as np
+        projection, tables = await asyncio.to_thread(build)
+        if self._model != model:
+            return None
+        # shards re-ingested while fitting get their reduced rows now, without yielding
+        self._shards = [
+            new if cur is old else cur.with_projection(projection)
+            for cur, old, new in zip(self._shards, shards, tables)
+        ]
+        self._projection = projection
+        self._dirty = True
+        set_gauge("projection_version", projection.version)
+        set_gauge("projection_dim", projection.dim)
+        logger.info(f"Fitted embedding projection v{projection.version}: {projection.input_dim} -> {projection.dim} dims "
+                    f"on {sum(len(t) for t in tables)} rows in {time.perf_counter() - start:.1f}s")
+        return projection.header()
 
-        qe = np.array(query_embedding)
+    def _shard_topk(
+        self, table: SegmentTable, rows: Optional[np.ndarray], qe: np.ndarray, m: int,
+        reduced: Optional[tuple] = None,
+    ) -> List[tuple]:
+        """
+        (score, row, start, end, video_idx) of the m best rows of one shard, best first, re-scored
+        exactly when codes are lossy. With `reduced` (the query under the library projection) the
+        scan scores the shard's reduced rows and always re-scores the top candidates on full vectors.
+        """
+        if not len(table) or table.dim != qe.shape[0] or (rows is not None and not rows.size):
+            return []
+        projected = reduced is not None and table.proj is not None and table.proj.shape[1] == reduced[0].shape[0]
+        scores = table.reduced_scores(reduced, rows) if projected else table.scores(qe, rows)
+        rescore = projected or (self._rescore and table.exact is not None)
+        top = _top_indices(scores, max(m, settings.RESCORE_CANDIDATES) if rescore else m)
+        picked, cand = (rows[top] if rows is not None else top), scores[top]
+        if rescore:
+            cand = table.scores(qe, picked, exact=True)
+            order = np.argsort(-cand, kind="stable")[:m]
+            picked, cand = picked[order], cand[order]
+        return [(float(sc), int(r), float(table.start[r]), float(table.end[r]), int(table.video_idx[r]))
+                for sc, r in zip(cand.tolist(), picked.tolist())]
+
+    def _chunk_topk(
+        self, work: List[tuple], qe: np.ndarray, m: int, reduced: Optional[tuple] = None
+    ) -> tuple[List[tuple], float]:
+        """
+        The m best hits `(score, shard, row, start, end, video_idx)` of each shard in `work`, and
+        the score above which the merged hits are complete: a shard that filled all m slots may
+        hold more rows at or below its last score.
+        """
+        out: List[tuple] = []
+        floor = -np.inf
+        for shard, table, rows in work:
+            hits = self._shard_topk(table, rows, qe, m, reduced)
+            out.extend((hit[0], shard) + hit[1:] for hit in hits)
+            if len(hits) == m:
+                floor = max(floor, hits[-1][0])
+        return out, floor
+
+    async def _topk(self, work: List[tuple], qe: np.ndarray, m: int, reduced: Optional[tuple]) -> tuple[List[tuple], float]:
+        """_chunk_topk over all of `work`, fanned out to the search pool when the scan is large; best first."""
+        total = sum(len(t) if rows is None else rows.size for _, t, rows in work)
+        workers = settings.SEARCH_WORKERS or os.cpu_count() or 1
+        if len(work) > 1 and workers > 1 and total >= settings.SEARCH_PARALLEL_MIN_ROWS:
+            loop = asyncio.get_running_loop()
+            pool = _get_search_pool()
+            chunks = [work[j::workers] for j in range(min(workers, len(work)))]
+            parts = await asyncio.gather(
+                *(loop.run_in_executor(pool, self._chunk_topk, c, qe, m, reduced) for c in chunks)
+            )
+            hits = [h for part, _ in parts for h in part]
+            floor = max(f for _, f in parts)
+        else:
+            hits, floor = self._chunk_topk(work, qe, m, reduced)
+        hits.sort(key=lambda x: x[0], reverse=True)
+        return hits, floor
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        video_id: Optional[str],
+        t_min: Optional[float] = None,
+        t_max: Optional[float] = None,
+        collapse: bool = False,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Dict[str, Any]]:
+        qe = np.asarray(query_embedding, dtype=np.float32)
+        # shards and projection are swapped together, never across an await
+        shards, projection = list(self._shards), self._projection
+        reduced = projection.query(qe) if projection is not None and projection.input_dim == qe.shape[0] else None
+        timed = t_min is not None or t_max is not None
+        if video_id:
+            i = self._shard_of(video_id)
+            rows = shards[i].time_rows(video_id, t_min, t_max) if timed else shards[i].video_rows(video_id)
+            work = [(i, shards[i], rows)]
+        else:
+            routed = self._routed_rows(qe, shards)
+            work = []
+            for i, t in enumerate(shards):
+                if not len(t) or (routed is not None and i not in routed):
+                    continue
+                rows = routed.get(i) if routed is not None else None
+                if timed:
+                    in_window = t.time_rows(None, t_min, t_max)
+                    rows = in_window if rows is None else np.intersect1d(rows, in_window, assume_unique=True)
+                work.append((i, t, rows))
+        if not collapse:
+            hits, _ = await self._topk(work, qe, k, reduced)
+            return [{**shards[shard].row(row), "score": score} for score, shard, row, *_ in hits[:k]]
+        # Overlaps are collapsed once over the merged ranking, so spans do not depend on how the
+        # library is sharded; each pass goes twice as deep until k distinct spans are complete.
+        m = k * settings.COLLAPSE_OVERFETCH
+        while True:
+            hits, floor = await self._topk(work, qe, m, reduced)
+            groups, complete = collapse_overlaps(
+                ((score, i, (shard, vid), start, end)
+                 for i, (score, shard, _, start, end, vid) in enumerate(hits) if score >= floor),
+                k,
+            )
+            if complete or floor == -np.inf:
+                break
+            m *= 2
         results = []
-        for s in self._segments:
-            if video_id and s.get("video_id") != video_id:
-                continue
-            emb = np.array(s["embedding"]) if "embedding" in s else None
-            if emb is None or emb.shape != qe.shape:
-                continue
-            denom = (np.linalg.norm(qe) * np.linalg.norm(emb)) or 1e-9
-            score = float(np.dot(qe, emb) / denom)
-            results.append({**s, "score": score})
-        results.sort(key=lambda x: x.get("score", 0.0), reverse=True)
-        return results[:k]
+        for score, i, _, start, end, merged, *_ in groups:
+            shard, row = hits[i][1], hits[i][2]
+            doc = {**shards[shard].row(row), "score": float(score)}
+            if merged > 1:
+                doc.update(start_time=start, end_time=end, merged=merged)
+            results.append(doc)
+        return results
+
+    def _routed_rows(self, qe: np.ndarray, shards: List[SegmentTable]) -> Optional[Dict[int, np.ndarray]]:
+        """Per-shard rows of the ROUTING_TOP_VIDEOS best-matching videos, or None to scan everything."""
+        n = settings.ROUTING_TOP_VIDEOS
+        ids = [vid for vid, c in self._centroids.items() if c.shape == qe.shape]
+        if n <= 0 or len(ids) <= n:
+            return None
+        picked = route_videos(ids, np.stack([self._centroids[v] for v in ids]), qe, n)
+        by_shard: Dict[int, List[np.ndarray]] = {}
+        for v in picked:
+            i = self._shard_of(v)
+            by_shard.setdefault(i, []).append(shards[i].video_rows(v))
+        return {i: np.sort(np.concatenate(r)) for i, r in by_shard.items()}
+
+    async def get_embeddings(self, video_id: str, text_hashes: List[str]) -> Dict[str, List[float]]:
+        """Stored vectors of `video_id` keyed by text hash, for re-ingest without re-embedding."""
+        table = self._shards[self._shard_of(video_id)]
+        wanted = set(text_hashes)
+        found: Dict[str, List[float]] = {}
+        for r in table.video_rows(video_id):
+            h = text_hash(table.text(int(r)))
+            if h in wanted and h not in found:
+                found[h] = table.vector(int(r)).tolist()
+        return found
+
+    async def list_segments(
+        self,
+        video_id: Optional[str],
+        limit: int = 2000,
+        t_min: Optional[float] = None,
+        t_max: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        tables = [self._shards[self._shard_of(video_id)]] if video_id else self._shards
+        items: List[Dict[str, Any]] = []
+        for table in tables:
+            for r in table.time_rows(video_id, t_min, t_max)[:limit - len(items)]:
+                items.append(table.row(r))
+        return items
+
+    async def get_video(self, video_id: str) -> Optional[Dict[str, Any]]:
+        video = self._videos.get(video_id)
+        return {f: video.get(f) for f in VIDEO_FIELDS} if video else None
+
+    async def adopt_embedding_model(self, model: str) -> None:
+        """Declare the model of an (empty) library's vectors, e.g. before importing an export."""
+        if any(len(t) for t in self._shards):
+            raise ValueError(f"Library already holds vectors from {self._model}")
+        if self._snapshots:
+            await asyncio.to_thread(self._snapshots.switch_model, model)
+        self._model = model
+        self._dirty = True
+
+    async def dump_videos(self) -> List[Dict[str, Any]]:
+        """Full video records (with stored transcripts), for export."""
+        return [dict(v) for v in self._videos.values()]
+
+    async def dump_segments(self, batch_size: int = 4096, version: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        All segments as columnar batches (video_id, start_time, end_time, text, metadata lists and an
+        (n, dim) float32 `embedding` array), each video's rows contiguous and in time order. The
+        tables are captured when iteration starts; `version` is accepted for MongoStore parity.
+        """
+        for table in list(self._shards):
+            for start in range(0, len(table), batch_size):
+                stop = min(start + batch_size, len(table))
+                yield {
+                    "video_id": [table.video_ids[int(v)] for v in table.video_idx[start:stop]],
+                    "start_time": np.asarray(table.start[start:stop]),
+                    "end_time": np.asarray(table.end[start:stop]),
+                    "text": [table.text(i) for i in range(start, stop)],
+                    "metadata": [m or {} for m in table.metadata[start:stop]],
+                    "embedding": table.vectors(start, stop),
+                }
+                await asyncio.sleep(0)
 
-    async def list_segments(self, video_id: Optional[str], limit: int = 2000) -> List[Dict[str, Any]]:
-        items = [s for s in self._segments if (not video_id or s.get("video_id") == video_id)]
-        return items[:limit]
+    async def get_transcript(self, video_id: str) -> Optional[List[tuple]]:
+        """Sentence-level transcript the video was segmented from, if it was stored."""
+        blob = (self._videos.get(video_id) or {}).get("transcript")
+        return decode_sentences(blob) if blob else None
 
-    async def get_videos(self) -> List[Dict[str, Any]]:
-        return list(self._videos.values())
+    def _history_keys(self) -> List[tuple]:
+        # (created_at, video_id) ascending, rebuilt only when the library changed
+        if self._history is None or self._history[0] != self._version:
+            keys = sorted((v.get("created_at") or "", vid) for vid, v in self._videos.items())
+            self._history = (self._version, keys)
+        return self._history[1]
+
+    async def get_videos(self, limit: Optional[int] = None, after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """Newest first; `after` is the (created_at, video_id) key the previous page ended on."""
+        keys = self._history_keys()
+        stop = bisect.bisect_left(keys, tuple(after)) if after else len(keys)
+        start = max(0, stop - limit) if limit else 0
+        return [
+            {f: self._videos[vid].get(f) for f in VIDEO_FIELDS}
+            for _, vid in reversed(keys[start:stop])
+        ]
+
+    async def snapshot(self) -> None:
+        """
+        Write a full snapshot and truncate the log. No-op without a snapshot dir or changes, and
+        in processes that are not the snapshot writer.
+        """
+        if not self._snapshots or not self._writer:
+            return
+        if self._shared:
+            self.sync()
+        if not self._dirty:
+            return
+        # open the next generation and capture the state without yielding, so later upserts land
+        # in its log; records other processes added to the old log are applied before it is sealed
+        async with self._log_lock:
+            gen = self._snapshots.begin(self._apply_log if self._shared else None)
+            videos = dict(self._videos)
+            header, parts, metadata = stack_tables(list(self._shards))
+            header["version"] = self._version
+            header["embedding_model"] = self._model
+            if self._centroids:
+                header["centroid_ids"] = list(self._centroids)
+                parts["centroids"] = [np.stack(list(self._centroids.values()))]
+            if self._projection is not None:
+                header["projection"] = self._projection.header()
+                parts["projection_mean"] = [self._projection.mean[None, :]]
+                parts["projection_components"] = [self._projection.components]
+            self._dirty = False
+        try:
+            await asyncio.to_thread(self._snapshots.write, gen, videos, header, parts, metadata)
+        except Exception:
+            self._dirty = True
+            raise
+
+    def start_snapshots(self, interval_s: float, poll_s: Optional[float] = None) -> None:
+        """Snapshot every `interval_s` (writer only); in shared mode also sync every `poll_s`."""
+        if not self._snapshots or self._snapshot_task is not None:
+            return
+        poll_s = (settings.SHARED_INDEX_POLL_S if poll_s is None else poll_s) if self._shared else None
+        if interval_s <= 0 and not poll_s:
+            return
+        tick = min(t for t in (interval_s, poll_s) if t and t > 0)
+
+        async def _loop() -> None:
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(tick)
+                try:
+                    self.sync()
+                    if interval_s > 0 and time.monotonic() - last >= interval_s:
+                        last = time.monotonic()
+                        await self.snapshot()
+                except Exception as e:
+                    logger.warning(f"Periodic snapshot/sync failed: {e}")
+
+        self._snapshot_task = asyncio.create_task(_loop())
+
+    async def close(self) -> None:
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        if self._projection_task is not None and not self._projection_task.done():
+            # a fit that did not finish is simply redone after the restart
+            self._projection_task.cancel()
+        await self.snapshot()
+        if self._snapshots:
+            self._snapshots.release_writer()
 
 
 class MongoStore:
-    def __init__(self) -> None:
-        self.client = AsyncIOMotorClient(settings.MONGODB_URI)
+    """
+    Segment documents are versioned: a document is visible at library version `pv` when
+    v_from <= pv < v_to. Re-ingest inserts only new segments at v_from = next version, retires
+    vanished ones with v_to = next version, then publishes the version, so readers switch from the
+    old to the new segmentation of a video in one step.
+
+    The library meta document records the embedding model of the live vectors next to the version,
+    so a reader gets a matching pair; an embedding migration switches both in one update.
+    """
+
+    def __init__(self, client: Any = None) -> None:
+        self.client = client if client is not None else AsyncIOMotorClient(settings.MONGODB_URI)
         self.db = self.client[settings.MONGODB_DB]
         self.col = self.db[settings.MONGODB_COLLECTION]
         self.videos_col = self.db["videos"]
+        self.meta_col = self.db["meta"]
+        # versions are allocated per process; run a single ingest writer per database
+        self._write_lock = asyncio.Lock()
+        self._centroid_cache: Optional[tuple] = None
 
     async def ensure_indexes(self) -> None:
         await self.col.create_index([("video_id", ASCENDING)])
+        await self.col.create_index([("video_id", ASCENDING), ("segment_key", ASCENDING), ("v_to", ASCENDING)])
+        await self.col.create_index([("video_id", ASCENDING), ("start_time", ASCENDING)])
         await self.videos_col.create_index([("video_id", ASCENDING)], unique=True)
+        await self.videos_col.create_index([("created_at", DESCENDING), ("video_id", DESCENDING)])
+        # documents written before versioning are live since version 0
+        await self.col.update_many({"v_from": {"$exists": False}}, {"$set": {"v_from": 0, "v_to": LIVE_VERSION}})
+        # libraries from before migrations were embedded with the configured model
+        await self.meta_col.update_one({"_id": "library"}, {"$setOnInsert": {"version": 0}}, upsert=True)
+        await self.meta_col.update_one(
+            {"_id": "library", "model": {"$exists": False}}, {"$set": {"model": settings.EMBEDDING_MODEL}}
+        )
 
-    async def upsert_segments(self, video_id: str, title: str, segments: List[Dict[str, Any]], url: Optional[str] = None, is_local_file: bool = False) -> None:
-        await self.col.delete_many({"video_id": video_id})
-        for s in segments:
-            s["video_id"] = video_id
-            s["title"] = title
-        if segments:
-            await self.col.insert_many(segments)
-        
-        # Store video metadata
-        video_info = {
-            "video_id": video_id,
-            "title": title,
-            "url": url,
-            "created_at": datetime.now().isoformat(),
-            "is_local_file": is_local_file
-        }
-        await self.videos_col.replace_one({"video_id": video_id}, video_info, upsert=True)
+    async def library_version(self) -> int:
+        return (await self.library_state())[0]
+
+    async def library_state(self) -> tuple:
+        """(version, embedding model) of the searchable library, read together."""
+        doc = await self.meta_col.find_one({"_id": "library"}) or {}
+        return int(doc.get("version", 0)), doc.get("model") or settings.EMBEDDING_MODEL
+
+    async def embedding_model(self) -> str:
+        return (await self.library_state())[1]
 
-    async def search(self, query_embedding: List[float], k: int, video_id: Optional[str]) -> List[Dict[str, Any]]:
-        filter_query: Dict[str, Any] = {}
+    async def count_segments(self) -> int:
+        return await self.col.count_documents(await self._visible(None))
+
+    async def _visible(
+        self,
+        video_id: Optional[str],
+        pv: Optional[int] = None,
+        t_min: Optional[float] = None,
+        t_max: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        if pv is None:
+            pv = await self.library_version()
+        q: Dict[str, Any] = {"v_from": {"$lte": pv}, "v_to": {"$gt": pv}}
         if video_id:
-            filter_query["video_id"] = video_id
+            q["video_id"] = video_id
+        # segment overlaps [t_min, t_max]
+        if t_max is not None:
+            q["start_time"] = {"$lte": t_max}
+        if t_min is not None:
+            q["end_time"] = {"$gte": t_min}
+        return q
+
+    async def _routed_videos(self, query_embedding: List[float], pv: int) -> Optional[List[str]]:
+        """Top ROUTING_TOP_VIDEOS videos by centroid similarity, or None to search the whole library."""
+        n = settings.ROUTING_TOP_VIDEOS
+        if n <= 0:
+            return None
+        if self._centroid_cache is None or self._centroid_cache[0] != pv:
+            ids, vecs = [], []
+            async for d in self.videos_col.find({"centroid": {"$exists": True}}, projection={"video_id": 1, "centroid": 1}):
+                ids.append(d["video_id"])
+                vecs.append(d["centroid"])
+            self._centroid_cache = (pv, ids, np.asarray(vecs, dtype=np.float32))
+        _, ids, mat = self._centroid_cache
+        qe = np.asarray(query_embedding, dtype=np.float32)
+        if len(ids) <= n or mat.ndim != 2 or mat.shape[1] != qe.shape[0]:
+            return None
+        return route_videos(ids, mat, qe, n)
+
+    async def get_embeddings(self, video_id: str, text_hashes: List[str]) -> Dict[str, List[float]]:
+        cursor = self.col.find(
+            {"video_id": video_id, "text_hash": {"$in": list(set(text_hashes))},
+             "v_from": {"$lt": STAGED_VERSION}, "v_to": LIVE_VERSION},
+            projection={"text_hash": 1, "embedding": 1, "_id": 0},
+        )
+        return {d["text_hash"]: d["embedding"] async for d in cursor if d.get("embedding")}
+
+    async def _next_version(self) -> int:
+        """Allocate the next library version (callers hold the write lock)."""
+        counter = await self.meta_col.find_one_and_update(
+            {"_id": "library"}, {"$inc": {"next_version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return max(int(counter["next_version"]), int(counter.get("version", 0)) + 1)
+
+    async def _bulk_write(self, ops: List[Any]) -> None:
+        chunk = max(1, settings.BULK_WRITE_CHUNK)
+        for i in range(0, len(ops), chunk):
+            await self.col.bulk_write(ops[i:i + chunk], ordered=False)
+
+    async def _live_keys(self, video_id: str) -> Set[str]:
+        return {
+            d["segment_key"] async for d in self.col.find(
+                {"video_id": video_id, "v_from": {"$lt": STAGED_VERSION}, "v_to": LIVE_VERSION},
+                projection={"segment_key": 1, "_id": 0},
+            ) if d.get("segment_key")
+        }
+
+    async def begin_ingest(self, video_id: str, title: str) -> "MongoIngest":
+        return MongoIngest(self, video_id, title, await self._live_keys(video_id), await self.embedding_model())
+
+    async def begin_migration(self, model: str) -> "MongoMigration":
+        """Start re-embedding into `model`, dropping what an interrupted migration had staged."""
+        await self.col.delete_many({"ingest_id": {"$regex": f"^{MIGRATION_PREFIX}"}})
+        return MongoMigration(self, model)
+
+    async def upsert_segments(
+        self,
+        video_id: str,
+        title: str,
+        segments: List[Dict[str, Any]],
+        url: Optional[str] = None,
+        is_local_file: bool = False,
+        sentences: Optional[List[tuple]] = None,
+        created_at: Optional[str] = None,
+        segmented_at: Optional[str] = None,
+    ) -> None:
+        ingest = await self.begin_ingest(video_id, title)
+        try:
+            await ingest.write(segments)
+            await ingest.commit(url, is_local_file, sentences, created_at, segmented_at)
+        except BaseException:
+            await ingest.abort()
+            raise
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        video_id: Optional[str],
+        t_min: Optional[float] = None,
+        t_max: Optional[float] = None,
+        collapse: bool = False,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Dict[str, Any]]:
+        pv, model = await self.library_state()
+        filter_query = await self._visible(video_id, pv, t_min, t_max)
+        if not video_id:
+            routed = await self._routed_videos(query_embedding, pv)
+            if routed is not None:
+                filter_query["video_id"] = {"$in": routed}
+        if not collapse:
+            return await self._fetch(query_embedding, k, filter_query, model, deadline)
+        # like InMemoryStore.search: fetch twice as deep until k distinct spans are complete or
+        # the candidates run out
+        limit = k * settings.COLLAPSE_OVERFETCH
+        while True:
+            docs = await self._fetch(query_embedding, limit, filter_query, model, deadline)
+            groups, complete = collapse_overlaps(
+                ((d.get("score", 0.0), i, d.get("video_id"), d.get("start_time", 0.0), d.get("end_time", 0.0))
+                 for i, d in enumerate(docs)),
+                k,
+            )
+            if complete or len(docs) < limit:
+                break
+            limit *= 2
+        out = []
+        for score, i, _, start, end, merged, *_ in groups:
+            doc = docs[i]
+            if merged > 1:
+                doc.update(start_time=start, end_time=end, merged=merged)
+            out.append(doc)
+        return out
+
+    async def _fetch(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        filter_query: Dict[str, Any],
+        model: str,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Dict[str, Any]]:
+        """The `limit` best documents matching `filter_query`, best first: $vectorSearch, else a scan."""
         try:
+            vector_search: Dict[str, Any] = {
+                "index": settings.VECTOR_INDEX_NAMES.get(model, "vector_index"),
+                "path": "embedding",
+                "queryVector": query_embedding,
+                "numCandidates": max(limit * 10, 100),
+                "limit": limit,
+            }
+            # $vectorSearch must be the first stage, so scoping goes into its own pre-filter
+            if filter_query:
+                vector_search["filter"] = {
+                    f: v if isinstance(v, dict) else {"$eq": v} for f, v in filter_query.items()
+                }
             pipeline = [
-                {
-                    "$vectorSearch": {
-                        "index": "vector_index",
-                        "path": "embedding",
-                        "queryVector": query_embedding,
-                        "numCandidates": max(k * 10, 100),
-                        "limit": k,
-                    }
-                },
+                {"$vectorSearch": vector_search},
                 {"$addFields": {"score": {"$meta": "vectorSearchScore"}}},
+                {"$project": {"embedding": 0}},
             ]
-            if filter_query:
-                pipeline.insert(0, {"$match": filter_query})
-            cursor = self.col.aggregate(pipeline)
+            remaining = deadline.remaining_ms() if deadline is not None else None
+            cursor = self.col.aggregate(pipeline, **({"maxTimeMS": max(1, int(remaining))} if remaining is not None else {}))
             return [doc async for doc in cursor]
         except Exception as e:
             logger.warning(f"VectorSearch not available, falling back to cosine in Mongo: {e}")
-            import numpy as np
-            qe = np.array(query_embedding)
-            docs = [d async for d in self.col.find(filter_query)]
-            results: List[Dict[str, Any]] = []
-            for d in docs:
-                emb = d.get("embedding")
-                if not emb:
-                    continue
-                emb_arr = np.array(emb)
-                denom = (np.linalg.norm(qe) * np.linalg.norm(emb_arr)) or 1e-9
-                score = float(np.dot(qe, emb_arr) / denom)
-                d["score"] = score
-                results.append(d)
-            results.sort(key=lambda x: x.get("score", 0.0), reverse=True)
-            return results[:k]
-
-    async def list_segments(self, video_id: Optional[str], limit: int = 2000) -> List[Dict[str, Any]]:
-        q: Dict[str, Any] = {}
-        if video_id:
-            q["video_id"] = video_id
+            return await self._scan_search(query_embedding, limit, filter_query, deadline=deadline)
+
+    async def _scan_search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        filter_query: Dict[str, Any],
+        batch_size: int = 1024,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Stream (id, embedding) pairs, keep a bounded top-k heap, then fetch only the winners.
+        If the deadline expires mid-scan, the best of what was scanned so far is returned.
+        """
+        qe = np.asarray(query_embedding, dtype=np.float32)
+        q_norm = float(np.linalg.norm(qe)) or 1e-9
+        heap: List[tuple] = []  # (score, seq, _id), min-heap of size k
+        seq = 0
+        ids: List[Any] = []
+        vecs: List[List[float]] = []
+
+        def flush() -> None:
+            nonlocal seq
+            if not vecs:
+                return
+            mat = np.asarray(vecs, dtype=np.float32)
+            norms = np.linalg.norm(mat, axis=1) * q_norm
+            norms[norms == 0] = 1e-9
+            scores = (mat @ qe) / norms
+            for _id, score in zip(ids, scores.tolist()):
+                seq += 1
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, seq, _id))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, seq, _id))
+            ids.clear()
+            vecs.clear()
+
+        cursor = self.col.find(filter_query, projection={"embedding": 1}).batch_size(batch_size)
+        async for d in cursor:
+            emb = d.get("embedding")
+            if not emb or len(emb) != qe.shape[0]:
+                continue
+            ids.append(d["_id"])
+            vecs.append(emb)
+            if len(vecs) >= batch_size:
+                flush()
+                if deadline is not None and deadline.expired:
+                    deadline.degrade("partial_scan")
+                    break
+        flush()
+
+        if not heap:
+            return []
+        scores = {_id: score for score, _, _id in heap}
+        docs = [d async for d in self.col.find({"_id": {"$in": list(scores)}}, projection={"embedding": 0})]
+        for d in docs:
+            d["score"] = scores[d["_id"]]
+        docs.sort(key=lambda x: x["score"], reverse=True)
+        return docs
+
+    async def list_segments(
+        self,
+        video_id: Optional[str],
+        limit: int = 2000,
+        t_min: Optional[float] = None,
+        t_max: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        q = await self._visible(video_id, t_min=t_min, t_max=t_max)
         cursor = self.col.find(q, projection={"embedding": 0}).limit(limit)
         return [doc async for doc in cursor]
 
-    async def get_videos(self) -> List[Dict[str, Any]]:
-        cursor = self.videos_col.find({}).sort("created_at", -1)
+    async def get_video(self, video_id: str) -> Optional[Dict[str, Any]]:
+        return await self.videos_col.find_one(
+            {"video_id": video_id}, projection={**{f: 1 for f in VIDEO_FIELDS}, "_id": 0}
+        )
+
+    async def get_transcript(self, video_id: str) -> Optional[List[tuple]]:
+        """Sentence-level transcript the video was segmented from, if it was stored."""
+        doc = await self.videos_col.find_one({"video_id": video_id}, projection={"transcript": 1, "_id": 0})
+        return decode_sentences(doc["transcript"]) if doc and doc.get("transcript") else None
+
+    async def adopt_embedding_model(self, model: str) -> None:
+        """Declare the model of an (empty) library's vectors, e.g. before importing an export."""
+        if await self.count_segments():
+            raise ValueError(f"Library already holds vectors from {await self.embedding_model()}")
+        await self.meta_col.update_one({"_id": "library"}, {"$set": {"model": model}}, upsert=True)
+
+    async def dump_videos(self) -> List[Dict[str, Any]]:
+        """Full video records (with stored transcripts), for export."""
+        return [d async for d in self.videos_col.find({}, projection={"_id": 0, "centroid": 0})]
+
+    async def dump_segments(self, batch_size: int = 4096, version: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Segments visible at `version` (default the current one) as columnar batches, like
+        InMemoryStore.dump_segments; commits landing mid-dump do not leak into it.
+        """
+        q = await self._visible(None, version)
+        cursor = self.col.find(
+            q, projection={"_id": 0, "video_id": 1, "start_time": 1, "end_time": 1, "text": 1, "metadata": 1, "embedding": 1}
+        ).sort([("video_id", ASCENDING), ("start_time", ASCENDING)]).batch_size(batch_size)
+        docs: List[Dict[str, Any]] = []
+
+        def columns() -> Dict[str, Any]:
+            return {
+                "video_id": [d["video_id"] for d in docs],
+                "start_time": np.array([d.get("start_time", 0.0) for d in docs], dtype=np.float64),
+                "end_time": np.array([d.get("end_time", 0.0) for d in docs], dtype=np.float64),
+                "text": [d.get("text", "") for d in docs],
+                "metadata": [d.get("metadata") or {} for d in docs],
+                "embedding": np.asarray([d["embedding"] for d in docs], dtype=np.float32),
+            }
+
+        async for d in cursor:
+            docs.append(d)
+            if len(docs) >= batch_size:
+                yield columns()
+                docs = []
+        if docs:
+            yield columns()
+
+    async def import_video(self, video: Dict[str, Any], rows: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        """Bulk path for a whole exported video, through the staged ingest writer."""
+        segments = [{**r, "embedding": v} for r, v in zip(rows, np.asarray(embeddings, dtype=np.float32).tolist())]
+        writer = await self.begin_ingest(video["video_id"], video.get("title"))
+        try:
+            await writer.write(segments)
+            transcript = decode_sentences(video["transcript"]) if video.get("transcript") else None
+            await writer.commit(
+                video.get("url"), bool(video.get("is_local_file")), transcript,
+                video.get("created_at"), video.get("segmented_at"),
+            )
+        except BaseException:
+            await writer.abort()
+            raise
+
+    async def get_videos(self, limit: Optional[int] = None, after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """Newest first; `after` is the (created_at, video_id) key the previous page ended on."""
+        q: Dict[str, Any] = {}
+        if after:
+            created_at, video_id = after
+            q = {"$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "video_id": {"$lt": video_id}},
+            ]}
+        cursor = self.videos_col.find(q, projection={**{f: 1 for f in VIDEO_FIELDS}, "_id": 0}).sort(
+            [("created_at", DESCENDING), ("video_id", DESCENDING)]
+        )
+        if limit:
+            cursor = cursor.limit(limit)
         return [doc async for doc in cursor]
 
 
+_store: Any = None
+
+
+class MemoryIngest:
+    """Chunked ingest into the in-memory store: chunks are buffered and applied in one upsert."""
+
+    def __init__(self, store: "InMemoryStore", video_id: str, title: str, model: str) -> None:
+        self.store = store
+        self.video_id = video_id
+        self.title = title
+        self.model = model
+        self.segments: List[Dict[str, Any]] = []
+
+    async def write(self, segments: List[Dict[str, Any]]) -> None:
+        self.segments.extend(segments)
+
+    async def commit(
+        self,
+        url: Optional[str] = None,
+        is_local_file: bool = False,
+        sentences: Optional[List[tuple]] = None,
+        created_at: Optional[str] = None,
+        segmented_at: Optional[str] = None,
+    ) -> None:
+        # the store checks the model again under its log lock, after picking up other processes' switches
+        await self.store.upsert_segments(
+            self.video_id, self.title, self.segments, url, is_local_file, sentences, created_at, segmented_at,
+            self.model,
+        )
+
+    async def abort(self) -> None:
+        self.segments = []
+
+
+class MongoIngest:
+    """
+    Chunked ingest of one video. Each chunk is bulk-inserted straight away but staged
+    (v_from = STAGED_VERSION, tagged with this ingest's id) so no reader sees it; commit() gives
+    the staged documents the next library version, retires vanished segments and publishes, as
+    one upsert_segments call would. Segments already live are not written again.
+    """
+
+    def __init__(self, store: "MongoStore", video_id: str, title: str, live: Set[str], model: str) -> None:
+        self.store = store
+        self.video_id = video_id
+        self.title = title
+        self.live = live
+        self.model = model
+        self.ingest_id = uuid4().hex
+        self.seen: Set[str] = set()
+        self.inserted = 0
+        self._vectors: List[List[float]] = []
+
+    async def write(self, segments: List[Dict[str, Any]]) -> None:
+        inserts = []
+        for s in segments:
+            s["video_id"] = self.video_id
+            s["title"] = self.title
+            s.setdefault("text_hash", text_hash(s.get("text", "")))
+            s["segment_key"] = s.get("segment_key") or segment_key(s)
+            if s["segment_key"] in self.seen:
+                continue
+            self.seen.add(s["segment_key"])
+            if s.get("embedding"):
+                self._vectors.append(s["embedding"])
+            if s["segment_key"] not in self.live:
+                inserts.append(InsertOne(
+                    {**s, "v_from": STAGED_VERSION, "v_to": LIVE_VERSION, "ingest_id": self.ingest_id}
+                ))
+        await self.store._bulk_write(inserts)
+        self.inserted += len(inserts)
+
+    async def commit(
+        self,
+        url: Optional[str] = None,
+        is_local_file: bool = False,
+        sentences: Optional[List[tuple]] = None,
+        created_at: Optional[str] = None,
+        segmented_at: Optional[str] = None,
+    ) -> None:
+        store, video_id, title = self.store, self.video_id, self.title
+        async with store._write_lock:
+            model = await store.embedding_model()
+            if model != self.model:
+                raise EmbeddingSpaceChanged(f"Library moved to {model} during ingest of {video_id}; retry")
+            new_v = await store._next_version()
+            await store.col.update_many(
+                {"video_id": video_id, "ingest_id": self.ingest_id},
+                {"$set": {"v_from": new_v}, "$unset": {"ingest_id": ""}},
+            )
+
+            retired = sorted(await store._live_keys(video_id) - self.seen)
+            chunk = max(1, settings.BULK_WRITE_CHUNK)
+            retires = [
+                UpdateMany(
+                    {"video_id": video_id, "segment_key": {"$in": retired[i:i + chunk]}, "v_to": LIVE_VERSION},
+                    {"$set": {"v_to": new_v}},
+                )
+                for i in range(0, len(retired), chunk)
+            ]
+            await store._bulk_write(retires)
+            await store.col.update_many(
+                {"video_id": video_id, "v_to": LIVE_VERSION, "title": {"$ne": title}}, {"$set": {"title": title}}
+            )
+
+            # Store video metadata, then publish the new version
+            video_info = {
+                "video_id": video_id,
+                "title": title,
+                "url": url,
+                "created_at": created_at or datetime.now().isoformat(),
+                "is_local_file": is_local_file
+            }
+            c = centroid(np.asarray(self._vectors, dtype=np.float32))
+            if segmented_at:
+                video_info["segmented_at"] = segmented_at
+            if c is not None:
+                video_info["centroid"] = c.tolist()
+            if sentences:
+                video_info["transcript"] = encode_sentences(sentences)
+            await store.videos_col.replace_one({"video_id": video_id}, video_info, upsert=True)
+            await store.meta_col.update_one({"_id": "library"}, {"$max": {"version": new_v}})
+            # drop documents retired by earlier publishes (in-flight readers may still see this one's)
+            await store.col.delete_many({"video_id": video_id, "v_to": {"$lt": new_v}})
+            logger.info(f"Re-indexed {video_id}: {self.inserted} inserted, {len(retired)} retired, "
+                        f"{len(self.seen) - self.inserted} unchanged (version {new_v})")
+
+    async def abort(self) -> None:
+        await self.store.col.delete_many({"video_id": self.video_id, "ingest_id": self.ingest_id})
+
+
+class MemoryMigration:
+    """
+    Re-embedding of the in-memory library: each video's new vectors are built into tables on the
+    side, and commit() swaps all shards, centroids and the model in one step (then snapshots, so the
+    log of the new generation only holds vectors of the new model).
+    """
+
+    def __init__(self, store: "InMemoryStore", model: str) -> None:
+        self.store = store
+        self.model = model
+        self.staged: Dict[str, tuple] = {}
+
+    async def write(self, video: Dict[str, Any], segments: List[Dict[str, Any]], vectors: List[List[float]]) -> None:
+        store = self.store
+        embeddings = np.asarray(vectors, dtype=np.float32).reshape(len(segments), -1)
+        table = SegmentTable.from_segments(
+            video["video_id"], video.get("title"), segments, embeddings, store._storage, keep_exact=store._rescore
+        )
+        self.staged[video["video_id"]] = (table, centroid(embeddings))
+
+    async def commit(self, version: int) -> bool:
+        """Swap the staged library in; False if the library changed since `version` (stage again)."""
+        store = self.store
+
+        def unchanged() -> bool:
+            if store._shared:
+                # upserts other workers logged before the switch count as changes, not as stale vectors
+                store.sync()
+            return store._version == version and not set(store._videos) - set(self.staged)
+
+        async with store._log_lock:
+            # with a snapshot dir the model is switched under the log lock: from then on, upserts
+            # embedded with the old model are refused instead of logged and dropped on replay
+            if not (store._snapshots.switch_model(self.model, unchanged) if store._snapshots else unchanged()):
+                return False
+            self._swap()
+        await store.snapshot()
+        store.schedule_projection_fit()
+        return True
+
+    def _swap(self) -> None:
+        store = self.store
+        by_shard: Dict[int, List[SegmentTable]] = {}
+        centroids: Dict[str, np.ndarray] = {}
+        for video_id in store._videos:
+            table, c = self.staged[video_id]
+            by_shard.setdefault(store._shard_of(video_id), []).append(table)
+            if c is not None:
+                centroids[video_id] = c
+        store._shards = [concat_tables(by_shard.get(i, []), store._storage) for i in range(store._nshards)]
+        store._centroids = centroids
+        # the projection belongs to the old embedding space
+        store._projection = None
+        store._model = self.model
+        store._version += 1
+        store._dirty = True
+
+    async def abort(self) -> None:
+        self.staged = {}
+
+    async def collect(self) -> None:
+        pass
+
+
+class MongoMigration:
+    """
+    Re-embedding of the Mongo library: every video's segments are copied, with vectors of the new
+    model, into staged documents (invisible to readers); commit() publishes them and retires the
+    old ones under a single new version, together with the model switch. collect() deletes the
+    old documents once in-flight readers are done with them.
+    """
+
+    def __init__(self, store: "MongoStore", model: str) -> None:
+        self.store = store
+        self.model = model
+        self.ingest_id = MIGRATION_PREFIX + uuid4().hex
+        self.centroids: Dict[str, Optional[np.ndarray]] = {}
+        self.version: Optional[int] = None
+
+    async def write(self, video: Dict[str, Any], segments: List[Dict[str, Any]], vectors: List[List[float]]) -> None:
+        video_id = video["video_id"]
+        # a video re-ingested since it was last staged is staged again from scratch
+        await self.store.col.delete_many({"video_id": video_id, "ingest_id": self.ingest_id})
+        skip = ("_id", "embedding", "v_from", "v_to", "ingest_id", "score")
+        await self.store._bulk_write([
+            InsertOne({
+                **{k: v for k, v in s.items() if k not in skip},
+                "embedding": vec, "v_from": STAGED_VERSION, "v_to": LIVE_VERSION, "ingest_id": self.ingest_id,
+            })
+            for s, vec in zip(segments, vectors)
+        ])
+        self.centroids[video_id] = centroid(np.asarray(vectors, dtype=np.float32))
+
+    async def commit(self, version: int) -> bool:
+        """Publish the staged library; False if the library changed since `version` (stage again)."""
+        store = self.store
+        async with store._write_lock:
+            if await store.library_version() != version:
+                return False
+            new_v = await store._next_version()
+            await store.col.update_many(
+                {"ingest_id": self.ingest_id}, {"$set": {"v_from": new_v}, "$unset": {"ingest_id": ""}}
+            )
+            await store.col.update_many(
+                {"v_from": {"$lt": new_v}, "v_to": LIVE_VERSION}, {"$set": {"v_to": new_v}}
+            )
+            for video_id, c in self.centroids.items():
+                change = {"$set": {"centroid": c.tolist()}} if c is not None else {"$unset": {"centroid": ""}}
+                await store.videos_col.update_one({"video_id": video_id}, change)
+            await store.meta_col.update_one(
+                {"_id": "library"}, {"$max": {"version": new_v}, "$set": {"model": self.model}}
+            )
+            self.version = new_v
+        return True
+
+    async def abort(self) -> None:
+        await self.store.col.delete_many({"ingest_id": self.ingest_id})
+
+    async def collect(self) -> None:
+        if self.version is not None:
+            await self.store.col.delete_many({"v_to": {"$lte": self.version}})
+
+
+def set_store(store: Any) -> None:
+    """Install `store` as the process-wide store (used by scripts and tests)."""
+    global _store
+    _store = store
+
+
 async def get_store() -> Any:
+    global _store
+    if _store is not None:
+        return _store
     try:
         store = MongoStore()
         await store.ensure_indexes()
         logger.info("Using MongoStore")
-        return store
     except Exception as e:
         logger.warning(f"Mongo unavailable, using InMemoryStore: {e}")
-        return InMemoryStore()
+        store = InMemoryStore(snapshot_dir=settings.SNAPSHOT_DIR)
+        store.start_snapshots(settings.SNAPSHOT_INTERVAL_S)
+        store.schedule_projection_fit()
+    _store = store
+    return store
+
+
+async def close_store() -> None:
+    """Flush and release the process-wide store (called on app shutdown)."""
+    global _store
+    if _store is not None and hasattr(_store, "close"):
+        await _store.close()
+    _store = None
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from typing import List, Optional
+import time
+
+from .metrics import inc_counter
+
+
+class Deadline:
+    """
+    Per-request latency budget threaded through the search path. Stages ask how much time is
+    left and record the shortcuts they took, which are returned to the client.
+    """
+
+    def __init__(self, budget_ms: Optional[float]) -> None:
+        self._end = time.perf_counter() + budget_ms / 1000.0 if budget_ms else None
+        self.degradations: List[str] = []
+
+    @property
+    def bounded(self) -> bool:
+        return self._end is not None
+
+    def remaining_ms(self) -> Optional[float]:
+        if self._end is None:
+            return None
+        return max(0.0, (self._end - time.perf_counter()) * 1000.0)
+
+    def has(self, ms: float) -> bool:
+        """True if at least `ms` remain (always true without a budget)."""
+        remaining = self.remaining_ms()
+        return remaining is None or remaining >= ms
+
+    @property
+    def expired(self) -> bool:
+        return not self.has(0.001)
+
+    def degrade(self, name: str) -> None:
+        if name not in self.degradations:
+            self.degradations.append(name)
+            inc_counter(f"search_degraded:{name}")
+
+
+def resolve_deadline(body_ms: Optional[float], header_ms: Optional[float], default_ms: Optional[float]) -> Deadline:
+    """The tightest of the request field, the X-Deadline-Ms header and the configured default."""
+    budgets = [b for b in (body_ms, header_ms, default_ms) if b]
+    return Deadline(min(budgets) if budgets else None)
@@ -1,26 +1,32 @@
 from __future__ import annotations
 
-from typing import List
+from typing import TYPE_CHECKING, Dict, List, Optional
 from loguru import logger
 
-from sentence_transformers import SentenceTransformer
 from ..config import settings
 
-_model: SentenceTransformer | None = None
+if TYPE_CHECKING:  # imported on first use; sentence_transformers pulls in torch
+    from sentence_transformers import SentenceTransformer
 
+# loaded models by name; during an embedding migration the serving and the target model are both here
+_models: Dict[str, SentenceTransformer] = {}
 
-def get_model() -> SentenceTransformer:
-    global _model
-    if _model is None:
-        logger.info(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
-        _model = SentenceTransformer(settings.EMBEDDING_MODEL)
-    return _model
 
+def get_model(name: Optional[str] = None) -> SentenceTransformer:
+    name = name or settings.EMBEDDING_MODEL
+    if name not in _models:
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Loading embedding model: {name}")
+        _models[name] = SentenceTransformer(name)
+    return _models[name]
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    model = get_model()
-    vectors = model.encode(texts, normalize_embeddings=True).tolist()
-    return vectors
 
+def model_loaded(name: Optional[str] = None) -> bool:
+    return (name or settings.EMBEDDING_MODEL) in _models
 
 
+def embed_texts(texts: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+    model = get_model(model_name)
+    vectors = model.encode(texts, normalize_embeddings=True).tolist()
+    return vectors
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import time
+from datetime import datetime
+
+from loguru import logger
+
+from ..config import settings
+from .admission import limiter
+from .db import get_store
+from .metrics import inc_counter, observe_histogram
+from .query_log import schedule_warm
+from .search import embed_segments
+from .transcript import SegmentStream, WhisperSource, segment_transcript
+
+Sentences = List[Tuple[float, float, str]]
+_END = object()
+
+
+class StageStats:
+    """Items handled and time spent busy (not waiting on a queue) by one pipeline stage."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.busy_s = 0.0
+
+    def record(self, items: int, seconds: float) -> None:
+        self.items += items
+        self.busy_s += seconds
+        inc_counter(f"ingest_items:{self.name}", items)
+        observe_histogram(f"ingest_stage_ms:{self.name}", seconds * 1000)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy_s, 3),
+            "items_per_s": round(self.items / self.busy_s, 1) if self.busy_s else 0.0,
+        }
+
+
+async def run_ingest_pipeline(
+    video_id: str,
+    title: str,
+    source: Iterator[Sentences],
+    url: Optional[str] = None,
+    is_local_file: bool = False,
+    window: float = 30.0,
+    overlap: float = 15.0,
+) -> Dict[str, Any]:
+    """
+    Index a video while it is still being transcribed. Three stages joined by bounded queues:
+
+      transcribe: pull sentence batches from `source` (a blocking iterator, run in a thread) and cut
+                  them into windows as soon as they can no longer change
+      embed:      embed up to INGEST_EMBED_BATCH windows at a time, reusing stored vectors
+      write:      hand each embedded batch to the store's staged ingest writer
+
+    The new segments only become searchable on commit, after the last batch is written, so a
+    failed ingest leaves the previous version of the video in place. The sentences are stored with
+    the video, for resegment_video(). Returns per-stage stats.
+    """
+    store = await get_store()
+    writer = await store.begin_ingest(video_id, title)
+    to_embed: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.INGEST_QUEUE_SIZE))
+    to_write: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.INGEST_QUEUE_SIZE))
+    stats = {name: StageStats(name) for name in ("transcribe", "embed", "write")}
+    batch = max(1, settings.INGEST_EMBED_BATCH)
+    transcript: Sentences = []
+
+    async def emit(segments: List[Dict[str, Any]]) -> None:
+        for i in range(0, len(segments), batch):
+            await to_embed.put(segments[i:i + batch])
+
+    async def transcribe() -> None:
+        stream = SegmentStream(window=window, overlap=overlap)
+        async with limiter("transcribe").slot():
+            while True:
+                t = time.perf_counter()
+                sentences = await asyncio.to_thread(next, source, _END)
+                if sentences is _END:
+                    break
+                transcript.extend(sentences)
+                segments = stream.push(sentences)
+                stats["transcribe"].record(len(sentences), time.perf_counter() - t)
+                await emit(segments)
+        await emit(stream.finish())
+        await to_embed.put(_END)
+
+    async def embed() -> None:
+        while True:
+            segments = await to_embed.get()
+            if segments is _END:
+                break
+            t = time.perf_counter()
+            await embed_segments(video_id, title, segments, writer.model)
+            stats["embed"].record(len(segments), time.perf_counter() - t)
+            await to_write.put(segments)
+        await to_write.put(_END)
+
+    async def write() -> None:
+        while True:
+            segments = await to_write.get()
+            if segments is _END:
+                break
+            t = time.perf_counter()
+            await writer.write(segments)
+            stats["write"].record(len(segments), time.perf_counter() - t)
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(stage()) for stage in (transcribe, embed, write)]
+    try:
+        await asyncio.gather(*tasks)
+        if not stats["write"].items:
+            raise Exception("No meaningful content segments were created from the transcript. The video might not contain speech or the content might be too short.")
+        t = time.perf_counter()
+        await writer.commit(url, is_local_file, transcript)
+        stats["write"].record(0, time.perf_counter() - t)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await writer.abort()
+        raise
+
+    wall = time.perf_counter() - start
+    observe_histogram("ingest_wall_ms", wall * 1000)
+    report = {
+        "segments": stats["write"].items,
+        "wall_s": round(wall, 3),
+        "stages": {name: s.summary() for name, s in stats.items()},
+    }
+    busiest = max(stats.values(), key=lambda s: s.busy_s)
+    logger.info(f"Ingested {video_id}: {report['segments']} segments in {wall:.2f}s "
+                f"(slowest stage {busiest.name} busy {busiest.busy_s:.2f}s) {report['stages']}")
+    schedule_warm([video_id, None])
+    return report
+
+
+async def ingest_media(
+    video_id: str,
+    title: str,
+    file_path: str,
+    url: Optional[str] = None,
+    is_local_file: bool = False,
+) -> Dict[str, Any]:
+    """
+    Transcribe the speech in a local media file with Whisper in INGEST_AUDIO_CHUNK_S chunks and
+    index it as it goes. The report's "audio" entry says how much silence was skipped.
+    """
+    source = WhisperSource(file_path, chunk_s=settings.INGEST_AUDIO_CHUNK_S, vad=settings.VAD_ENABLED)
+    report = await run_ingest_pipeline(video_id, title, source, url, is_local_file)
+    report["audio"] = source.summary()
+    return report
+
+
+async def resegment_video(video_id: str, window: float, overlap: float) -> Dict[str, Any]:
+    """
+    Rebuild a video's windows from its stored sentence-level transcript with new `window` /
+    `overlap`, without transcribing again. Windows whose text is already indexed reuse their
+    vectors; only new ones are embedded, and unchanged segments are not rewritten.
+    Raises LookupError for an unknown video and ValueError when no transcript was stored.
+    """
+    store = await get_store()
+    video = await store.get_video(video_id)
+    if video is None:
+        raise LookupError(f"Unknown video: {video_id}")
+    sentences = await store.get_transcript(video_id)
+    if not sentences:
+        raise ValueError(f"No stored transcript for {video_id}; ingest it again once to enable re-segmentation")
+
+    segments = segment_transcript(sentences, window=window, overlap=overlap)
+    if not segments:
+        raise ValueError(f"Re-segmenting {video_id} with window={window}s produced no segments")
+    writer = await store.begin_ingest(video_id, video["title"])
+    batch = max(1, settings.INGEST_EMBED_BATCH)
+    embedded = 0
+    try:
+        for i in range(0, len(segments), batch):
+            chunk = segments[i:i + batch]
+            embedded += await embed_segments(video_id, video["title"], chunk, writer.model)
+            await writer.write(chunk)
+        # the video keeps its place in the history; segmented_at marks the new windows
+        await writer.commit(
+            video.get("url"), bool(video.get("is_local_file")), sentences,
+            video.get("created_at"), datetime.now().isoformat(),
+        )
+    except BaseException:
+        await writer.abort()
+        raise
+    logger.info(f"Re-segmented {video_id} (window={window}s, overlap={overlap}s): "
+                f"{len(segments)} segments, {embedded} embedded")
+    schedule_warm([video_id, None])
+    return {"video_id": video_id, "segments": len(segments), "embedded": embedded,
+            "reused": len(segments) - embedded}
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+from loguru import logger
+
+from .db import get_store
+from .metrics import observe_histogram
+
+# Columnar export of the whole library, to clone it to another node or between MongoStore and
+# InMemoryStore without re-ingesting:
+#
+#   <dir>/videos.parquet    one row per video: video_id, title, url, created_at, segmented_at,
+#                           is_local_file, transcript
+#   <dir>/segments.parquet  one row per segment: video_id, start_time, end_time, text, metadata (JSON),
+#                           embedding as fixed_size_list<float32>[dim]; rows grouped by video
+#
+# The segments file's schema metadata names the embedding model and dimension; both files record
+# the library version they were read at, and an import refuses a pair from different versions.
+# Requires pyarrow.
+
+FORMAT = "lecture-navigator-library/1"
+VIDEOS_FILE = "videos.parquet"
+SEGMENTS_FILE = "segments.parquet"
+TABLES = {"videos": VIDEOS_FILE, "segments": SEGMENTS_FILE}
+DEFAULT_BATCH = 8192
+EXPORT_ATTEMPTS = 3
+
+
+def _arrow() -> Tuple[Any, Any]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Library export/import needs pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def videos_schema() -> Any:
+    pa, _ = _arrow()
+    return pa.schema([
+        ("video_id", pa.string()),
+        ("title", pa.string()),
+        ("url", pa.string()),
+        ("created_at", pa.string()),
+        ("segmented_at", pa.string()),
+        ("is_local_file", pa.bool_()),
+        ("transcript", pa.string()),
+    ])
+
+
+def segments_schema(dim: int, model: str, version: Optional[int] = None) -> Any:
+    pa, _ = _arrow()
+    metadata = {"format": FORMAT, "embedding_model": model, "dim": str(dim)}
+    if version is not None:
+        metadata["library_version"] = str(version)
+    return pa.schema(
+        [
+            ("video_id", pa.dictionary(pa.int32(), pa.string())),
+            ("start_time", pa.float64()),
+            ("end_time", pa.float64()),
+            ("text", pa.string()),
+            ("metadata", pa.string()),
+            ("embedding", pa.list_(pa.float32(), dim)),
+        ],
+        metadata=metadata,
+    )
+
+
+def _record_batch(columns: Dict[str, Any], schema: Any) -> Any:
+    pa, _ = _arrow()
+    emb = np.ascontiguousarray(columns["embedding"], dtype=np.float32)
+    dim = schema.field("embedding").type.list_size
+    return pa.record_batch(
+        [
+            pa.array(columns["video_id"], type=pa.string()).dictionary_encode(),
+            pa.array(columns["start_time"], type=pa.float64()),
+            pa.array(columns["end_time"], type=pa.float64()),
+            pa.array(columns["text"], type=pa.string()),
+            pa.array([json.dumps(m) if m else None for m in columns["metadata"]], type=pa.string()),
+            pa.FixedSizeListArray.from_arrays(pa.array(emb.reshape(-1)), dim),
+        ],
+        schema=schema,
+    )
+
+
+def _file_version(schema: Any) -> Optional[int]:
+    value = (schema.metadata or {}).get(b"library_version")
+    return int(value) if value is not None else None
+
+
+async def export_library(
+    out_dir: str, batch_size: int = DEFAULT_BATCH, tables: Iterable[str] = tuple(TABLES)
+) -> Dict[str, Any]:
+    """
+    Write the library to `out_dir`: VIDEOS_FILE and/or SEGMENTS_FILE, as named by `tables`.
+    Returns counts (None for a table not written) and the library version the export was read at.
+
+    Segments are read at that version; video records are not versioned, so if the library moved
+    on before the export finished it is written again (up to EXPORT_ATTEMPTS times).
+    """
+    tables = set(tables)
+    start = time.perf_counter()
+    store = await get_store()
+    for attempt in range(1, EXPORT_ATTEMPTS + 1):
+        version, model = await store.library_state()
+        report = await _write_tables(store, out_dir, tables, version, model, batch_size)
+        if await store.library_version() == version:
+            break
+        logger.info(f"Library changed from version {version} during the export (attempt {attempt}); exporting again")
+    else:
+        raise RuntimeError(f"Library kept changing during the export; gave up after {EXPORT_ATTEMPTS} attempts")
+
+    elapsed = time.perf_counter() - start
+    observe_histogram("library_export_ms", elapsed * 1000)
+    logger.info(f"Exported {', '.join(sorted(tables))} of library version {version} ({report['videos']} videos, "
+                f"{report['segments']} segments, {model}, dim {report['dim']}) to {out_dir} in {elapsed:.1f}s")
+    return report
+
+
+async def _write_tables(
+    store: Any, out_dir: str, tables: set, version: int, model: str, batch_size: int
+) -> Dict[str, Any]:
+    pa, pq = _arrow()
+    os.makedirs(out_dir, exist_ok=True)
+
+    videos = None
+    if "videos" in tables:
+        rows = await store.dump_videos()
+        schema = videos_schema().with_metadata({"format": FORMAT, "library_version": str(version)})
+        table = pa.Table.from_pylist([{f: v.get(f) for f in schema.names} for v in rows], schema=schema)
+        await asyncio.to_thread(pq.write_table, table, os.path.join(out_dir, VIDEOS_FILE))
+        videos = len(rows)
+
+    segments = None
+    dim = 0
+    if "segments" in tables:
+        seg_path = os.path.join(out_dir, SEGMENTS_FILE)
+        writer = None
+        segments = 0
+        try:
+            async for columns in store.dump_segments(batch_size, version):
+                if writer is None:
+                    dim = int(columns["embedding"].shape[1])
+                    writer = pq.ParquetWriter(seg_path, segments_schema(dim, model, version))
+                await asyncio.to_thread(writer.write_batch, _record_batch(columns, writer.schema))
+                segments += len(columns["video_id"])
+            if writer is None:
+                # empty library: a valid file with no rows
+                writer = pq.ParquetWriter(seg_path, segments_schema(0, model, version))
+        finally:
+            if writer is not None:
+                writer.close()
+    return {"videos": videos, "segments": segments, "embedding_model": model, "dim": dim, "library_version": version}
+
+
+def _video_runs(batch: Any) -> Iterator[Tuple[str, int, int]]:
+    """(video_id, start, stop) of each run of consecutive rows of one video in a record batch."""
+    ids = batch.column("video_id")
+    if hasattr(ids, "dictionary"):
+        names = ids.dictionary.to_pylist()
+        codes = ids.indices.to_numpy(zero_copy_only=False)
+    else:
+        names, codes = np.unique(ids.to_numpy(zero_copy_only=False), return_inverse=True)
+        names = list(names)
+    if not len(codes):
+        return
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [len(codes)]))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        yield names[int(codes[lo])], int(lo), int(hi)
+
+
+async def import_library(in_dir: str, batch_size: int = DEFAULT_BATCH) -> Dict[str, Any]:
+    """
+    Load an export_library() directory into the current store. Record batches are streamed from
+    the segments file; each video's rows go to the store's bulk import path as one (n, dim)
+    float32 array, read straight from the Arrow buffers. Imported videos replace existing ones with
+    the same id. An empty library adopts the export's embedding model; a non-empty one must
+    already use it.
+    """
+    pa, pq = _arrow()
+    start = time.perf_counter()
+    store = await get_store()
+    seg_file = pq.ParquetFile(os.path.join(in_dir, SEGMENTS_FILE))
+    meta = {k.decode(): v.decode() for k, v in (seg_file.schema_arrow.metadata or {}).items()}
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"{in_dir} is not a library export (format {meta.get('format')!r})")
+    table = await asyncio.to_thread(pq.read_table, os.path.join(in_dir, VIDEOS_FILE))
+    versions = (_file_version(table.schema), _file_version(seg_file.schema_arrow))
+    if None not in versions and versions[0] != versions[1]:
+        raise ValueError(
+            f"{VIDEOS_FILE} (library version {versions[0]}) and {SEGMENTS_FILE} (version {versions[1]}) "
+            "come from different exports"
+        )
+    model = meta["embedding_model"]
+    if model != await store.embedding_model():
+        await store.adopt_embedding_model(model)
+
+    videos = {v["video_id"]: {k: x for k, x in v.items() if x is not None} for v in table.to_pylist()}
+
+    pending: Optional[Tuple[str, List[Dict[str, Any]], List[np.ndarray]]] = None
+    imported: List[str] = []
+    segments = 0
+
+    async def flush() -> None:
+        video_id, rows, parts = pending
+        video = videos.get(video_id) or {"video_id": video_id, "title": video_id}
+        await store.import_video(video, rows, np.concatenate(parts))
+        imported.append(video_id)
+
+    batches = seg_file.iter_batches(batch_size=batch_size)
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+        emb_col = batch.column("embedding")
+        dim = emb_col.type.list_size
+        emb = emb_col.flatten().to_numpy(zero_copy_only=False).reshape(-1, dim) if dim else np.zeros((len(batch), 0), dtype=np.float32)
+        starts = batch.column("start_time").to_numpy(zero_copy_only=False)
+        ends = batch.column("end_time").to_numpy(zero_copy_only=False)
+        texts = batch.column("text").to_pylist()
+        metadata = batch.column("metadata").to_pylist()
+        for video_id, lo, hi in _video_runs(batch):
+            rows = [
+                {"start_time": float(starts[i]), "end_time": float(ends[i]), "text": texts[i] or "",
+                 "metadata": json.loads(metadata[i]) if metadata[i] else {}}
+                for i in range(lo, hi)
+            ]
+            if pending is not None and pending[0] == video_id:
+                pending[1].extend(rows)
+                pending[2].append(emb[lo:hi])
+            else:
+                if pending is not None:
+                    await flush()
+                pending = (video_id, rows, [emb[lo:hi]])
+        segments += len(batch)
+    if pending is not None:
+        await flush()
+
+    elapsed = time.perf_counter() - start
+    observe_histogram("library_import_ms", elapsed * 1000)
+    logger.info(f"Imported {len(imported)} videos, {segments} segments ({model}) from {in_dir} in {elapsed:.1f}s")
+    return {"videos": len(imported), "segments": segments, "embedding_model": model}
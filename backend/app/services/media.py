@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from typing import Iterable, List, Optional
+import asyncio
+import os
+import shutil
+import subprocess
+
+from loguru import logger
+
+from ..config import settings
+from .admission import Overloaded, limiter
+from .db import get_store
+
+# Post-ingest playback preparation for uploaded files (requires ffmpeg):
+#   faststart: <uploads>/<stem>.faststart.mp4   moov atom first, so playback starts without a full fetch
+#   hls:       <uploads>/hls/<video_id>/index.m3u8 + seg_00000.ts ...
+# In both cases serve_video / serve_hls pick the prepared files up when they exist.
+
+FASTSTART_SUFFIX = ".faststart.mp4"
+
+
+def faststart_path(uploads_dir: str, filename: str) -> str:
+    return os.path.join(uploads_dir, os.path.splitext(filename)[0] + FASTSTART_SUFFIX)
+
+
+def hls_dir(uploads_dir: str, video_id: str) -> str:
+    return os.path.join(uploads_dir, "hls", video_id)
+
+
+def keyframe_times(starts: Iterable[float], min_gap_s: float = 1.0) -> List[float]:
+    """Sorted segment start times at least `min_gap_s` apart, to be forced as keyframes."""
+    out: List[float] = []
+    for t in sorted(float(s) for s in starts if s is not None and s >= 0):
+        if not out or t - out[-1] >= min_gap_s:
+            out.append(round(t, 3))
+    return out
+
+
+def _encode_args(keyframes: List[float]) -> List[str]:
+    args = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-c:a", "aac", "-b:a", "128k"]
+    if keyframes:
+        args += ["-force_key_frames", ",".join(f"{t:g}" for t in keyframes)]
+    return args
+
+
+def faststart_commands(src: str, dst: str, keyframes: List[float]) -> List[List[str]]:
+    """ffmpeg invocations to try in order: a lossless remux, then a re-encode for codecs MP4 can't carry."""
+    base = ["ffmpeg", "-y", "-v", "error", "-i", src]
+    tail = ["-movflags", "+faststart", "-f", "mp4", dst]
+    return [
+        base + ["-map", "0:v:0?", "-map", "0:a:0?", "-c", "copy"] + tail,
+        base + ["-map", "0:v:0?", "-map", "0:a:0?"] + _encode_args(keyframes) + tail,
+    ]
+
+
+def hls_command(src: str, out_dir: str, keyframes: List[float], segment_s: float) -> List[str]:
+    """Re-encode into HLS; forced keyframes at segment starts make every start_time a cut point."""
+    return [
+        "ffmpeg", "-y", "-v", "error", "-i", src, "-map", "0:v:0?", "-map", "0:a:0?",
+        *_encode_args(keyframes),
+        "-f", "hls", "-hls_time", f"{segment_s:g}", "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(out_dir, "seg_%05d.ts"),
+        os.path.join(out_dir, "index.m3u8"),
+    ]
+
+
+def _run(cmd: List[str]) -> None:
+    subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+
+def prepare_faststart(src: str, dst: str, keyframes: List[float]) -> None:
+    """Blocking; writes `dst` atomically."""
+    tmp = dst + ".tmp"
+    last: Optional[Exception] = None
+    for cmd in faststart_commands(src, tmp, keyframes):
+        try:
+            _run(cmd)
+            os.replace(tmp, dst)
+            return
+        except subprocess.CalledProcessError as e:
+            last = Exception(e.stderr.strip() or str(e))
+    if os.path.exists(tmp):
+        os.unlink(tmp)
+    raise Exception(f"ffmpeg could not produce a fast-start MP4: {last}")
+
+
+def prepare_hls(src: str, out_dir: str, keyframes: List[float], segment_s: float) -> None:
+    """Blocking; builds the rendition next to `out_dir` and swaps it in when complete."""
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        _run(hls_command(src, tmp, keyframes, segment_s))
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise Exception(f"ffmpeg could not segment to HLS: {e.stderr.strip() or e}")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+
+
+async def prepare_playback(video_id: str, uploads_dir: str, filename: str) -> None:
+    """
+    Post-ingest stage for an uploaded file, per MEDIA_PLAYBACK ("faststart", "hls" or "none").
+    Runs as a background task after the upload response; failures are logged and the raw upload
+    keeps being served.
+    """
+    mode = (settings.MEDIA_PLAYBACK or "none").lower()
+    if mode == "none":
+        return
+    src = os.path.join(uploads_dir, filename)
+    try:
+        store = await get_store()
+        segments = await store.list_segments(video_id, limit=100000)
+        keyframes = keyframe_times(s.get("start_time") for s in segments)
+        async with limiter("transcode").slot():
+            if mode == "hls":
+                out = hls_dir(uploads_dir, video_id)
+                os.makedirs(os.path.dirname(out), exist_ok=True)
+                await asyncio.to_thread(prepare_hls, src, out, keyframes, settings.HLS_SEGMENT_S)
+            else:
+                out = faststart_path(uploads_dir, filename)
+                await asyncio.to_thread(prepare_faststart, src, out, keyframes)
+        logger.info(f"Prepared {mode} playback for {video_id} at {out} ({len(keyframes)} keyframes)")
+    except Overloaded:
+        logger.warning(f"Skipping {mode} playback preparation for {video_id}: transcoder busy")
+    except Exception as e:
+        logger.warning(f"Playback preparation failed for {video_id}: {e}")
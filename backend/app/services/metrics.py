@@ -8,6 +8,7 @@ import time
 _lock = threading.Lock()
 _counters: Dict[str, int] = defaultdict(int)
 _histograms: Dict[str, List[float]] = defaultdict(list)
+_gauges: Dict[str, float] = {}
 
 
 def inc_counter(name: str, value: int = 1) -> None:
@@ -20,10 +21,16 @@ def observe_histogram(name: str, value_ms: float) -> None:
         _histograms[name].append(float(value_ms))
 
 
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = float(value)
+
+
 def snapshot() -> Dict[str, object]:
     with _lock:
         return {
             "counters": dict(_counters),
+            "gauges": dict(_gauges),
             "histograms": {k: _summary(v) for k, v in _histograms.items()},
         }
 
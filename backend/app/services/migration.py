@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import time
+from datetime import datetime
+
+from loguru import logger
+
+from ..config import settings
+from .admission import Overloaded, limiter
+from .db import get_store
+from .metrics import inc_counter, observe_histogram, set_gauge
+from .search import embed_with
+
+
+class MigrationProgress:
+    """State of the embedding migration in this process, as reported by /api/embedding_migration."""
+
+    def __init__(self) -> None:
+        self.state = "idle"
+        self.source: Optional[str] = None
+        self.target: Optional[str] = None
+        self.segments_total = 0
+        self.segments_done = 0
+        self.videos_done = 0
+        self.started_at: Optional[str] = None
+        self.error: Optional[str] = None
+        self._start = 0.0
+        self._elapsed = 0.0
+
+    def begin(self, source: str, target: str, segments_total: int) -> None:
+        self.__init__()
+        self.state = "running"
+        self.source, self.target = source, target
+        self.segments_total = segments_total
+        self.started_at = datetime.now().isoformat()
+        self._start = time.perf_counter()
+        self._publish()
+
+    def record(self, segments: int, seconds: float) -> None:
+        self.segments_done += segments
+        inc_counter("embedding_migration_segments", segments)
+        observe_histogram("embedding_migration_batch_ms", seconds * 1000)
+        self._publish()
+
+    def end(self, state: str, error: Optional[str] = None) -> None:
+        self.state = state
+        self.error = error
+        self._elapsed = time.perf_counter() - self._start
+        self._publish()
+
+    def elapsed_s(self) -> float:
+        return time.perf_counter() - self._start if self.state == "running" else self._elapsed
+
+    def segments_per_s(self) -> float:
+        elapsed = self.elapsed_s()
+        return self.segments_done / elapsed if elapsed > 0 else 0.0
+
+    def fraction(self) -> float:
+        if self.state == "done":
+            return 1.0
+        return min(1.0, self.segments_done / self.segments_total) if self.segments_total else 0.0
+
+    def _publish(self) -> None:
+        set_gauge("embedding_migration_progress", self.fraction())
+        set_gauge("embedding_migration_segments_per_s", self.segments_per_s())
+        set_gauge("embedding_migration_running", 1.0 if self.state == "running" else 0.0)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "source_model": self.source,
+            "target_model": self.target,
+            "segments_total": self.segments_total,
+            "segments_done": self.segments_done,
+            "videos_done": self.videos_done,
+            "progress": round(self.fraction(), 4),
+            "segments_per_s": round(self.segments_per_s(), 1),
+            "elapsed_s": round(self.elapsed_s(), 1),
+            "started_at": self.started_at,
+            "error": self.error,
+        }
+
+
+progress = MigrationProgress()
+
+
+async def _embed_batch(texts: List[str], model: str) -> List[List[float]]:
+    # background work: wait out a busy embedder instead of failing
+    while True:
+        try:
+            async with limiter("embed").slot():
+                return await asyncio.to_thread(embed_with, texts, model)
+        except Overloaded as e:
+            await asyncio.sleep(e.retry_after_s)
+
+
+def _stamp(video: Dict[str, Any]) -> tuple:
+    """Changes whenever the video's segments were rewritten: re-ingested or re-segmented."""
+    return video.get("created_at"), video.get("segmented_at")
+
+
+async def migrate_embeddings(target: Optional[str] = None, gc_grace_s: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Re-embed the whole library with `target` (default EMBEDDING_MODEL) if it is in another model.
+
+    Videos are re-embedded MIGRATION_BATCH texts at a time under the "embed" admission limit and
+    staged by the store, while searches keep being answered from the old vectors with the old
+    model. Videos re-ingested meanwhile are staged again; once a pass finds nothing new, the store
+    switches vectors and model in one step. With `gc_grace_s`, the old vectors are deleted that
+    long after the switch. Returns the progress report.
+    """
+    store = await get_store()
+    target = target or settings.EMBEDDING_MODEL
+    source = await store.embedding_model()
+    if source == target:
+        return progress.report()
+    migration = await store.begin_migration(target)
+    if migration is None:
+        logger.info(f"Embedding migration {source} -> {target} is left to the snapshot writer process")
+        return progress.report()
+
+    progress.begin(source, target, await store.count_segments())
+    logger.info(f"Migrating {progress.segments_total} segments from {source} to {target}")
+    batch = max(1, settings.MIGRATION_BATCH)
+    # video_id -> (created_at, segmented_at) of the version that was staged
+    staged: Dict[str, Any] = {}
+    # switches lost in a row with nothing new to stage (deletes and other writes bump the version)
+    lost = 0
+    try:
+        while True:
+            version, _ = await store.library_state()
+            todo = [v for v in await store.get_videos() if staged.get(v["video_id"]) != _stamp(v)]
+            if not todo:
+                if await migration.commit(version):
+                    break
+                lost += 1
+                if lost >= settings.MIGRATION_COMMIT_RETRIES:
+                    raise RuntimeError(f"library kept changing; gave up switching to {target} after {lost} attempts")
+                delay = min(5.0, max(settings.MIGRATION_PAUSE_S, 0.05) * 2 ** lost)
+                logger.info(f"Library changed during the switch to {target}; retrying in {delay:.2f}s ({lost})")
+                await asyncio.sleep(delay)
+                continue
+            lost = 0
+            for video in todo:
+                segments = await store.list_segments(video["video_id"], limit=10 ** 9)
+                vectors: List[List[float]] = []
+                for i in range(0, len(segments), batch):
+                    texts = [s.get("text") or "" for s in segments[i:i + batch]]
+                    t = time.perf_counter()
+                    vectors += await _embed_batch(texts, target)
+                    progress.record(len(texts), time.perf_counter() - t)
+                    await asyncio.sleep(settings.MIGRATION_PAUSE_S)
+                await migration.write(video, segments, vectors)
+                staged[video["video_id"]] = _stamp(video)
+                progress.videos_done += 1
+    except BaseException as e:
+        await migration.abort()
+        progress.end("failed", str(e) or type(e).__name__)
+        raise
+    progress.end("done")
+    logger.info(f"Switched the library to {target}: {progress.segments_done} segments re-embedded in "
+                f"{progress.elapsed_s():.1f}s ({progress.segments_per_s():.0f}/s)")
+    report = progress.report()
+    if gc_grace_s is not None:
+        # searches that read the old version just before the switch may still be fetching old vectors
+        await asyncio.sleep(gc_grace_s)
+        await migration.collect()
+    return report
+
+
+async def run_migration() -> None:
+    """migrate_embeddings() as a background task (started by the app lifespan); errors are logged."""
+    try:
+        await migrate_embeddings(gc_grace_s=settings.MIGRATION_GC_GRACE_S)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Embedding migration failed; still serving the old model: {e}")
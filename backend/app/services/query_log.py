@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+
+from loguru import logger
+
+from ..config import settings
+from .metrics import inc_counter, set_gauge
+
+# Which questions get asked about which lecture, so caches can be refilled before students ask
+# them again. After startup, and after a video is (re)indexed, a background warmer replays each
+# video's most frequent queries through the search path; that fills the query-embedding and
+# re-rank score caches. Generating answers costs an LLM call per query, so replays only fill the
+# answer cache with QUERY_WARM_ANSWERS, at most QUERY_WARM_ANSWER_MAX per pass. The warmer only
+# runs while no live search is in flight.
+#
+# The log keeps normalized query text, k and a count per video (library-wide searches under ""),
+# nothing about who asked or when. E-mail addresses and long digit runs are masked.
+
+LIBRARY = ""
+FILE_NAME = "query_log.json"
+
+_EMAIL = re.compile(r"\S+@\S+\.\w+")
+_DIGITS = re.compile(r"\d{5,}")
+
+
+def anonymize(query: str) -> str:
+    q = " ".join(query.lower().split())
+    q = _EMAIL.sub("<email>", q)
+    return _DIGITS.sub("<number>", q)[:200]
+
+
+class QueryLog:
+    """Bounded query frequencies per video: at most `max_queries` per video, `max_videos` videos."""
+
+    def __init__(self, max_queries: int, max_videos: int) -> None:
+        self.max_queries = max_queries
+        self.max_videos = max_videos
+        self._videos: "OrderedDict[str, Dict[Tuple[str, int], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._videos.values())
+
+    def record(self, video_id: Optional[str], query: str, k: int) -> None:
+        if self.max_queries <= 0 or not query.strip():
+            return
+        key = video_id or LIBRARY
+        entry = (anonymize(query), int(k))
+        with self._lock:
+            queries = self._videos.setdefault(key, {})
+            self._videos.move_to_end(key)
+            if entry not in queries and len(queries) >= self.max_queries:
+                # make room by forgetting the least asked (the oldest of equals)
+                del queries[min(queries, key=queries.__getitem__)]
+            queries[entry] = queries.get(entry, 0) + 1
+            while len(self._videos) > self.max_videos:
+                self._videos.popitem(last=False)
+        inc_counter("query_log_recorded")
+
+    def top(self, video_id: Optional[str], n: int) -> List[Tuple[str, int]]:
+        """The `n` most frequent (query, k) of a video, most frequent first."""
+        with self._lock:
+            queries = dict(self._videos.get(video_id or LIBRARY, {}))
+        return sorted(queries, key=queries.__getitem__, reverse=True)[:n]
+
+    def videos(self) -> List[Optional[str]]:
+        with self._lock:
+            return [v or None for v in reversed(self._videos)]
+
+    def dump(self) -> Dict[str, List[List[Any]]]:
+        with self._lock:
+            return {v: [[q, k, c] for (q, k), c in queries.items()] for v, queries in self._videos.items()}
+
+    def load(self, data: Dict[str, List[List[Any]]]) -> None:
+        with self._lock:
+            self._videos.clear()
+            for v, queries in data.items():
+                self._videos[v] = {(q, int(k)): int(c) for q, k, c in queries[: self.max_queries]}
+            while len(self._videos) > self.max_videos:
+                self._videos.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._videos.clear()
+
+
+query_log = QueryLog(settings.QUERY_LOG_SIZE, settings.QUERY_LOG_VIDEOS)
+
+
+def _log_path() -> Optional[str]:
+    return os.path.join(settings.SNAPSHOT_DIR, FILE_NAME) if settings.SNAPSHOT_DIR else None
+
+
+def load_query_log() -> None:
+    """Restore the log saved by the previous run (SNAPSHOT_DIR only)."""
+    path = _log_path()
+    if not path or not os.path.exists(path):
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            query_log.load(json.load(f))
+        logger.info(f"Loaded {len(query_log)} logged queries from {path}")
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable query log {path}: {e}")
+
+
+def save_query_log() -> None:
+    path = _log_path()
+    if not path:
+        return
+    os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(query_log.dump(), f)
+    os.replace(tmp, path)
+
+
+class Traffic:
+    """Live searches in flight, and when the last one ended; the warmer yields to both."""
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.last_end = 0.0
+
+    @contextmanager
+    def live(self) -> Iterator[None]:
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.last_end = time.monotonic()
+
+    def idle(self, quiet_s: float) -> bool:
+        return self.in_flight == 0 and time.monotonic() - self.last_end >= quiet_s
+
+
+traffic = Traffic()
+
+# videos waiting to be warmed, in order (None = library-wide searches)
+_pending: "OrderedDict[Optional[str], None]" = OrderedDict()
+_task: Optional[asyncio.Task] = None
+
+
+def schedule_warm(video_ids: List[Optional[str]]) -> None:
+    """
+    Queue the logged queries of `video_ids` for replay in the background (no-op without logged
+    queries, QUERY_WARM_TOP=0 or a running event loop). Re-indexing a video also invalidates the
+    library-wide answers, so callers usually pass the video and None.
+    """
+    global _task
+    if settings.QUERY_WARM_TOP <= 0:
+        return
+    for video_id in video_ids:
+        if query_log.top(video_id, 1):
+            _pending[video_id] = None
+    if not _pending:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if _task is None or _task.done():
+        _task = loop.create_task(_drain())
+
+
+async def _wait_idle() -> None:
+    quiet = settings.QUERY_WARM_IDLE_S
+    while not traffic.idle(quiet):
+        await asyncio.sleep(max(0.05, quiet / 2))
+
+
+async def warm_query(video_id: Optional[str], query: str, k: int, answer: bool = False) -> bool:
+    """
+    Run one logged query through the search path unless its answer is cached; True if replayed.
+    With `answer`, also generate the answer (an LLM call) and cache it.
+    """
+    from .agent import generate_answer
+    from .answer_cache import answer_cache
+    from .deadline import Deadline
+    from .search import embed_query, index_state, semantic_search
+
+    version, model = await index_state()
+    qv = await asyncio.to_thread(embed_query, query, model)
+    scope = (video_id, k, None, None)
+    if answer_cache.lookup(scope, version, qv, count=False) is not None:
+        return False
+    deadline = Deadline(settings.SEARCH_DEADLINE_MS)
+    docs = await semantic_search(query, k=k, video_id=video_id, deadline=deadline, query_embedding=qv)
+    if answer:
+        text = await generate_answer(query, docs, deadline)
+        if not deadline.degradations and (await index_state())[0] == version:
+            answer_cache.store(scope, version, qv, docs, text)
+        inc_counter("query_warm_answered")
+    inc_counter("query_warm_replayed")
+    return True
+
+
+async def _drain() -> None:
+    # LLM calls left for this pass; the rest of the replays warm the search caches only
+    answers = settings.QUERY_WARM_ANSWER_MAX if settings.QUERY_WARM_ANSWERS else 0
+    while _pending:
+        video_id, _ = _pending.popitem(last=False)
+        start = time.perf_counter()
+        replayed = 0
+        for query, k in query_log.top(video_id, settings.QUERY_WARM_TOP):
+            await _wait_idle()
+            answer = answers > 0
+            try:
+                if await warm_query(video_id, query, k, answer):
+                    replayed += 1
+                    answers -= answer
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                inc_counter("query_warm_failed")
+                logger.warning(f"Warming query for {video_id or 'library'} failed: {e}")
+            await asyncio.sleep(settings.QUERY_WARM_PAUSE_S)
+        set_gauge("query_warm_pending", len(_pending))
+        if replayed:
+            logger.info(f"Warmed {replayed} queries for {video_id or 'library'} in {time.perf_counter() - start:.1f}s")
+
+
+def stop_warming() -> None:
+    _pending.clear()
+    if _task is not None:
+        _task.cancel()
+
+
+def warm_all() -> None:
+    """Queue every logged video, most recently asked first (after startup)."""
+    schedule_warm(query_log.videos())
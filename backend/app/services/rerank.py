@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+import asyncio
+import threading
+import time
+
+from loguru import logger
+
+from ..config import settings
+from .db import segment_key, text_hash
+from .deadline import Deadline
+from .metrics import inc_counter, observe_histogram, set_gauge
+
+if TYPE_CHECKING:  # imported on first use; sentence_transformers pulls in torch
+    from sentence_transformers import CrossEncoder
+
+# Optional second stage of semantic_search: the top RERANK_CANDIDATES bi-encoder hits are scored
+# against the query by a cross-encoder (RERANK_MODEL) in one batched CPU call and reordered.
+# Scores are cached per (query, segment), and the number of pairs scored per request is capped
+# so the expected cost fits RERANK_BUDGET_MS and the request's deadline.
+
+# cost of one predict() call until this process has measured its own: fixed + per uncached pair
+PRIOR_OVERHEAD_MS = 5.0
+PRIOR_MS_PER_PAIR = 3.0
+
+_models: Dict[str, CrossEncoder] = {}
+_models_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(settings.RERANK_MODEL) and settings.RERANK_CANDIDATES > 1
+
+
+def get_reranker(name: Optional[str] = None) -> CrossEncoder:
+    name = name or settings.RERANK_MODEL
+    with _models_lock:
+        if name not in _models:
+            from sentence_transformers import CrossEncoder
+
+            logger.info(f"Loading re-ranking model: {name}")
+            _models[name] = CrossEncoder(name, device="cpu")
+        return _models[name]
+
+
+class ScoreCache:
+    """LRU of cross-encoder scores keyed by (model, query hash, video_id, segment_key)."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[Tuple[str, str, str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def get(self, key: Tuple[str, str, str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def put(self, key: Tuple[str, str, str, str], score: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+
+score_cache = ScoreCache(settings.RERANK_CACHE_SIZE)
+
+# measured cost, moving averages over predict() calls
+_cost = {"overhead_ms": PRIOR_OVERHEAD_MS, "ms_per_pair": PRIOR_MS_PER_PAIR}
+_measured = False
+
+
+def record_cost(pairs: int, ms: float) -> None:
+    """Fold one predict() call into the per-pair cost estimate."""
+    global _measured
+    if pairs <= 0:
+        return
+    per_pair = max(0.0, ms - _cost["overhead_ms"]) / pairs
+    _cost["ms_per_pair"] = per_pair if not _measured else 0.8 * _cost["ms_per_pair"] + 0.2 * per_pair
+    _measured = True
+    set_gauge("rerank_ms_per_pair", _cost["ms_per_pair"])
+
+
+def affordable_pairs(deadline: Optional[Deadline] = None) -> int:
+    """How many uncached pairs one call can score within RERANK_BUDGET_MS and the deadline."""
+    budget = settings.RERANK_BUDGET_MS
+    remaining = deadline.remaining_ms() if deadline is not None else None
+    if remaining is not None:
+        budget = min(budget, remaining)
+    spare = budget - _cost["overhead_ms"]
+    if spare <= 0:
+        return 0
+    return int(spare / max(_cost["ms_per_pair"], 1e-3))
+
+
+def _key(model: str, query_hash: str, doc: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return (model, query_hash, str(doc.get("video_id")), segment_key(doc))
+
+
+def _predict(model_name: str, pairs: List[Tuple[str, str]]) -> List[float]:
+    model = get_reranker(model_name)
+    return [float(s) for s in model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+
+
+async def rerank(query: str, candidates: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+    """
+    Reorder `candidates` (best bi-encoder hit first) by cross-encoder score, best first.
+
+    The longest prefix whose uncached pairs fit the budget is scored in one predict() call; the
+    scored docs get `rerank_score` and lead the result, the rest keep their order behind them.
+    With no budget for even two candidates the list is returned unchanged and the request records
+    a "skipped_rerank" degradation.
+    """
+    model = settings.RERANK_MODEL
+    query_hash = text_hash(" ".join(query.lower().split()))
+    budget = affordable_pairs(deadline)
+    scores: List[Optional[float]] = []
+    uncached: List[int] = []
+    for i, doc in enumerate(candidates[: settings.RERANK_CANDIDATES]):
+        score = score_cache.get(_key(model, query_hash, doc))
+        if score is None:
+            if len(uncached) >= budget:
+                break
+            uncached.append(i)
+        scores.append(score)
+
+    n = len(scores)
+    if n < 2:
+        if len(candidates) >= 2:
+            if deadline is not None:
+                deadline.degrade("skipped_rerank")
+            inc_counter("rerank_skipped")
+        return candidates
+    if n < min(len(candidates), settings.RERANK_CANDIDATES):
+        inc_counter("rerank_capped")
+
+    if uncached:
+        pairs = [(query, candidates[i].get("text") or "") for i in uncached]
+        start = time.perf_counter()
+        predicted = await asyncio.to_thread(_predict, model, pairs)
+        ms = (time.perf_counter() - start) * 1000
+        record_cost(len(pairs), ms)
+        observe_histogram("rerank_ms", ms)
+        for i, score in zip(uncached, predicted):
+            scores[i] = score
+            score_cache.put(_key(model, query_hash, candidates[i]), score)
+    inc_counter("rerank_pairs", len(uncached))
+    inc_counter("rerank_cache_hits", n - len(uncached))
+    set_gauge("rerank_cache_entries", len(score_cache))
+
+    head = [dict(doc, rerank_score=score) for doc, score in zip(candidates[:n], scores)]
+    # stable: equal cross-encoder scores keep the bi-encoder order
+    head.sort(key=lambda d: d["rerank_score"], reverse=True)
+    return head + candidates[n:]
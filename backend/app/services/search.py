@@ -1,11 +1,19 @@
 from __future__ import annotations
 
 from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import threading
+from collections import OrderedDict
 from loguru import logger
 from functools import lru_cache
 
+from ..config import settings
+from .admission import limiter
+from .deadline import Deadline
 from .embeddings import embed_texts
-from .db import get_store
+from .db import get_store, segment_key, text_hash
+from . import rerank
+from .query_log import schedule_warm
 
 
 # simple in-process cache keyed by (video_id, query) - note: lru_cache here only caches keys,
@@ -15,6 +23,41 @@ def _cache_key(video_id: Optional[str], query: str) -> Tuple[Optional[str], str]
     return (video_id, query)
 
 
+def embed_with(texts: List[str], model: str) -> List[List[float]]:
+    """Embed with `model`; the configured model goes through the plain embed_texts(texts) call."""
+    if model == settings.EMBEDDING_MODEL:
+        return embed_texts(texts)
+    return embed_texts(texts, model)
+
+
+async def embed_segments(video_id: str, title: str, segments: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+    """
+    Attach embedding, text_hash, segment_key and display fields to `segments` in place.
+    Segments whose text is already indexed for this video reuse the stored vector instead of
+    being re-embedded. Vectors are in `model`, by default the library's current embedding model.
+    Returns how many texts were embedded.
+    """
+    store = await get_store()
+    model = model or await store.embedding_model()
+    hashes = [text_hash(s["text"]) for s in segments]
+    known = await store.get_embeddings(video_id, hashes)
+    missing = sorted({h: s["text"] for h, s in zip(hashes, segments) if h not in known}.items())
+    if missing:
+        async with limiter("embed").slot():
+            vectors = await asyncio.to_thread(embed_with, [t for _, t in missing], model)
+        known.update({h: v for (h, _), v in zip(missing, vectors)})
+
+    for s, h in zip(segments, hashes):
+        s["embedding"] = known[h]
+        s["text_hash"] = h
+        s["segment_key"] = segment_key(s)
+        s["video_id"] = video_id
+        s["title"] = title
+        # optionally precompute snippet
+        s["snippet"] = s["text"][:300]
+    return len(missing)
+
+
 async def index_segments(video_id: str, title: str, segments: List[Dict[str, Any]], url: Optional[str] = None, is_local_file: bool = False) -> None:
     """
     Compute embeddings for each segment and upsert into vector store.
@@ -24,32 +67,76 @@ async def index_segments(video_id: str, title: str, segments: List[Dict[str, Any
         logger.info(f"No segments to index for {video_id}")
         return
 
-    texts = [s["text"] for s in segments]
-    vectors = embed_texts(texts)
-    for s, v in zip(segments, vectors):
-        s["embedding"] = v
-        s["video_id"] = video_id
-        s["title"] = title
-        # optionally precompute snippet
-        s["snippet"] = s["text"][:300]
+    store = await get_store()
+    writer = await store.begin_ingest(video_id, title)
+    try:
+        embedded = await embed_segments(video_id, title, segments, writer.model)
+        await writer.write(segments)
+        await writer.commit(url, is_local_file)
+    except BaseException:
+        await writer.abort()
+        raise
+    logger.info(f"Indexed {len(segments)} segments for video {video_id} ({embedded} embedded)")
+    schedule_warm([video_id, None])
+
+
+# recent query vectors, (model, whitespace-normalized query) -> vector; refilled by the query warmer
+_query_vectors: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+_query_vectors_lock = threading.Lock()
+
+
+def embed_query(query: str, model: Optional[str] = None) -> List[float]:
+    model = model or settings.EMBEDDING_MODEL
+    key = (model, " ".join(query.split()))
+    with _query_vectors_lock:
+        vector = _query_vectors.get(key)
+        if vector is not None:
+            _query_vectors.move_to_end(key)
+            return vector
+    vector = embed_with([query], model)[0]
+    if settings.QUERY_EMBED_CACHE_SIZE > 0:
+        with _query_vectors_lock:
+            _query_vectors[key] = vector
+            while len(_query_vectors) > settings.QUERY_EMBED_CACHE_SIZE:
+                _query_vectors.popitem(last=False)
+    return vector
+
+
+def clear_query_vectors() -> None:
+    with _query_vectors_lock:
+        _query_vectors.clear()
+
+
+async def index_version() -> int:
+    """Version of the searchable library; changes whenever any video is (re)indexed."""
+    store = await get_store()
+    return await store.library_version()
+
 
+async def index_state() -> Tuple[int, str]:
+    """Library version and the embedding model queries against it must use."""
     store = await get_store()
-    await store.upsert_segments(video_id, title, segments, url, is_local_file)
-    logger.info(f"Indexed {len(segments)} segments for video {video_id}")
+    return await store.library_state()
 
 
-async def get_video_history() -> List[Dict[str, Any]]:
-    """Get list of all processed videos"""
+async def get_video_history(limit: Optional[int] = None, after: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+    """Get processed videos, newest first, a page at a time"""
     store = await get_store()
-    return await store.get_videos()
+    return await store.get_videos(limit=limit, after=after)
 
 
-async def _keyword_fallback(query: str, k: int, video_id: Optional[str]) -> List[Dict[str, Any]]:
+async def _keyword_fallback(
+    query: str,
+    k: int,
+    video_id: Optional[str],
+    t_min: Optional[float] = None,
+    t_max: Optional[float] = None,
+) -> List[Dict[str, Any]]:
     """
     Very small fallback that scans stored segments and ranks by simple term frequency.
     """
     store = await get_store()
-    docs = await store.list_segments(video_id, limit=5000)
+    docs = await store.list_segments(video_id, limit=5000, t_min=t_min, t_max=t_max)
     q = query.lower()
     scored: List[Tuple[float, Dict[str, Any]]] = []
     q_tokens = [tok for tok in q.split() if tok]
@@ -64,31 +151,68 @@ async def _keyword_fallback(query: str, k: int, video_id: Optional[str]) -> List
     return [d for _, d in scored[:k]]
 
 
-async def semantic_search(query: str, k: int = 3, video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+async def semantic_search(
+    query: str,
+    k: int = 3,
+    video_id: Optional[str] = None,
+    t_min: Optional[float] = None,
+    t_max: Optional[float] = None,
+    deadline: Optional[Deadline] = None,
+    query_embedding: Optional[List[float]] = None,
+) -> List[Dict[str, Any]]:
     """
-    Perform vector search using the embedding of the query.
+    Perform vector search using the embedding of the query (`query_embedding` if already computed).
+    `t_min`/`t_max` (seconds) restrict results to segments overlapping that part of the lecture.
+    With a `deadline`, overlap collapsing and keyword fusion are skipped when time is short
+    (recorded on the deadline as degradations). With RERANK_MODEL set, the top
+    RERANK_CANDIDATES vector hits are reordered by the cross-encoder before the top-k is taken.
     Returns top-k documents (each doc is a dict containing at least: video_id, start_time, end_time, text, score).
     If the vector scores are weak, attempt keyword fallback and merge results.
     """
     # Obtain query vector
-    qv = embed_texts([query])[0]
+    if query_embedding is None:
+        _, model = await index_state()
+        query_embedding = embed_query(query, model)
+    qv = query_embedding
 
+    deadline = deadline or Deadline(None)
     store = await get_store()
-    # Ask for a larger candidate set to allow reranking/merging
-    candidates = await store.search(qv, k * 4, video_id)
+    # the cross-encoder picks the top k out of a larger pool of vector hits
+    pool = max(k, settings.RERANK_CANDIDATES) if rerank.enabled() else k
+    reranking = False
+    if not deadline.has(settings.DEADLINE_MIN_COLLAPSE_MS):
+        # out of time: exactly k raw candidates, no collapsing, over-fetch or re-ranking
+        deadline.degrade("capped_candidates")
+        candidates = await store.search(qv, k, video_id, t_min=t_min, t_max=t_max, deadline=deadline)
+    elif settings.SEARCH_COLLAPSE_OVERLAPS:
+        # the store folds overlapping windows into one span while selecting, so k spans suffice
+        candidates = await store.search(qv, pool, video_id, t_min=t_min, t_max=t_max, collapse=True, deadline=deadline)
+        reranking = pool > k
+    else:
+        # Ask for a larger candidate set to allow reranking/merging
+        candidates = await store.search(qv, max(k * 4, pool), video_id, t_min=t_min, t_max=t_max, deadline=deadline)
+        reranking = pool > k
+    can_fuse = deadline.has(settings.DEADLINE_MIN_FUSION_MS)
     if not candidates:
+        if not can_fuse:
+            deadline.degrade("skipped_keyword_fusion")
+            return []
         # fallback immediately to keyword search
-        fb = await _keyword_fallback(query, k, video_id)
+        fb = await _keyword_fallback(query, k, video_id, t_min, t_max)
         return fb
 
     # sort primarily by score, secondarily by end_time (prefer later occurrences for context)
     candidates.sort(key=lambda x: (x.get("score", 0.0), x.get("end_time", 0.0)), reverse=True)
+    if reranking:
+        candidates = await rerank.rerank(query, candidates, deadline)
     topk = candidates[:k]
 
     # If the top score is weak, attempt keyword fallback and merge
-    top_score = topk[0].get("score", 0.0) if topk else 0.0
-    if top_score < 0.2:
-        fb = await _keyword_fallback(query, k, video_id)
+    top_score = max((d.get("score", 0.0) for d in topk), default=0.0)
+    if top_score < 0.2 and not can_fuse:
+        deadline.degrade("skipped_keyword_fusion")
+    elif top_score < 0.2:
+        fb = await _keyword_fallback(query, k, video_id, t_min, t_max)
 
         def key(d):
             return (d.get("video_id"), d.get("start_time"), d.get("end_time"))
@@ -101,7 +225,8 @@ async def semantic_search(query: str, k: int = 3, video_id: Optional[str] = None
                 continue
             seen.add(kx)
             merged.append(d)
-        merged.sort(key=lambda x: x.get("score", 0.0), reverse=True)
+        if "rerank_score" not in topk[0]:
+            merged.sort(key=lambda x: x.get("score", 0.0), reverse=True)
         return merged[:k]
 
     return topk
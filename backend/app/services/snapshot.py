@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+import shutil
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime
+
+try:  # POSIX advisory locks; without them only one process may use a snapshot dir
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+import numpy as np
+from loguru import logger
+
+# On-disk layout (one directory per generation, CURRENT names the live one):
+#   <dir>/CURRENT                 -> "gen-000003"
+#   <dir>/gen-000003/<column>.npy    one SegmentTable column each, loaded with mmap_mode="r"
+#   <dir>/gen-000003/table.json      interned video ids/titles + embedding storage type
+#   <dir>/gen-000003/metadata.jsonl  per-row segment metadata
+#   <dir>/gen-000003/videos.json
+#   <dir>/gen-000003/manifest.json
+#   <dir>/gen-000003/wal.jsonl       upserts applied after this generation was captured
+#   <dir>/WRITER.lock                held by the one process allowed to write snapshots
+#   <dir>/MODEL                      embedding model of the library, switched under the log lock
+#
+# Several processes (uvicorn workers) can share a dir: all of them map the same generation
+# read-only and append upserts to the newest log under a file lock; every process tails the log,
+# and only the WRITER.lock holder folds it into new generations. An upsert embedded with another
+# model than MODEL is refused at append time, so no acknowledged write is dropped on replay.
+
+
+def encode_array(arr: np.ndarray) -> Dict[str, Any]:
+    arr = np.ascontiguousarray(arr, dtype=np.float32)
+    return {"shape": list(arr.shape), "b64": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+
+def decode_array(obj: Dict[str, Any]) -> np.ndarray:
+    raw = base64.b64decode(obj["b64"])
+    return np.frombuffer(raw, dtype=np.float32).reshape(obj["shape"]).copy()
+
+
+def _lock(f: Any) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock(f: Any) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _write_parts(path: str, parts: List[np.ndarray]) -> None:
+    parts = [np.asarray(p) for p in parts if len(p)]
+    if not parts:
+        np.save(path, np.zeros(0, dtype=np.float32))
+        return
+    shape = (sum(p.shape[0] for p in parts),) + parts[0].shape[1:]
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=parts[0].dtype, shape=shape)
+    pos = 0
+    for p in parts:
+        out[pos:pos + p.shape[0]] = p
+        pos += p.shape[0]
+    out.flush()
+    del out
+
+
+class SnapshotManager:
+    """Generational snapshots + append-only log for the in-memory store."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.generation = self._current_generation()
+        self._writer_lock: Optional[Any] = None
+
+    def _gen_dir(self, gen: int) -> str:
+        return os.path.join(self.root, f"gen-{gen:06d}")
+
+    def _current_generation(self) -> int:
+        try:
+            with open(os.path.join(self.root, "CURRENT"), "r", encoding="utf-8") as f:
+                return int(f.read().strip().split("-")[-1])
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _generations(self) -> List[int]:
+        gens = []
+        for name in os.listdir(self.root):
+            if name.startswith("gen-"):
+                try:
+                    gens.append(int(name.split("-")[-1]))
+                except ValueError:
+                    continue
+        return sorted(gens)
+
+    def load(
+        self, gen: Optional[int] = None
+    ) -> Optional[Tuple[Dict[str, Dict[str, Any]], Dict[str, Any], Dict[str, np.ndarray], List[Any]]]:
+        """
+        Map generation `gen` (default the current one): (videos, table header, column arrays as
+        np.memmap, metadata). None if there is no such generation.
+        """
+        gen = self.generation if gen is None else gen
+        gen_dir = self._gen_dir(gen)
+        if not gen or not os.path.exists(os.path.join(gen_dir, "manifest.json")):
+            return None
+        with open(os.path.join(gen_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(gen_dir, "videos.json"), "r", encoding="utf-8") as f:
+            videos = json.load(f)
+        with open(os.path.join(gen_dir, "table.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        with open(os.path.join(gen_dir, "metadata.jsonl"), "r", encoding="utf-8") as f:
+            metadata = [json.loads(line) for line in f if line.strip()]
+        arrays = {
+            name: np.load(os.path.join(gen_dir, f"{name}.npy"), mmap_mode="r")
+            for name in manifest["columns"]
+        }
+        logger.info(f"Mapped snapshot {gen_dir}: {len(videos)} videos, {manifest['segments']} segments")
+        return videos, header, arrays, metadata
+
+    def refresh(self) -> Optional[int]:
+        """
+        The generation another process published since this one was mapped, if any. `generation`
+        is left alone; the caller advances it once the new generation is loaded.
+        """
+        gen = self._current_generation()
+        return gen if gen != self.generation else None
+
+    def try_lock_writer(self) -> bool:
+        """Become the snapshot writer for this dir unless another process already is."""
+        if self._writer_lock is not None:
+            return True
+        f = open(os.path.join(self.root, "WRITER.lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+        self._writer_lock = f
+        return True
+
+    def release_writer(self) -> None:
+        if self._writer_lock is not None:
+            self._writer_lock.close()
+            self._writer_lock = None
+
+    def read_log(self, cursor: Dict[int, int]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield complete log records of the current and any newer generation that lie past `cursor`
+        (generation -> byte offset), advancing it. A record still being written is left for later.
+        """
+        for gen in list(cursor):
+            if gen < self.generation:
+                del cursor[gen]
+        for gen in self._generations():
+            if gen < self.generation:
+                continue
+            path = os.path.join(self._gen_dir(gen), "wal.jsonl")
+            try:
+                with open(path, "rb") as f:
+                    f.seek(cursor.get(gen, 0))
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            end = data.rfind(b"\n") + 1
+            cursor[gen] = cursor.get(gen, 0) + end
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping torn log record in {path}")
+
+    def wal_path(self) -> str:
+        # New writes always go to the newest generation directory
+        gens = self._generations()
+        gen = max(gens + [self.generation]) or 1
+        os.makedirs(self._gen_dir(gen), exist_ok=True)
+        return os.path.join(self._gen_dir(gen), "wal.jsonl")
+
+    def library_model(self) -> Optional[str]:
+        """The library's embedding model as last switched (None if never recorded)."""
+        try:
+            with open(os.path.join(self.root, "MODEL"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Log an upsert; False, logging nothing, if its "model" is not the library's (see MODEL)."""
+        line = json.dumps(record) + "\n"
+        while True:
+            path = self.wal_path()
+            with open(path, "a", encoding="utf-8") as f:
+                _lock(f)
+                try:
+                    if path != self.wal_path():
+                        continue  # begin() sealed this log meanwhile; use the new one
+                    model = self.library_model()
+                    if model is not None and record.get("model", model) != model:
+                        return False
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    return True
+                finally:
+                    _unlock(f)
+
+    def switch_model(self, model: str, check: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Make `model` the library's model, holding the log lock so no upsert is logged meanwhile.
+        `check` runs under the lock first (e.g. to apply the last records of other processes);
+        if it returns False nothing is switched.
+        """
+        while True:
+            path = self.wal_path()
+            with open(path, "a", encoding="utf-8") as f:
+                _lock(f)
+                try:
+                    if path != self.wal_path():
+                        continue
+                    if check is not None and not check():
+                        return False
+                    tmp = os.path.join(self.root, "MODEL.tmp")
+                    with open(tmp, "w", encoding="utf-8") as m:
+                        m.write(model)
+                        m.flush()
+                        os.fsync(m.fileno())
+                    os.replace(tmp, os.path.join(self.root, "MODEL"))
+                    return True
+                finally:
+                    _unlock(f)
+
+    def begin(self, on_sealed: Optional[Callable[[], None]] = None) -> int:
+        """
+        Open a new generation; upserts logged from now on belong to it. The previous log stays
+        locked until `on_sealed` has run, so the caller can apply its last records knowing no
+        other process can add more.
+        """
+        old = self.wal_path()
+        with open(old, "a", encoding="utf-8") as f:
+            _lock(f)
+            try:
+                gen = max(self._generations() + [self.generation]) + 1
+                os.makedirs(self._gen_dir(gen), exist_ok=True)
+                open(os.path.join(self._gen_dir(gen), "wal.jsonl"), "a").close()
+                if on_sealed is not None:
+                    on_sealed()
+            finally:
+                _unlock(f)
+        return gen
+
+    def write(
+        self,
+        gen: int,
+        videos: Dict[str, Dict[str, Any]],
+        header: Dict[str, Any],
+        arrays: Dict[str, List[np.ndarray]],
+        metadata: List[Any],
+    ) -> None:
+        """
+        Write generation `gen` and atomically make it current. Each column is given as parts that are
+        written back to back into one .npy, so the live tables are never concatenated in memory.
+        Blocking; run off the event loop.
+        """
+        gen_dir = self._gen_dir(gen)
+        for name, parts in arrays.items():
+            _write_parts(os.path.join(gen_dir, f"{name}.npy"), parts)
+        with open(os.path.join(gen_dir, "metadata.jsonl"), "w", encoding="utf-8") as f:
+            for m in metadata:
+                f.write(json.dumps(m) + "\n")
+        with open(os.path.join(gen_dir, "table.json"), "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        with open(os.path.join(gen_dir, "videos.json"), "w", encoding="utf-8") as f:
+            json.dump(videos, f)
+        with open(os.path.join(gen_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "generation": gen,
+                "segments": len(metadata),
+                "columns": sorted(arrays),
+                "created_at": datetime.now().isoformat(),
+            }, f)
+
+        tmp = os.path.join(self.root, "CURRENT.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"gen-{gen:06d}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.root, "CURRENT"))
+        previous, self.generation = self.generation, gen
+
+        # readers may still be mapping the generation this one replaces; it goes with the next write
+        for old in self._generations():
+            if old < previous:
+                shutil.rmtree(self._gen_dir(old), ignore_errors=True)
+        logger.info(f"Wrote snapshot {gen_dir}: {len(metadata)} segments")
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Iterator, Tuple
 from loguru import logger
+import numpy as np
+import tempfile, os, shutil, time
 
-from youtube_transcript_api import YouTubeTranscriptApi
-import webvtt
-import srt
-import tempfile, os, shutil
+from ..config import settings
+from .asr import SAMPLE_RATE, choose_model, get_backend, load_model, record_rtf
+
+# youtube_transcript_api, webvtt, srt and the Whisper backends are imported by the loaders that need them
+
+
+def get_whisper_model(model_name: str) -> Any:
+    """Load a Whisper model of the TRANSCRIBE_BACKEND once per process and reuse it."""
+    return load_model(get_backend(), model_name)
 
 
 def _clean_text(text: str) -> str:
@@ -17,45 +24,74 @@ def _clean_text(text: str) -> str:
     return t
 
 
+class SegmentStream:
+    """
+    Incremental `_segment_chunks`: push sentences as they are transcribed and get back the windows
+    that later sentences can no longer change; `finish()` flushes the rest. Pushing a transcript in
+    any number of pieces yields exactly the windows of one `_segment_chunks` call.
+    """
+
+    def __init__(self, window: float = 45.0, overlap: float = 15.0) -> None:
+        self.window = window
+        self.overlap = overlap
+        self._sentences: List[Tuple[float, float, str]] = []
+
+    def push(self, sentences: List[Tuple[float, float, str]]) -> List[Dict[str, Any]]:
+        self._sentences.extend(sentences)
+        return self._drain(final=False)
+
+    def finish(self) -> List[Dict[str, Any]]:
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[Dict[str, Any]]:
+        segments: List[Dict[str, Any]] = []
+        sentences = self._sentences
+        n = len(sentences)
+        window, overlap = self.window, self.overlap
+
+        i = 0
+        while i < n:
+            start = sentences[i][0]
+            end = start
+            texts: List[str] = []
+            j = i
+            while j < n and (sentences[j][1] - start) <= window:
+                texts.append(sentences[j][2])
+                end = sentences[j][1]
+                j += 1
+
+            # advance index with overlap
+            advance_to = start + max(window - overlap, 1.0)
+            k = i
+            while k < n and sentences[k][0] < advance_to:
+                k += 1
+            if not final and (j == n or k == n):
+                # the window or the next start may still change with more sentences
+                break
+
+            snippet = _clean_text(" ".join(texts))
+            if snippet:
+                segments.append({
+                    "start_time": float(start),
+                    "end_time": float(end),
+                    "text": snippet,
+                    "metadata": {},
+                })
+            i = max(k, i + 1)
+
+        # windows never reach back before the next start
+        del sentences[:i]
+        return segments
+
+
 def _segment_chunks(
     sentences: List[Tuple[float, float, str]],
     window: float = 45.0,
     overlap: float = 15.0,
 ) -> List[Dict[str, Any]]:
     """Segment sentences into overlapping windows for retrieval."""
-    segments: List[Dict[str, Any]] = []
-    n = len(sentences)
-    if n == 0:
-        return segments
-
-    i = 0
-    while i < n:
-        start = sentences[i][0]
-        end = start
-        texts: List[str] = []
-        j = i
-        while j < n and (sentences[j][1] - start) <= window:
-            texts.append(sentences[j][2])
-            end = sentences[j][1]
-            j += 1
-
-        snippet = _clean_text(" ".join(texts))
-        if snippet:
-            segments.append({
-                "start_time": float(start),
-                "end_time": float(end),
-                "text": snippet,
-                "metadata": {},
-            })
-
-        # advance index with overlap
-        advance_to = start + max(window - overlap, 1.0)
-        k = i
-        while k < n and sentences[k][0] < advance_to:
-            k += 1
-        i = max(k, i + 1)
-
-    return segments
+    stream = SegmentStream(window=window, overlap=overlap)
+    return stream.push(list(sentences)) + stream.finish()
 
 
 def segment_transcript(
@@ -70,6 +106,7 @@ def segment_transcript(
 def load_youtube_transcript(video_url: str, window: float = 30.0, overlap: float = 15.0) -> List[Dict[str, Any]]:
     """Load YouTube transcript if available, else raise error."""
     import urllib.parse as urlparse
+    from youtube_transcript_api import YouTubeTranscriptApi
     parsed = urlparse.urlparse(video_url)
     qs = urlparse.parse_qs(parsed.query)
     video_id = qs.get("v", [None])[0] or parsed.path.split("/")[-1] or video_url
@@ -107,55 +144,104 @@ def load_youtube_transcript(video_url: str, window: float = 30.0, overlap: float
     return _segment_chunks(sentences, window=window, overlap=overlap)
 
 
+class WhisperSource:
+    """
+    Iterator over the sentences of a local media file, transcribed with Whisper about `chunk_s`
+    seconds of audio at a time, with absolute timestamps, so later ingest stages can start before
+    the whole file is transcribed. With `vad`, an energy-based pre-pass finds the speech regions;
+    only those are spliced together and transcribed, and timestamps are mapped back to the original
+    recording. `summary()` reports how much audio was skipped.
+
+    The model is picked from the amount of speech and TRANSCRIBE_CPU_BUDGET_S (see asr.choose_model)
+    and run on the TRANSCRIBE_BACKEND. Requires: openai-whisper or faster-whisper, ffmpeg
+    """
+
+    def __init__(self, file_path: str, chunk_s: float = 300.0, vad: bool = True) -> None:
+        self.file_path = file_path
+        self.chunk_s = chunk_s
+        self.vad = vad
+        self.audio_s = 0.0
+        self.speech_s = 0.0
+        self.backend = get_backend()
+        self.model_name = ""
+        self._batches: Iterator[List[Tuple[float, float, str]]] = self._transcribe()
+
+    def __iter__(self) -> "WhisperSource":
+        return self
+
+    def __next__(self) -> List[Tuple[float, float, str]]:
+        return next(self._batches)
+
+    def summary(self) -> Dict[str, float]:
+        skipped = 100.0 * (1.0 - self.speech_s / self.audio_s) if self.audio_s else 0.0
+        return {"audio_s": round(self.audio_s, 1), "speech_s": round(self.speech_s, 1),
+                "skipped_pct": round(skipped, 1)}
+
+    def _transcribe(self) -> Iterator[List[Tuple[float, float, str]]]:
+        from .vad import Timeline, pack_regions, speech_regions
+
+        file_path = self.file_path
+        if not os.path.exists(file_path):
+            raise Exception(f"Video file not found: {file_path}")
+        if os.path.getsize(file_path) == 0:
+            raise Exception("Video file is empty")
+
+        backend = self.backend
+        audio = backend.load_audio(file_path)
+        rate = SAMPLE_RATE
+        self.audio_s = len(audio) / rate
+
+        if self.vad:
+            regions = speech_regions(
+                audio, rate, settings.VAD_MARGIN_DB, settings.VAD_MIN_SILENCE_S, settings.VAD_PAD_S
+            )
+        else:
+            regions = [(0, len(audio))]
+        self.speech_s = sum(e - s for s, e in regions) / rate
+        if not regions:
+            # nothing to transcribe: don't pick or load a model for silence
+            logger.info(f"No speech found in {self.audio_s:.0f}s of audio")
+            return
+        self.model_name = model_name = choose_model(backend, self.speech_s)
+        logger.info(f"Transcribing {self.speech_s:.0f}s of {self.audio_s:.0f}s audio ({self.summary()['skipped_pct']}% skipped) "
+                    f"with {backend.name} model={model_name}")
+        model = get_whisper_model(model_name)
+
+        for pieces in pack_regions(regions, max(1, int(self.chunk_s * rate))):
+            timeline = Timeline(pieces, rate)
+            chunk = np.concatenate([audio[s:e] for s, e in pieces])
+            start = time.perf_counter()
+            try:
+                raw = backend.transcribe(model, chunk)
+            except Exception as e:
+                logger.error(f"Whisper transcription failed: {e}")
+                raise Exception(f"Audio transcription failed. This could be due to: 1) Corrupted video file, 2) Insufficient system resources, 3) Unsupported video format. Error: {str(e)}")
+            record_rtf(backend, model_name, len(chunk) / rate, time.perf_counter() - start)
+            sentences = []
+            for seg_start, seg_end, seg_text in raw:
+                text = _clean_text(seg_text)
+                if text:
+                    sentences.append((timeline.to_original(seg_start), timeline.to_original(seg_end), text))
+            yield sentences
+
+
 def load_whisper_transcript_from_file(file_path: str, window: float = 30.0, overlap: float = 15.0) -> List[Dict[str, Any]]:
     """
     Transcribe a local video file using Whisper.
     Requires: openai-whisper, ffmpeg
     """
-    import whisper
-    
     if not os.path.exists(file_path):
         raise Exception(f"Video file not found: {file_path}")
     
     try:
-        # Check if file exists and is not empty
-        if os.path.getsize(file_path) == 0:
-            raise Exception("Video file is empty")
-
-        # Pick model based on file size
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-        if file_size_mb > 50:  # heuristic: use tiny for long videos
-            model_name = "tiny"
-        elif file_size_mb > 20:
-            model_name = "base"
-        else:
-            model_name = "small"
-
-        logger.info(f"Running Whisper transcription on local file with model={model_name} on {file_size_mb:.1f}MB file...")
-        
-        try:
-            model = whisper.load_model(model_name)
-            result = model.transcribe(file_path)
-        except Exception as e:
-            logger.error(f"Whisper transcription failed: {e}")
-            raise Exception(f"Audio transcription failed. This could be due to: 1) Corrupted video file, 2) Insufficient system resources, 3) Unsupported video format. Error: {str(e)}")
-
-        # Convert to segment format
-        sentences = []
-        if "segments" not in result or not result["segments"]:
-            raise Exception("No speech detected in the video. The video might be silent or contain only music/noise.")
-            
-        for seg in result["segments"]:
-            start = float(seg["start"])
-            end = float(seg["end"])
-            text = _clean_text(seg["text"])
-            if text:
-                sentences.append((start, end, text))
-
+        # Speech regions only, spliced and transcribed in chunks (see WhisperSource)
+        source = WhisperSource(file_path, chunk_s=settings.INGEST_AUDIO_CHUNK_S, vad=settings.VAD_ENABLED)
+        sentences = [s for batch in source for s in batch]
         if not sentences:
-            raise Exception("No meaningful speech content found in the video.")
+            raise Exception("No speech detected in the video. The video might be silent or contain only music/noise.")
 
-        logger.info(f"Successfully transcribed {len(sentences)} segments from local file")
+        logger.info(f"Successfully transcribed {len(sentences)} segments from local file "
+                    f"({source.summary()['skipped_pct']}% of the audio skipped as silence)")
         return _segment_chunks(sentences, window=window, overlap=overlap)
 
     except Exception as e:
@@ -171,7 +257,6 @@ def load_whisper_transcript(video_url: str, window: float = 30.0, overlap: float
     Requires: yt-dlp, openai-whisper, ffmpeg
     """
     import yt_dlp
-    import whisper
 
     tmpdir = tempfile.mkdtemp()
     out_file = os.path.join(tmpdir, "audio")
@@ -209,38 +294,11 @@ def load_whisper_transcript(video_url: str, window: float = 30.0, overlap: float
         if not os.path.exists(audio_file) or os.path.getsize(audio_file) == 0:
             raise Exception("Downloaded audio file is empty or corrupted")
 
-        # Step 2: Pick model based on file size
-        file_size_mb = os.path.getsize(audio_file) / (1024 * 1024)
-        if file_size_mb > 50:  # heuristic: use tiny for long videos
-            model_name = "tiny"
-        elif file_size_mb > 20:
-            model_name = "base"
-        else:
-            model_name = "small"
-
-        logger.info(f"Running Whisper transcription with model={model_name} on {file_size_mb:.1f}MB file...")
-        
-        try:
-            model = whisper.load_model(model_name)
-            result = model.transcribe(audio_file)
-        except Exception as e:
-            logger.error(f"Whisper transcription failed: {e}")
-            raise Exception(f"Audio transcription failed. This could be due to: 1) Corrupted audio file, 2) Insufficient system resources, 3) Audio format issues. Error: {str(e)}")
-
-        # Step 3: Convert to segment format
-        sentences = []
-        if "segments" not in result or not result["segments"]:
-            raise Exception("No speech detected in the audio. The video might be silent or contain only music/noise.")
-            
-        for seg in result["segments"]:
-            start = float(seg["start"])
-            end = float(seg["end"])
-            text = _clean_text(seg["text"])
-            if text:
-                sentences.append((start, end, text))
-
+        # Step 2: Transcribe the speech (model picked from its duration, see WhisperSource)
+        source = WhisperSource(audio_file, chunk_s=settings.INGEST_AUDIO_CHUNK_S, vad=settings.VAD_ENABLED)
+        sentences = [s for batch in source for s in batch]
         if not sentences:
-            raise Exception("No meaningful speech content found in the video.")
+            raise Exception("No speech detected in the audio. The video might be silent or contain only music/noise.")
 
         logger.info(f"Successfully transcribed {len(sentences)} segments")
         return _segment_chunks(sentences, window=window, overlap=overlap)
@@ -254,6 +312,8 @@ def load_whisper_transcript(video_url: str, window: float = 30.0, overlap: float
 
 
 def load_vtt(file_path: str, window: float = 30.0, overlap: float = 15.0) -> List[Dict[str, Any]]:
+    import webvtt
+
     sentences: List[Tuple[float, float, str]] = []
     for caption in webvtt.read(file_path):
         start = _to_seconds(caption.start)
@@ -265,6 +325,8 @@ def load_vtt(file_path: str, window: float = 30.0, overlap: float = 15.0) -> Lis
 
 
 def load_srt(file_path: str, window: float = 30.0, overlap: float = 15.0) -> List[Dict[str, Any]]:
+    import srt
+
     sentences: List[Tuple[float, float, str]] = []
     with open(file_path, "r", encoding="utf-8") as f:
         subs = list(srt.parse(f.read()))
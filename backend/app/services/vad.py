@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from typing import List, Tuple
+
+import numpy as np
+
+# Energy-based voice activity detection on 16 kHz mono float audio (what whisper.load_audio returns).
+# Frames louder than the recording's own noise floor by `margin_db` count as speech; short pauses
+# are bridged and regions are padded so words are not clipped at the edges.
+
+FRAME_S = 0.03
+MIN_SPEECH_S = 0.25
+# never call anything quieter than this speech, however quiet the noise floor
+ABSOLUTE_FLOOR_DB = -55.0
+
+
+def frame_energy_db(audio: np.ndarray, rate: int, frame_s: float = FRAME_S) -> np.ndarray:
+    """RMS level of consecutive `frame_s` frames in dBFS (the last partial frame is dropped)."""
+    frame = max(1, int(frame_s * rate))
+    n = len(audio) // frame
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(audio[:n * frame], dtype=np.float32).reshape(n, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_regions(
+    audio: np.ndarray,
+    rate: int,
+    margin_db: float = 12.0,
+    min_silence_s: float = 1.0,
+    pad_s: float = 0.3,
+) -> List[Tuple[int, int]]:
+    """
+    Sample ranges [start, end) that contain speech, in order and non-overlapping. Silences shorter
+    than `min_silence_s` are kept inside the surrounding region.
+    """
+    db = frame_energy_db(audio, rate)
+    if not db.size:
+        return []
+    floor = float(np.percentile(db, 10))
+    active = db > max(floor + margin_db, ABSOLUTE_FLOOR_DB)
+    if not active.any():
+        return []
+
+    # run boundaries of the active mask, in frames
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    runs = edges.reshape(-1, 2)
+
+    gap = int(np.ceil(min_silence_s / FRAME_S))
+    merged: List[List[int]] = []
+    for start, end in runs:
+        if merged and start - merged[-1][1] < gap:
+            merged[-1][1] = end
+        else:
+            merged.append([int(start), int(end)])
+
+    frame = int(FRAME_S * rate)
+    pad = int(pad_s * rate)
+    min_len = int(MIN_SPEECH_S / FRAME_S)
+    regions: List[Tuple[int, int]] = []
+    for start, end in merged:
+        if end - start < min_len:
+            continue
+        s, e = max(0, start * frame - pad), min(len(audio), end * frame + pad)
+        if regions and s <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], e)
+        else:
+            regions.append((s, e))
+    return regions
+
+
+def pack_regions(regions: List[Tuple[int, int]], max_len: int) -> List[List[Tuple[int, int]]]:
+    """Group regions (split when longer than `max_len` samples) into batches of at most `max_len` samples."""
+    pieces: List[Tuple[int, int]] = []
+    for s, e in regions:
+        for p in range(s, e, max_len):
+            pieces.append((p, min(e, p + max_len)))
+    batches: List[List[Tuple[int, int]]] = []
+    size = 0
+    for s, e in pieces:
+        if not batches or size + (e - s) > max_len:
+            batches.append([])
+            size = 0
+        batches[-1].append((s, e))
+        size += e - s
+    return batches
+
+
+class Timeline:
+    """Maps times in audio spliced together from `pieces` back to the original recording."""
+
+    def __init__(self, pieces: List[Tuple[int, int]], rate: int) -> None:
+        self.rate = rate
+        self.orig = np.array([s for s, _ in pieces], dtype=np.float64) / rate
+        lengths = np.array([e - s for s, e in pieces], dtype=np.float64) / rate
+        self.spliced = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+        self.lengths = lengths
+
+    def to_original(self, t: float) -> float:
+        i = int(np.searchsorted(self.spliced, t, side="right")) - 1
+        i = min(max(i, 0), len(self.orig) - 1)
+        return float(self.orig[i] + min(t - self.spliced[i], self.lengths[i]))
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import time
+
+from loguru import logger
+
+from ..config import settings
+from .metrics import observe_histogram
+
+
+class Readiness:
+    """Tracks the startup preloads; the app is ready once every enabled one has finished."""
+
+    def __init__(self) -> None:
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self.done = False
+
+    def report(self) -> Dict[str, Any]:
+        return {"status": "ready" if self.done else "warming", "components": self.components}
+
+
+readiness = Readiness()
+
+
+async def _load_store() -> None:
+    from .db import get_store
+
+    await get_store()
+
+
+async def _load_embedding_model() -> None:
+    from .embeddings import get_model
+
+    await asyncio.to_thread(get_model)
+
+
+async def _load_rerank_model() -> None:
+    from .rerank import get_reranker
+
+    await asyncio.to_thread(get_reranker)
+
+
+async def _load_whisper_model() -> None:
+    from .transcript import get_whisper_model
+
+    await asyncio.to_thread(get_whisper_model, settings.PRELOAD_WHISPER_MODEL)
+
+
+def _steps() -> List[Tuple[str, Callable[[], Awaitable[None]]]]:
+    steps: List[Tuple[str, Callable[[], Awaitable[None]]]] = []
+    if settings.PRELOAD_INDEX:
+        steps.append(("store", _load_store))
+    if settings.PRELOAD_EMBEDDING_MODEL:
+        steps.append(("embedding_model", _load_embedding_model))
+    if settings.PRELOAD_EMBEDDING_MODEL and settings.RERANK_MODEL:
+        steps.append(("rerank_model", _load_rerank_model))
+    if settings.PRELOAD_WHISPER_MODEL:
+        steps.append(("whisper_model", _load_whisper_model))
+    return steps
+
+
+async def warm_up() -> None:
+    """
+    Run the enabled preloads one after another (started in the background by the app lifespan).
+    A failed preload is logged and reported but does not block readiness; that subsystem
+    simply loads on first use as before.
+    """
+    steps = _steps()
+    for name, _ in steps:
+        readiness.components[name] = {"status": "pending"}
+    for name, load in steps:
+        start = time.perf_counter()
+        try:
+            await load()
+            status = {"status": "ok"}
+        except Exception as e:
+            logger.warning(f"Preloading {name} failed: {e}")
+            status = {"status": "failed", "error": str(e)}
+        ms = (time.perf_counter() - start) * 1000
+        observe_histogram(f"warmup_ms:{name}", ms)
+        readiness.components[name] = {**status, "ms": round(ms, 1)}
+        logger.info(f"Preloaded {name} in {ms:.0f}ms")
+    readiness.done = True
+    # refill the query caches in the background, yielding to live searches
+    from .query_log import warm_all
+
+    warm_all()
@@ -0,0 +1,60 @@
+"""
+Print the Atlas Vector Search index definition for an embedding model.
+
+numDimensions has to match the model, so atlas/vector_index.json (all-MiniLM-L6-v2, 384 dims) is
+only right for the default EMBEDDING_MODEL. Before switching models, create a second index with
+the new model's definition and map it in VECTOR_INDEX_NAMES, e.g.
+
+    python scripts/atlas_index.py --model sentence-transformers/all-mpnet-base-v2 --out atlas/vector_index_mpnet.json
+    VECTOR_INDEX_NAMES='{"sentence-transformers/all-mpnet-base-v2": "vector_index_mpnet"}'
+
+Both indexes cover the same `embedding` path; each only holds the documents of its dimension, so
+searches keep using the old index until the migration switches the library over.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+FILTER_PATHS = ["video_id", "v_from", "v_to", "start_time", "end_time"]
+
+
+def index_definition(dim: int) -> Dict[str, Any]:
+    return {
+        "fields": [{"type": "vector", "path": "embedding", "numDimensions": dim, "similarity": "cosine"}]
+        + [{"type": "filter", "path": p} for p in FILTER_PATHS]
+    }
+
+
+def model_dim(model: str) -> int:
+    sys.path.insert(0, str(ROOT))
+    from app.services.embeddings import get_model
+
+    return int(get_model(model).get_sentence_embedding_dimension())
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--model", default=None, help="embedding model (default EMBEDDING_MODEL); loaded to read its dimension")
+    p.add_argument("--dim", type=int, default=None, help="vector dimension, instead of loading the model")
+    p.add_argument("--out", default=None, help="write the definition here instead of stdout")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.dim is None:
+        sys.path.insert(0, str(ROOT))
+        from app.config import settings
+
+        args.dim = model_dim(args.model or settings.EMBEDDING_MODEL)
+    text = json.dumps(index_definition(args.dim), indent=2) + "\n"
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+        print(f"Wrote {args.out}")
+    else:
+        print(text, end="")
@@ -0,0 +1,296 @@
+"""
+Reproducible ingest + search benchmark for the Lecture Navigator API.
+
+Builds synthetic lecture corpora, indexes them with a deterministic fake
+embedder (no model download), then replays sample_data/queries.json plus
+generated queries against the app in-process at a configurable concurrency.
+
+The answer, query-embedding and re-rank caches and the query-log warmer are off by default, so the
+latencies measure the search path itself; --caches keeps the caches on (emptied before every run)
+and the answer-cache hit rate is reported next to the latencies either way.
+
+    python scripts/benchmark.py --sizes 10,1000,100000 --concurrency 8
+    python scripts/benchmark.py --out bench/new.json --baseline bench/old.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.config import settings  # noqa: E402
+from app.services import db as db_service  # noqa: E402
+from app.services import metrics  # noqa: E402
+from app.services import search as search_service  # noqa: E402
+from app.services.answer_cache import answer_cache  # noqa: E402
+from app.services.query_log import query_log, stop_warming  # noqa: E402
+from app.services.rerank import score_cache  # noqa: E402
+
+SAMPLE_QUERIES = ROOT.parent / "sample_data" / "queries.json"
+
+TOPICS = [
+    "machine learning studies algorithms that improve with data",
+    "supervised learning uses labeled examples to fit a model",
+    "unsupervised learning finds structure in unlabeled data",
+    "gradient descent follows the negative gradient of the loss",
+    "neural networks stack linear layers and nonlinear activations",
+    "regularization penalizes large weights to reduce overfitting",
+    "cross validation estimates generalization error on held out folds",
+    "decision trees split features to reduce impurity",
+    "convolution shares weights across spatial positions",
+    "attention weighs tokens by their relevance to a query",
+    "bayes rule updates a prior with the likelihood of evidence",
+    "principal component analysis projects data onto directions of variance",
+]
+FILLER = "so now let us look at this example and think about what happens next".split()
+
+
+class FakeEmbedder:
+    """Deterministic hashed bag-of-words embedder, normalized like the real one."""
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for tok in t.lower().split():
+                out[i, zlib.crc32(tok.encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (out / norms).tolist()
+
+
+def build_corpus(n_segments: int, segments_per_video: int, seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Synthetic lectures: 30s windows overlapping by 15s, like `_segment_chunks`."""
+    rng = random.Random(seed)
+    corpus: Dict[str, List[Dict[str, Any]]] = {}
+    made = 0
+    v = 0
+    while made < n_segments:
+        count = min(segments_per_video, n_segments - made)
+        segs = []
+        for i in range(count):
+            words = rng.choice(TOPICS).split() + rng.sample(FILLER, 6)
+            rng.shuffle(words)
+            start = i * 15.0
+            segs.append({
+                "start_time": start,
+                "end_time": start + 30.0,
+                "text": " ".join(words),
+                "metadata": {},
+            })
+        corpus[f"bench_{seed}_{v:06d}"] = segs
+        made += count
+        v += 1
+    return corpus
+
+
+def build_queries(n_generated: int, seed: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    queries = [q["query"] for q in json.loads(SAMPLE_QUERIES.read_text(encoding="utf-8"))]
+    for _ in range(n_generated):
+        words = rng.choice(TOPICS).split()
+        queries.append(" ".join(rng.sample(words, min(4, len(words)))))
+    return queries
+
+
+def make_store(backend: str) -> Optional[Any]:
+    if backend == "memory":
+        return db_service.InMemoryStore()
+    if backend == "mongomock":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            print("mongomock-motor not installed, skipping mongomock backend", file=sys.stderr)
+            return None
+        return db_service.MongoStore(client=AsyncMongoMockClient())
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    arr = np.asarray(values)
+    return {
+        "count": int(arr.size),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "p99": float(np.percentile(arr, 99)),
+        "max": float(arr.max()),
+    }
+
+
+async def run_ingest(store: Any, corpus: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    n = 0
+    t0 = time.perf_counter()
+    for video_id, segs in corpus.items():
+        s = time.perf_counter()
+        await search_service.index_segments(video_id, f"Bench {video_id}", [dict(x) for x in segs], None, False)
+        latencies.append((time.perf_counter() - s) * 1000)
+        n += len(segs)
+    wall = time.perf_counter() - t0
+    return {"segments": n, "videos": len(corpus), "wall_s": wall,
+            "segments_per_s": n / wall if wall else 0.0, "latency_ms": percentiles(latencies)}
+
+
+def reset_caches(enabled: bool) -> None:
+    """Empty every cache on the search path (and disable them unless `enabled`) before a run."""
+    stop_warming()
+    query_log.clear()
+    answer_cache.clear()
+    score_cache.clear()
+    search_service.clear_query_vectors()
+    settings.QUERY_WARM_TOP = 0
+    if not enabled:
+        answer_cache.max_entries = 0
+        score_cache.max_entries = 0
+        settings.QUERY_EMBED_CACHE_SIZE = 0
+
+
+def _answer_cache_counts() -> tuple:
+    counters = metrics.snapshot()["counters"]
+    return counters.get("answer_cache_hit", 0), counters.get("answer_cache_miss", 0)
+
+
+async def run_search(queries: List[str], video_ids: List[str], requests: int, concurrency: int,
+                     k: int, scoped_ratio: float, seed: int) -> Dict[str, Any]:
+    import httpx
+    from app.main import app
+
+    rng = random.Random(seed + 2)
+    plan = [
+        {"query": rng.choice(queries), "k": k,
+         "video_id": rng.choice(video_ids) if rng.random() < scoped_ratio else None}
+        for _ in range(requests)
+    ]
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+    hits0, misses0 = _answer_cache_counts()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(body: Dict[str, Any]) -> None:
+            nonlocal errors
+            async with sem:
+                s = time.perf_counter()
+                r = await client.post("/api/search_timestamps", json=body)
+                latencies.append((time.perf_counter() - s) * 1000)
+                if r.status_code != 200:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(b) for b in plan))
+        wall = time.perf_counter() - t0
+
+    hits, misses = (a - b for a, b in zip(_answer_cache_counts(), (hits0, misses0)))
+    return {"requests": requests, "concurrency": concurrency, "errors": errors, "wall_s": wall,
+            "throughput_rps": requests / wall if wall else 0.0, "latency_ms": percentiles(latencies),
+            "answer_cache_hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    old = {(r["backend"], r["segments"]): r for r in baseline.get("results", [])}
+    print("\nvs baseline (positive = slower):")
+    caches = current["meta"]["config"].get("caches", False)
+    if baseline.get("meta", {}).get("config", {}).get("caches", True) != caches:
+        print("  warning: the baseline ran with caches " + ("off" if caches else "on or from before caches "
+              "could be turned off") + "; latencies are not comparable")
+    for r in current["results"]:
+        b = old.get((r["backend"], r["segments"]))
+        if not b:
+            continue
+        for p in ("p50", "p95", "p99"):
+            new_v, old_v = r["search"]["latency_ms"][p], b["search"]["latency_ms"][p]
+            delta = (new_v - old_v) / old_v * 100 if old_v else 0.0
+            print(f"  {r['backend']:>9} {r['segments']:>8} search {p}: {old_v:8.2f} -> {new_v:8.2f} ms ({delta:+.1f}%)")
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    from loguru import logger
+    logger.disable("app")
+    search_service.embed_texts = FakeEmbedder(args.dim)
+    queries = build_queries(args.generated_queries, args.seed)
+    results = []
+    for backend in args.backends.split(","):
+        for size in [int(float(x)) for x in args.sizes.split(",")]:
+            store = make_store(backend)
+            if store is None:
+                break
+            db_service.set_store(store)
+            corpus = build_corpus(size, args.segments_per_video, args.seed)
+            ingest = await run_ingest(store, corpus)
+            reset_caches(args.caches)
+            search = await run_search(queries, list(corpus), args.requests, args.concurrency, args.k,
+                                      args.scoped_ratio, args.seed)
+            row = {"backend": backend, "segments": size, "ingest": ingest, "search": search}
+            results.append(row)
+            lat = search["latency_ms"]
+            print(f"{backend:>9} {size:>8} segs | ingest {ingest['segments_per_s']:9.0f} seg/s | "
+                  f"search {search['throughput_rps']:7.1f} rps p50={lat['p50']:.2f} "
+                  f"p95={lat['p95']:.2f} p99={lat['p99']:.2f} ms"
+                  + (f" answer cache hits {search['answer_cache_hit_rate']:.0%}" if args.caches else ""))
+    db_service.set_store(None)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--backends", default="memory,mongomock", help="comma separated: memory,mongomock")
+    p.add_argument("--sizes", default="10,1000,10000", help="corpus sizes in segments (up to 1e6)")
+    p.add_argument("--segments-per-video", type=int, default=200)
+    p.add_argument("--requests", type=int, default=200, help="search requests per run")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--k", type=int, default=3)
+    p.add_argument("--scoped-ratio", type=float, default=0.5, help="fraction of queries with a video_id")
+    p.add_argument("--generated-queries", type=int, default=50)
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--caches", action="store_true", help="keep the answer/query/re-rank caches on")
+    p.add_argument("--out", default=None, help="write results JSON here")
+    p.add_argument("--baseline", default=None, help="previous results JSON to compare against")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Wrote {out}")
+    if args.baseline:
+        compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")))
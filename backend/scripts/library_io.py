@@ -0,0 +1,48 @@
+"""
+Export the indexed library to Parquet, or import such an export, without re-ingesting anything.
+
+The store is the one the app would use (MONGODB_URI, or the in-memory store and its snapshot), so
+the same export can be moved between MongoStore and InMemoryStore or to a new search node:
+
+    python scripts/library_io.py export exports/library
+    MONGODB_URI= python scripts/library_io.py import exports/library
+
+An export directory holds videos.parquet and segments.parquet (embeddings as fixed-size float32
+lists). Importing into an empty library adopts the export's embedding model. Needs pyarrow.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.services.db import close_store  # noqa: E402
+from app.services.library_io import DEFAULT_BATCH, export_library, import_library  # noqa: E402
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        if args.command == "export":
+            return await export_library(args.dir, batch_size=args.batch)
+        return await import_library(args.dir, batch_size=args.batch)
+    finally:
+        # the in-memory store writes its snapshot on close
+        await close_store()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("command", choices=["export", "import"])
+    p.add_argument("dir", help="export directory")
+    p.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="segments per record batch")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(main(parse_args())), indent=2))
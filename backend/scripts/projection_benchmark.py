@@ -0,0 +1,136 @@
+"""
+Recall, latency and scan memory of the PCA first pass (PROJECTION_DIM) of the in-memory index.
+
+A library is loaded into an InMemoryStore, searched library-wide with full vectors, then with a
+projection fit to each of --dims. Recall@k is measured against an exact brute-force top-k; the
+scan memory is the matrix every query reads in the first pass (codes vs. reduced rows). The top
+RESCORE_CANDIDATES of each first pass are re-scored on full vectors, as in production.
+
+Without --snapshot the library is synthetic: unit vectors with a decaying spectrum over --latent
+directions plus noise, and queries near stored rows. Real vectors give the honest numbers:
+
+    python scripts/projection_benchmark.py --rows 50000 --dims 32,64,96,128
+    python scripts/projection_benchmark.py --snapshot data/snapshots --out bench/projection.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.config import settings  # noqa: E402
+from app.services.db import InMemoryStore  # noqa: E402
+
+
+def synthetic_library(rows: int, dim: int, latent: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.normal(size=(dim, latent)))[0].T
+    spectrum = 1.0 / np.sqrt(np.arange(1, latent + 1))
+    vectors = (rng.normal(size=(rows, latent)) * spectrum) @ basis + 0.02 * rng.normal(size=(rows, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def snapshot_library(path: str) -> np.ndarray:
+    store = InMemoryStore(snapshot_dir=path, shared=True)
+    tables = [t for t in store._shards if len(t)]
+    return np.concatenate([t.vectors(0, len(t)) for t in tables]).astype(np.float32)
+
+
+def make_queries(vectors: np.ndarray, n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picked = vectors[rng.choice(len(vectors), n, replace=False)]
+    q = picked + 0.5 * rng.normal(size=picked.shape) * np.abs(picked).mean()
+    return (q / np.linalg.norm(q, axis=1, keepdims=True)).astype(np.float32)
+
+
+async def load(vectors: np.ndarray, per_video: int) -> InMemoryStore:
+    store = InMemoryStore(shards=settings.SEARCH_SHARDS or None)
+    for v, lo in enumerate(range(0, len(vectors), per_video)):
+        chunk = vectors[lo:lo + per_video]
+        rows = [{"start_time": i * 15.0, "end_time": i * 15.0 + 30.0, "text": f"v{v} s{i}", "metadata": {}}
+                for i in range(len(chunk))]
+        await store.import_video({"video_id": f"v{v}", "title": f"Video {v}"}, rows, chunk)
+    return store
+
+
+def exact_topk(vectors: np.ndarray, queries: np.ndarray, k: int, per_video: int) -> List[set]:
+    norms = np.linalg.norm(vectors, axis=1)
+    out = []
+    for q in queries:
+        scores = vectors @ q / norms
+        out.append({(f"v{i // per_video}", (i % per_video) * 15.0) for i in np.argsort(-scores)[:k]})
+    return out
+
+
+async def run_config(store: InMemoryStore, queries: np.ndarray, truth: List[set], k: int) -> Dict[str, Any]:
+    latencies, hits = [], 0
+    for q, expected in zip(queries, truth):
+        t = time.perf_counter()
+        docs = await store.search(q.tolist(), k, None)
+        latencies.append((time.perf_counter() - t) * 1000)
+        hits += len(expected & {(d["video_id"], d["start_time"]) for d in docs})
+    scanned = sum((t.proj if t.proj is not None and store._projection is not None else t.codes).nbytes
+                  for t in store._shards if len(t))
+    return {
+        "recall_at_k": round(hits / (k * len(queries)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "scan_mb": round(scanned / 2 ** 20, 2),
+    }
+
+
+async def main(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    vectors = snapshot_library(args.snapshot) if args.snapshot else synthetic_library(args.rows, args.dim, args.latent, args.seed)
+    queries = make_queries(vectors, args.queries, args.seed)
+    truth = exact_topk(vectors, queries, args.k, args.per_video)
+    store = await load(vectors, args.per_video)
+    print(f"{len(vectors)} rows x {vectors.shape[1]} dims, {len(store._shards)} shards, k={args.k}, "
+          f"re-scoring top {settings.RESCORE_CANDIDATES}")
+
+    results = [{"dim": vectors.shape[1], "projection": False, **await run_config(store, queries, truth, args.k)}]
+    for dim in args.dims:
+        t = time.perf_counter()
+        await store.fit_projection(dim=dim, sample=args.sample)
+        fit_s = time.perf_counter() - t
+        results.append({"dim": dim, "projection": True, "fit_s": round(fit_s, 2),
+                        **await run_config(store, queries, truth, args.k)})
+    for r in results:
+        label = f"PCA {r['dim']:4d}" if r["projection"] else f"full {r['dim']:4d}"
+        print(f"{label}  recall@{args.k} {r['recall_at_k']:.3f}  p50 {r['p50_ms']:7.2f}ms  p95 {r['p95_ms']:7.2f}ms  "
+              f"scan {r['scan_mb']:8.2f}MB" + (f"  (fit {r['fit_s']:.1f}s)" if r["projection"] else ""))
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--snapshot", default=None, help="SNAPSHOT_DIR of a real library (read-only)")
+    p.add_argument("--rows", type=int, default=50000, help="synthetic library size in segments")
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--latent", type=int, default=96, help="synthetic directions carrying the signal")
+    p.add_argument("--per-video", type=int, default=200)
+    p.add_argument("--dims", type=lambda s: [int(x) for x in s.split(",")], default=[32, 64, 96, 128])
+    p.add_argument("--sample", type=int, default=None, help="vectors to fit on (default PROJECTION_SAMPLE)")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=3)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--out", default=None, help="write results JSON here")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Wrote {out}")
@@ -0,0 +1,136 @@
+"""
+Cold-start benchmark for the Lecture Navigator API.
+
+Every measurement runs in a fresh interpreter so nothing is already imported:
+
+  * import:  time to `import app.main`, plus which heavy modules it pulled in
+  * cold:    first /api/search_timestamps request with nothing preloaded
+  * warm:    time for the lifespan preloads (store + embedding model), then the first request
+
+    python scripts/startup_benchmark.py --runs 5
+    python scripts/startup_benchmark.py --fake-embedder --out bench/startup.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+
+HEAVY_MODULES = ["sentence_transformers", "torch", "langchain_core", "langchain_openai",
+                 "youtube_transcript_api", "webvtt", "srt", "whisper", "faster_whisper", "sklearn"]
+
+
+def child_import() -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    import app.main  # noqa: F401
+    return {"import_ms": (time.perf_counter() - t0) * 1000,
+            "heavy_loaded": [m for m in HEAVY_MODULES if m in sys.modules]}
+
+
+async def child_request(preload: bool, fake_embedder: bool) -> Dict[str, Any]:
+    import httpx
+    from loguru import logger
+
+    t0 = time.perf_counter()
+    from app.main import app
+    from app.services import db as db_service
+    from app.services import search as search_service
+    from app.services.warmup import warm_up
+    import_ms = (time.perf_counter() - t0) * 1000
+
+    logger.disable("app")
+    db_service.set_store(db_service.InMemoryStore())
+    if fake_embedder:
+        from app.config import settings
+        sys.path.insert(0, str(ROOT / "scripts"))
+        from benchmark import FakeEmbedder
+        search_service.embed_texts = FakeEmbedder()
+        settings.PRELOAD_EMBEDDING_MODEL = False
+
+    out: Dict[str, Any] = {"import_ms": import_ms}
+    if preload:
+        t1 = time.perf_counter()
+        await warm_up()
+        out["preload_ms"] = (time.perf_counter() - t1) * 1000
+
+    segments = [{"start_time": 0.0, "end_time": 30.0, "text": "gradient descent follows the negative gradient",
+                 "metadata": {}}]
+    # index through the store directly so the first embedding happens on the request
+    store = await db_service.get_store()
+    dim = 384
+    await store.upsert_segments("startup", "Startup", [dict(segments[0], embedding=[1.0] + [0.0] * (dim - 1))])
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        t2 = time.perf_counter()
+        r = await client.post("/api/search_timestamps", json={"query": "what is gradient descent", "k": 1})
+        out["first_request_ms"] = (time.perf_counter() - t2) * 1000
+        out["status"] = r.status_code
+        t3 = time.perf_counter()
+        await client.post("/api/search_timestamps", json={"query": "explain the negative gradient", "k": 1})
+        out["second_request_ms"] = (time.perf_counter() - t3) * 1000
+    return out
+
+
+def run_child(args: List[str]) -> Dict[str, Any]:
+    proc = subprocess.run([sys.executable, __file__, "--child", *args], cwd=ROOT, capture_output=True,
+                          text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    keys = [k for k, v in runs[0].items() if isinstance(v, float)]
+    out: Dict[str, Any] = {k: statistics.median(r[k] for r in runs) for k in keys}
+    for k, v in runs[0].items():
+        if not isinstance(v, float):
+            out[k] = v
+    return out
+
+
+def main(args: argparse.Namespace) -> Dict[str, Any]:
+    extra = ["--fake-embedder"] if args.fake_embedder else []
+    report = {
+        "import": summarize([run_child(["import"]) for _ in range(args.runs)]),
+        "cold": summarize([run_child(["cold", *extra]) for _ in range(args.runs)]),
+        "warm": summarize([run_child(["warm", *extra]) for _ in range(args.runs)]),
+    }
+    imp, cold, warm = report["import"], report["cold"], report["warm"]
+    print(f"import app.main      {imp['import_ms']:8.1f} ms   heavy modules loaded: {imp['heavy_loaded'] or 'none'}")
+    print(f"cold first request   {cold['first_request_ms']:8.1f} ms   (second {cold['second_request_ms']:.1f} ms)")
+    print(f"warm preload         {warm['preload_ms']:8.1f} ms")
+    print(f"warm first request   {warm['first_request_ms']:8.1f} ms   (second {warm['second_request_ms']:.1f} ms)")
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--runs", type=int, default=3, help="fresh interpreters per measurement (median reported)")
+    p.add_argument("--fake-embedder", action="store_true", help="skip the real embedding model")
+    p.add_argument("--out", default=None, help="write results JSON here")
+    p.add_argument("--child", default=None, choices=["import", "cold", "warm"], help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        sys.path.insert(0, str(ROOT))
+        if args.child == "import":
+            result = child_import()
+        else:
+            result = asyncio.run(child_request(args.child == "warm", args.fake_embedder))
+        print(json.dumps(result))
+        sys.exit(0)
+    report = main(args)
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Wrote {out}")
@@ -0,0 +1,84 @@
+"""
+Real-time factor of each transcription backend on this machine.
+
+For every installed backend and model, the first --seconds of each audio file are transcribed
+once after loading the model. RTF is transcription time / audio duration, so anything below 1
+is faster than real time. Wall-clock and process CPU time are reported separately, since
+faster-whisper runs its own threads (TRANSCRIBE_CPU_THREADS).
+
+    python scripts/transcribe_benchmark.py lecture.mp3 --models tiny base small
+    python scripts/transcribe_benchmark.py lecture.mp3 --backends faster-whisper --out bench/asr.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.services.asr import BACKENDS, SAMPLE_RATE  # noqa: E402
+
+
+def bench_one(backend_name: str, model_name: str, audio: Any) -> Dict[str, Any]:
+    backend = BACKENDS[backend_name]
+    t0 = time.perf_counter()
+    model = backend.load_model(model_name)
+    load_s = time.perf_counter() - t0
+
+    audio_s = len(audio) / SAMPLE_RATE
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    segments = backend.transcribe(model, audio)
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    return {
+        "backend": backend_name,
+        "model": model_name,
+        "audio_s": round(audio_s, 1),
+        "load_s": round(load_s, 2),
+        "rtf_wall": round(wall / audio_s, 4) if audio_s else None,
+        "rtf_cpu": round(cpu / audio_s, 4) if audio_s else None,
+        "words": sum(len(text.split()) for _, _, text in segments),
+    }
+
+
+def main(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    backends = args.backends or list(BACKENDS)
+    results: List[Dict[str, Any]] = []
+    for name in backends:
+        backend = BACKENDS[name]
+        if not backend.available():
+            print(f"{name:15s} not installed, skipped")
+            continue
+        for path in args.audio:
+            audio = backend.load_audio(path)[: int(args.seconds * SAMPLE_RATE)]
+            for model_name in args.models:
+                r = bench_one(name, model_name, audio)
+                r["file"] = path
+                results.append(r)
+                print(f"{name:15s} {model_name:7s} {Path(path).name:24s} RTF wall {r['rtf_wall']:.3f}  "
+                      f"cpu {r['rtf_cpu']:.3f}  (load {r['load_s']:.1f}s, {r['words']} words)")
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("audio", nargs="+", help="audio or video files (decoded with the backend's own loader)")
+    p.add_argument("--backends", nargs="*", choices=sorted(BACKENDS), default=None, help="default: all installed")
+    p.add_argument("--models", nargs="*", default=["tiny", "base", "small"])
+    p.add_argument("--seconds", type=float, default=120.0, help="transcribe at most this much of each file")
+    p.add_argument("--out", default=None, help="write results JSON here")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = main(args)
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Wrote {out}")
@@ -57,3 +57,344 @@ def test_ingest_and_search(monkeypatch):
 
 
 
+
+
+def _index_fake_lecture(monkeypatch, video_id='LECT1'):
+    import asyncio
+    from app.services import db as db_service
+    from app.services import search as search_service
+    from app.services.answer_cache import answer_cache
+
+    answer_cache.clear()
+    search_service.clear_query_vectors()
+    monkeypatch.setattr(search_service, 'embed_texts', fake_embed_texts)
+    monkeypatch.setattr(db_service, '_store', db_service.InMemoryStore())
+    asyncio.run(search_service.index_segments(video_id, 'Lecture', fake_load_youtube_transcript('')))
+    return video_id
+
+
+def test_search_deadline_reports_degradations(monkeypatch):
+    from app.services.answer_cache import answer_cache
+
+    vid = _index_fake_lecture(monkeypatch)
+    client = TestClient(app)
+
+    r = client.post('/api/search_timestamps', json={"query": "machine learning", "k": 2, "video_id": vid})
+    assert r.status_code == 200 and r.json()['degraded'] == []
+
+    answer_cache.clear()
+    r = client.post('/api/search_timestamps', json={"query": "machine learning", "k": 2, "video_id": vid},
+                    headers={'X-Deadline-Ms': '0.001'})
+    data = r.json()
+    assert r.status_code == 200 and len(data['results']) >= 1
+    assert 'capped_candidates' in data['degraded']
+
+
+def test_search_rejects_reversed_time_range(monkeypatch):
+    vid = _index_fake_lecture(monkeypatch)
+    client = TestClient(app)
+
+    r = client.post('/api/search_timestamps', json={"query": "learning", "video_id": vid, "t_min": 40, "t_max": 10})
+    assert r.status_code == 422 and 't_min' in r.text
+    r = client.post('/api/search_timestamps', json={"query": "learning", "video_id": vid, "t_min": 10, "t_max": 40})
+    assert r.status_code == 200 and r.json()['results']
+
+
+def test_admission_rejects_when_queue_full():
+    import asyncio
+    from app.services.admission import Overloaded, ResourceLimiter
+
+    async def run():
+        lim = ResourceLimiter('transcribe', concurrency=1, queue_size=1, queue_timeout_s=0.05, retry_after_s=7)
+        async with lim.slot():
+            waiter = asyncio.create_task(lim.slot().__aenter__())
+            await asyncio.sleep(0)
+            try:
+                async with lim.slot():
+                    pass
+            except Overloaded as e:
+                rejected = e
+            try:
+                await waiter
+            except Overloaded as e:
+                timed_out = e
+        return rejected, timed_out
+
+    rejected, timed_out = asyncio.run(run())
+    assert (rejected.status_code, rejected.retry_after_s) == (429, 7)
+    assert timed_out.status_code == 503
+
+
+def test_near_duplicate_question_reuses_cached_answer(monkeypatch):
+    from app.services import metrics
+    from app.services import search as search_service
+
+    vid = _index_fake_lecture(monkeypatch)
+    client = TestClient(app)
+    calls = []
+    real_search = search_service.semantic_search
+
+    async def counting_search(*args, **kwargs):
+        calls.append(args)
+        return await real_search(*args, **kwargs)
+
+    monkeypatch.setattr('app.api.routes.semantic_search', counting_search)
+    first = client.post('/api/search_timestamps', json={"query": "machine learning", "k": 2, "video_id": vid}).json()
+    again = client.post('/api/search_timestamps', json={"query": "machine  learning?", "k": 2, "video_id": vid}).json()
+    assert len(calls) == 1
+    assert again['results'] == first['results'] and again['answer'] == first['answer']
+
+    # a re-ingest bumps the index version, so the cached answer is not reused
+    import asyncio
+    asyncio.run(search_service.index_segments(vid, 'Lecture', fake_load_youtube_transcript('')))
+    client.post('/api/search_timestamps', json={"query": "machine learning", "k": 2, "video_id": vid})
+    assert len(calls) == 2
+    assert metrics.snapshot()['counters']['answer_cache_hit'] >= 1
+
+
+def test_import_does_not_load_heavy_dependencies():
+    import subprocess
+    import sys
+
+    code = ("import sys, app.main; heavy = ('sentence_transformers', 'torch', 'langchain_core', "
+            "'youtube_transcript_api', 'webvtt', 'srt', 'whisper'); print([m for m in heavy if m in sys.modules])")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
+
+
+def test_ready_after_preload(monkeypatch):
+    from app.config import settings
+    from app.services import db as db_service
+    from app.services import warmup
+
+    monkeypatch.setattr(db_service, '_store', db_service.InMemoryStore())
+    monkeypatch.setattr(settings, 'PRELOAD_EMBEDDING_MODEL', False)
+    monkeypatch.setattr(warmup, 'readiness', warmup.Readiness())
+    monkeypatch.setattr('app.main.readiness', warmup.readiness)
+
+    client = TestClient(app)
+    assert client.get('/ready').status_code == 503
+    with TestClient(app) as client:
+        for _ in range(100):
+            r = client.get('/ready')
+            if r.status_code == 200:
+                break
+            import time
+            time.sleep(0.01)
+        assert r.status_code == 200
+        assert r.json()['components']['store']['status'] == 'ok'
+
+
+def test_history_pages_and_revalidates(monkeypatch):
+    import asyncio
+    from app.services import db as db_service
+    from app.services import search as search_service
+
+    vid = _index_fake_lecture(monkeypatch)
+    for i in range(4):
+        asyncio.run(search_service.index_segments(f'more{i}', f'More {i}', fake_load_youtube_transcript('')))
+    client = TestClient(app)
+
+    r = client.get('/api/history', params={'limit': 2})
+    assert r.status_code == 200 and r.headers['etag']
+    first = r.json()
+    assert [v['video_id'] for v in first['videos']] == ['more3', 'more2'] and first['next_cursor']
+    assert client.get('/api/history', params={'limit': 2}, headers={'If-None-Match': r.headers['etag']}).status_code == 304
+
+    seen = [v['video_id'] for v in first['videos']]
+    cursor = first['next_cursor']
+    while cursor:
+        page = client.get('/api/history', params={'limit': 2, 'cursor': cursor}).json()
+        seen += [v['video_id'] for v in page['videos']]
+        cursor = page['next_cursor']
+    assert seen == ['more3', 'more2', 'more1', 'more0', vid]
+
+    # any re-ingest changes the ETag
+    asyncio.run(search_service.index_segments(vid, 'Lecture', fake_load_youtube_transcript('')))
+    assert client.get('/api/history', params={'limit': 2}, headers={'If-None-Match': r.headers['etag']}).status_code == 200
+    assert client.get('/api/history', params={'cursor': 'not-a-cursor'}).status_code == 400
+
+
+def test_prepared_playback_is_served(monkeypatch, tmp_path):
+    from app.api import routes
+    from app.services import media
+
+    assert media.keyframe_times([30.0, 0.0, 15.0, 15.4, None]) == [0.0, 15.0, 30.0]
+    remux, encode = media.faststart_commands('in.wmv', 'out.mp4', [0.0, 15.0])
+    assert '+faststart' in remux and 'copy' in remux and '0,15' in encode
+
+    monkeypatch.setattr(routes, 'UPLOADS_DIR', str(tmp_path))
+    (tmp_path / 'local_x.mkv').write_bytes(b'raw')
+    client = TestClient(app)
+    assert client.get('/api/video/local_x.mkv').headers['content-type'] == 'video/x-matroska'
+
+    (tmp_path / 'local_x.faststart.mp4').write_bytes(b'fast')
+    r = client.get('/api/video/local_x.mkv')
+    assert r.content == b'fast' and r.headers['content-type'] == 'video/mp4'
+
+    out = tmp_path / 'hls' / 'local_x'
+    out.mkdir(parents=True)
+    (out / 'index.m3u8').write_text('#EXTM3U\n')
+    (out / 'seg_00000.ts').write_bytes(b'ts')
+    assert client.get('/api/hls/local_x/index.m3u8').headers['content-type'] == 'application/vnd.apple.mpegurl'
+    assert 'immutable' in client.get('/api/hls/local_x/seg_00000.ts').headers['cache-control']
+    assert client.get('/api/hls/local_x/secret.txt').status_code == 400
+
+
+def test_resegment_rebuilds_windows_from_stored_sentences(monkeypatch):
+    import asyncio
+    from app.services import db as db_service
+    from app.services import ingest as ingest_service
+    from app.services import search as search_service
+
+    embedded = []
+
+    def counting_embed(texts):
+        embedded.extend(texts)
+        return fake_embed_texts(texts)
+
+    monkeypatch.setattr(search_service, 'embed_texts', counting_embed)
+    monkeypatch.setattr(db_service, '_store', db_service.InMemoryStore())
+    sentences = [(i * 10.0, i * 10.0 + 9.0, f"sentence {i} about topic {i % 4}") for i in range(24)]
+    asyncio.run(ingest_service.run_ingest_pipeline('TALK', 'Talk', iter([sentences[:12], sentences[12:]])))
+    # a video indexed from windows only has no transcript to re-segment
+    asyncio.run(search_service.index_segments('BARE', 'Bare', fake_load_youtube_transcript('')))
+    client = TestClient(app)
+    before = {v['video_id']: v for v in client.get('/api/history').json()['videos']}
+
+    first = len(embedded)
+    r = client.post('/api/resegment', json={"video_id": "TALK", "window": 30, "overlap": 15})
+    assert r.status_code == 200
+    same = r.json()['videos'][0]
+    # the ingest's own parameters: every window is unchanged, nothing is embedded again
+    assert same['embedded'] == 0 and same['reused'] == same['segments'] and len(embedded) == first
+
+    r = client.post('/api/resegment', json={"window": 60, "overlap": 0})
+    assert r.status_code == 200
+    body = r.json()
+    assert body['skipped'] == ['BARE']
+    wide = body['videos'][0]
+    assert wide['segments'] < same['segments'] and wide['embedded'] == len(embedded) - first
+    store = asyncio.run(db_service.get_store())
+    windows = asyncio.run(store.list_segments('TALK'))
+    assert len(windows) == wide['segments'] and max(w['end_time'] - w['start_time'] for w in windows) > 30
+    # re-segmenting keeps the video's place in the history and records when it happened
+    after = client.get('/api/history').json()['videos']
+    assert [v['video_id'] for v in after] == list(before)
+    talk = next(v for v in after if v['video_id'] == 'TALK')
+    assert talk['created_at'] == before['TALK']['created_at'] and before['TALK']['segmented_at'] is None
+    assert talk['segmented_at'] > talk['created_at']
+
+    assert client.post('/api/resegment', json={"video_id": "BARE"}).status_code == 400
+    assert client.post('/api/resegment', json={"video_id": "NOPE"}).status_code == 404
+    assert client.post('/api/resegment', json={"window": 10, "overlap": 10}).status_code == 400
+
+
+def test_cross_encoder_reranks_within_budget_and_caches_scores(monkeypatch):
+    import asyncio
+    from app.config import settings
+    from app.services import rerank
+    from app.services import search as search_service
+    from app.services.deadline import Deadline
+
+    vid = _index_fake_lecture(monkeypatch)
+    calls = []
+
+    class FakeCrossEncoder:
+        def predict(self, pairs, batch_size=32, show_progress_bar=False):
+            calls.append(len(pairs))
+            return [1.0 if 'labeled' in text else 0.0 for _, text in pairs]
+
+    monkeypatch.setattr(settings, 'RERANK_MODEL', 'fake-cross-encoder')
+    monkeypatch.setattr(settings, 'SEARCH_COLLAPSE_OVERLAPS', False)
+    monkeypatch.setattr(rerank, 'get_reranker', lambda name=None: FakeCrossEncoder())
+    monkeypatch.setattr(rerank, 'score_cache', rerank.ScoreCache(100))
+    monkeypatch.setitem(rerank._cost, 'ms_per_pair', 1.0)
+    monkeypatch.setattr(rerank, '_measured', False)
+
+    docs = asyncio.run(search_service.semantic_search('machine learning', k=1, video_id=vid))
+    # vector search alone ranks the unsupervised-learning window first
+    assert 'labeled' in docs[0]['text'] and docs[0]['rerank_score'] == 1.0
+    assert calls == [3]
+    # the same question again is answered from the score cache
+    asyncio.run(search_service.semantic_search('Machine  learning', k=1, video_id=vid))
+    assert calls == [3]
+
+    # a budget too small for two pairs leaves the vector order and says so
+    monkeypatch.setitem(rerank._cost, 'ms_per_pair', 1000.0)
+    deadline = Deadline(None)
+    docs = asyncio.run(search_service.semantic_search('supervised data', k=1, video_id=vid, deadline=deadline))
+    assert 'rerank_score' not in docs[0] and deadline.degradations == ['skipped_rerank']
+    assert calls == [3]
+
+
+def test_logged_queries_are_replayed_after_restart_and_reingest(monkeypatch, tmp_path):
+    import asyncio
+    from app.config import settings
+    from app.services import agent
+    from app.services import query_log as query_log_service
+    from app.services import search as search_service
+    from app.services.answer_cache import answer_cache
+    from app.services.query_log import query_log, traffic
+
+    vid = _index_fake_lecture(monkeypatch)
+    monkeypatch.setattr(settings, 'SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(settings, 'QUERY_WARM_IDLE_S', 0.05)
+    monkeypatch.setattr(settings, 'QUERY_WARM_PAUSE_S', 0.0)
+    query_log.clear()
+    client = TestClient(app)
+    for q in ['What is supervised learning?', 'what is  supervised learning?', 'mail me at jo@example.com']:
+        assert client.post('/api/search_timestamps', json={"query": q, "k": 2, "video_id": vid}).status_code == 200
+    assert query_log.top(vid, 5) == [('what is supervised learning?', 2), ('mail me at <email>', 2)]
+
+    # a restart starts with cold caches but the saved log
+    query_log_service.save_query_log()
+    query_log.clear()
+    answer_cache.clear()
+    search_service.clear_query_vectors()
+    query_log_service.load_query_log()
+    replayed = []
+    real_warm = query_log_service.warm_query
+
+    async def counting_warm(*args):
+        replayed.append(args)
+        return await real_warm(*args)
+
+    monkeypatch.setattr(query_log_service, 'warm_query', counting_warm)
+    answers = []
+    real_answer = agent.generate_answer
+
+    async def counting_answer(*args):
+        answers.append(args[0])
+        return await real_answer(*args)
+
+    monkeypatch.setattr(agent, 'generate_answer', counting_answer)
+
+    async def run():
+        with traffic.live():
+            # a re-ingest schedules the warmer, which waits for live traffic to end
+            await search_service.index_segments(vid, 'Lecture', fake_load_youtube_transcript(''))
+            await asyncio.sleep(0.2)
+            assert replayed == []
+        await query_log_service._task
+
+    asyncio.run(run())
+    assert [(v, q) for v, q, *_ in replayed] == [(vid, 'what is supervised learning?'), (vid, 'mail me at <email>')]
+    # by default replays warm the query vectors but make no LLM calls for the answer cache
+    assert {q for _, q in search_service._query_vectors} == {'what is supervised learning?', 'mail me at <email>'}
+    assert answers == [] and len(answer_cache) == 0
+
+    # opted in, the warmer answers at most QUERY_WARM_ANSWER_MAX queries per pass
+    monkeypatch.setattr(settings, 'QUERY_WARM_ANSWERS', True)
+    monkeypatch.setattr(settings, 'QUERY_WARM_ANSWER_MAX', 1)
+    replayed.clear()
+
+    async def warm_again():
+        query_log_service.schedule_warm([vid])
+        await query_log_service._task
+
+    asyncio.run(warm_again())
+    assert len(replayed) == 2 and len(answers) == 1 and len(answer_cache) == 1
+    hits = answer_cache.hits
+    r = client.post('/api/search_timestamps', json={"query": "What is supervised learning?", "k": 2, "video_id": vid})
+    assert r.status_code == 200 and answer_cache.hits == hits + 1
@@ -32,3 +32,110 @@ Second line
 
 
 
+
+
+def _tone_with_gaps(rate, layout):
+    import numpy as np
+    rng = np.random.default_rng(0)
+    parts = []
+    for kind, seconds in layout:
+        n = int(seconds * rate)
+        if kind == 'speech':
+            t = np.arange(n) / rate
+            parts.append(0.3 * np.sin(2 * np.pi * 220 * t))
+        else:
+            parts.append(0.001 * rng.standard_normal(n))
+    return np.concatenate(parts).astype('float32')
+
+
+def test_speech_regions_skip_silence():
+    from app.services.vad import speech_regions
+
+    rate = 16000
+    audio = _tone_with_gaps(rate, [('silence', 10), ('speech', 5), ('silence', 0.5), ('speech', 3), ('silence', 20)])
+    regions = speech_regions(audio, rate, pad_s=0.2)
+    # the half-second pause is bridged, the long silences are dropped
+    assert len(regions) == 1
+    start, end = (x / rate for x in regions[0])
+    assert abs(start - 9.8) < 0.1 and abs(end - 18.7) < 0.1
+
+
+def test_whisper_source_maps_timestamps_back(monkeypatch):
+    import sys
+    import types
+
+    from app.config import settings
+    from app.services import transcript
+
+    rate = 16000
+    audio = _tone_with_gaps(rate, [('silence', 30), ('speech', 4), ('silence', 30), ('speech', 4), ('silence', 2)])
+
+    class FakeModel:
+        def transcribe(self, chunk):
+            # one sentence per second of spliced audio
+            return {"segments": [{"start": float(i), "end": i + 1.0, "text": f"word {i}"}
+                                 for i in range(int(len(chunk) / rate))]}
+
+    fake = types.SimpleNamespace(load_audio=lambda path: audio, audio=types.SimpleNamespace(SAMPLE_RATE=rate))
+    monkeypatch.setitem(sys.modules, 'whisper', fake)
+    # the fake stands in for openai-whisper, whatever "auto" would pick on this machine
+    monkeypatch.setattr(settings, 'TRANSCRIBE_BACKEND', 'openai-whisper')
+    monkeypatch.setattr(transcript, 'get_whisper_model', lambda name: FakeModel())
+    monkeypatch.setattr(transcript.os.path, 'exists', lambda p: True)
+    monkeypatch.setattr(transcript.os.path, 'getsize', lambda p: 1024)
+
+    source = transcript.WhisperSource('lecture.mp4', chunk_s=300.0)
+    sentences = [s for batch in source for s in batch]
+    starts = [s[0] for s in sentences]
+    assert all(29.5 < t < 34.5 or 63.5 < t < 68.5 for t in starts)
+    assert any(t > 63.5 for t in starts)
+    assert source.summary()['skipped_pct'] > 85
+
+    # silence only: no model is chosen or loaded
+    audio = _tone_with_gaps(rate, [('silence', 20)])
+    loaded = []
+    monkeypatch.setattr(transcript, 'get_whisper_model', lambda name: loaded.append(name))
+    source = transcript.WhisperSource('silent.mp4', chunk_s=300.0)
+    assert list(source) == [] and loaded == [] and source.model_name == ''
+
+
+def test_faster_whisper_backend_and_duration_based_model(monkeypatch):
+    import sys
+    import types
+
+    from app.config import settings
+    from app.services import asr, transcript
+
+    monkeypatch.setattr(asr, '_observed_rtf', {})
+    fast = asr.get_backend('faster-whisper')
+    monkeypatch.setattr(settings, 'WHISPER_MODELS', ['tiny', 'base', 'small'])
+    monkeypatch.setattr(settings, 'TRANSCRIBE_CPU_BUDGET_S', 600.0)
+    # a short talk fits the largest model, a long lecture falls back to a smaller one
+    assert asr.choose_model(fast, 20 * 60) == 'small'
+    assert asr.choose_model(fast, 2 * 3600) == 'base'
+    assert asr.choose_model(asr.get_backend('openai-whisper'), 2 * 3600) == 'tiny'
+
+    rate = asr.SAMPLE_RATE
+    audio = _tone_with_gaps(rate, [('speech', 5), ('silence', 10), ('speech', 5)])
+    loaded = []
+
+    class FakeModel:
+        def __init__(self, name, device, compute_type, cpu_threads):
+            loaded.append((name, compute_type))
+
+        def transcribe(self, chunk, beam_size, vad_filter):
+            seg = types.SimpleNamespace(start=0.5, end=1.5, text=' hello ')
+            return iter([seg]), None
+
+    fake = types.SimpleNamespace(WhisperModel=FakeModel, decode_audio=lambda path, sampling_rate: audio)
+    monkeypatch.setitem(sys.modules, 'faster_whisper', fake)
+    monkeypatch.setattr(settings, 'TRANSCRIBE_BACKEND', 'faster-whisper')
+    monkeypatch.setattr(asr, '_models', {})
+    monkeypatch.setattr(transcript.os.path, 'exists', lambda p: True)
+    monkeypatch.setattr(transcript.os.path, 'getsize', lambda p: 1024)
+
+    source = transcript.WhisperSource('lecture.mp4', chunk_s=300.0)
+    sentences = [s for batch in source for s in batch]
+    assert sentences and sentences[0][2] == 'hello'
+    assert loaded == [('small', 'int8')] and source.backend.name == 'faster-whisper'
+    assert ('faster-whisper', 'small') in asr._observed_rtf
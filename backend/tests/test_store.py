@@ -0,0 +1,714 @@
+from __future__ import annotations
+
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from app.services.db import InMemoryStore, MongoStore
+
+
+def _segments(video: str, n: int, dim: int = 8, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "start_time": i * 15.0,
+            "end_time": i * 15.0 + 30.0,
+            "text": f"{video} segment {i}",
+            "metadata": {},
+            "embedding": rng.random(dim).tolist(),
+        }
+        for i in range(n)
+    ]
+
+
+def test_search_scoped_and_global():
+    async def run():
+        store = InMemoryStore()
+        await store.upsert_segments("a", "A", _segments("a", 5, seed=1))
+        await store.upsert_segments("b", "B", _segments("b", 5, seed=2))
+        q = _segments("a", 1, seed=1)[0]["embedding"]
+        top = await store.search(q, 3, None)
+        assert top[0]["video_id"] == "a" and top[0]["start_time"] == 0.0
+        assert all(d["video_id"] == "b" for d in await store.search(q, 3, "b"))
+        # re-ingest replaces the video's segments
+        await store.upsert_segments("a", "A", _segments("a", 2, seed=3))
+        assert len(await store.list_segments("a")) == 2
+
+    asyncio.run(run())
+
+
+def test_quantized_storage_matches_float32_ranking():
+    async def run():
+        segs = _segments("a", 50, dim=32, seed=4)
+        q = np.random.default_rng(9).random(32).tolist()
+        ranked = {}
+        for storage in ("float32", "float16", "int8"):
+            store = InMemoryStore(storage=storage, rescore=True)
+            await store.upsert_segments("a", "A", [dict(s) for s in segs])
+            ranked[storage] = [d["start_time"] for d in await store.search(q, 3, "a")]
+            top = (await store.search(q, 1, None))[0]
+            assert top["title"] == "A" and top["snippet"] == top["text"][:300]
+        assert ranked["float16"] == ranked["float32"] == ranked["int8"]
+        assert InMemoryStore(storage="int8")._storage == "int8"
+
+    asyncio.run(run())
+
+
+def test_snapshot_restart_maps_embeddings(tmp_path):
+    async def run():
+        store = InMemoryStore(snapshot_dir=str(tmp_path))
+        await store.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        await store.snapshot()
+
+        warm = InMemoryStore(snapshot_dir=str(tmp_path))
+        assert all(isinstance(t.codes, np.memmap) for t in warm._shards)
+        q = _segments("a", 1, seed=1)[0]["embedding"]
+        assert (await warm.search(q, 1, "a"))[0]["start_time"] == 0.0
+
+        # upserts after the snapshot are recovered from the log
+        await warm.upsert_segments("b", "B", _segments("b", 3, seed=2))
+        again = InMemoryStore(snapshot_dir=str(tmp_path))
+        assert {v["video_id"] for v in await again.get_videos()} == {"a", "b"}
+        assert len(await again.list_segments(None)) == 7
+
+    asyncio.run(run())
+
+
+def test_snapshot_during_logged_upsert_keeps_it_in_one_place(tmp_path, monkeypatch):
+    import threading
+    import time
+    from app.services.snapshot import SnapshotManager
+
+    appending = threading.Event()
+    append = SnapshotManager.append
+
+    def slow_append(self, record):
+        appending.set()
+        time.sleep(0.1)
+        return append(self, record)
+
+    async def run():
+        store = InMemoryStore(snapshot_dir=str(tmp_path))
+        await store.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        monkeypatch.setattr(SnapshotManager, "append", slow_append)
+        upsert = asyncio.create_task(store.upsert_segments("b", "B", _segments("b", 3, seed=2)))
+        while not appending.is_set():
+            await asyncio.sleep(0.01)
+        await store.snapshot()
+        await upsert
+        monkeypatch.setattr(SnapshotManager, "append", append)
+
+        # "b" is in the snapshot, and the new generation's log does not replay it again
+        restarted = InMemoryStore(snapshot_dir=str(tmp_path))
+        assert {v["video_id"] for v in await restarted.get_videos()} == {"a", "b"}
+        assert list(restarted._snapshots.read_log({})) == []
+        assert await restarted.library_version() == await store.library_version()
+
+    asyncio.run(run())
+
+
+def test_mongo_fallback_scan_returns_projected_topk():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        store = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        await store.upsert_segments("a", "A", _segments("a", 20, seed=1))
+        await store.upsert_segments("b", "B", _segments("b", 20, seed=2))
+        q = _segments("a", 1, seed=1)[0]["embedding"]
+        top = await store.search(q, 3, "a")
+        assert len(top) == 3 and top[0]["start_time"] == 0.0
+        assert all("embedding" not in d and d["video_id"] == "a" for d in top)
+        assert [d["score"] for d in top] == sorted((d["score"] for d in top), reverse=True)
+
+    asyncio.run(run())
+
+
+def test_reindex_embeds_and_writes_only_changed_segments(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from app.services import db as db_service
+    from app.services import search as search_service
+
+    embedded = []
+
+    def fake_embed(texts):
+        embedded.extend(texts)
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    monkeypatch.setattr(search_service, "embed_texts", fake_embed)
+
+    def lecture(last_text):
+        return [
+            {"start_time": 0.0, "end_time": 30.0, "text": "intro to learning", "metadata": {}},
+            {"start_time": 15.0, "end_time": 45.0, "text": "gradient descent", "metadata": {}},
+            {"start_time": 30.0, "end_time": 60.0, "text": last_text, "metadata": {}},
+        ]
+
+    async def run():
+        store = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        await store.ensure_indexes()
+        monkeypatch.setattr(db_service, "_store", store)
+        await search_service.index_segments("v", "V", lecture("wrap up"))
+        assert len(embedded) == 3 and await store.library_version() == 1
+
+        embedded.clear()
+        await search_service.index_segments("v", "V", lecture("summary and questions"))
+        assert embedded == ["summary and questions"]
+        texts = sorted(d["text"] for d in await store.list_segments("v"))
+        assert texts == ["gradient descent", "intro to learning", "summary and questions"]
+        # unchanged documents were kept, not rewritten
+        assert await store.col.count_documents({"video_id": "v", "v_from": 1, "v_to": db_service.LIVE_VERSION}) == 2
+
+    asyncio.run(run())
+
+
+def test_library_search_routes_through_video_centroids(monkeypatch):
+    from app.config import settings
+
+    def topic(direction, n):
+        base = np.zeros(8)
+        base[direction] = 1.0
+        rng = np.random.default_rng(direction)
+        return [
+            {"start_time": i * 15.0, "end_time": i * 15.0 + 30.0, "text": f"t{direction} {i}",
+             "embedding": (base + 0.1 * rng.random(8)).tolist()}
+            for i in range(n)
+        ]
+
+    async def run():
+        store = InMemoryStore()
+        for d in range(4):
+            await store.upsert_segments(f"v{d}", f"V{d}", topic(d, 6))
+        q = np.eye(8)[2].tolist()
+        monkeypatch.setattr(settings, "ROUTING_TOP_VIDEOS", 1)
+        routed = await store.search(q, 5, None)
+        assert {d["video_id"] for d in routed} == {"v2"}
+        monkeypatch.setattr(settings, "ROUTING_TOP_VIDEOS", 0)
+        assert (await store.search(q, 1, None))[0]["video_id"] == "v2"
+
+    asyncio.run(run())
+
+
+def test_sharded_parallel_search_matches_single_shard(monkeypatch):
+    from app.config import settings
+
+    async def run():
+        single, sharded = InMemoryStore(shards=1), InMemoryStore(shards=4)
+        for v in range(12):
+            segs = _segments(f"v{v}", 10, seed=v)
+            await single.upsert_segments(f"v{v}", f"V{v}", [dict(s) for s in segs])
+            await sharded.upsert_segments(f"v{v}", f"V{v}", [dict(s) for s in segs])
+        monkeypatch.setattr(settings, "SEARCH_PARALLEL_MIN_ROWS", 0)
+        monkeypatch.setattr(settings, "SEARCH_WORKERS", 3)
+        q = np.random.default_rng(42).random(8).tolist()
+        expect = [(d["video_id"], d["start_time"]) for d in await single.search(q, 5, None)]
+        got = [(d["video_id"], d["start_time"]) for d in await sharded.search(q, 5, None)]
+        assert got == expect
+        assert {d["video_id"] for d in await sharded.search(q, 5, "v3")} == {"v3"}
+
+    asyncio.run(run())
+
+
+def test_collapsed_spans_do_not_depend_on_sharding():
+    def vec(score):
+        return [score, float(np.sqrt(1 - score * score))] + [0.0] * 6
+
+    async def run():
+        single, sharded = InMemoryStore(shards=1), InMemoryStore(shards=4)
+        # "a" alone in its shard; its windows chain, each overlapping the previous one
+        a = "v0"
+        b, c = [v for v in (f"v{i}" for i in range(1, 40)) if sharded._shard_of(v) != sharded._shard_of(a)][:2]
+        scores = {a: [0.99, 0.98, 0.5, 0.45, 0.4, 0.35], b: [0.97], c: [0.9]}
+        for video, top in scores.items():
+            segs = _segments(video, 6)
+            for s, score in zip(segs, top + [0.1] * 6):
+                s["embedding"] = vec(score)
+            for store in (single, sharded):
+                await store.upsert_segments(video, video.upper(), [dict(s) for s in segs])
+        q = vec(1.0)
+        got = [
+            [(d["video_id"], d["start_time"], d["end_time"], d.get("merged", 1))
+             for d in await store.search(q, 2, None, collapse=True)]
+            for store in (single, sharded)
+        ]
+        # the merged ranking reaches c's hit before a's third window, so "a" stops at two windows
+        assert got[0] == [(a, 0.0, 45.0, 2), (b, 0.0, 30.0, 1)]
+        assert got[1] == got[0]
+
+    asyncio.run(run())
+
+
+def test_time_range_narrows_candidates():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        segs = _segments("a", 10, seed=5)  # [0,30], [15,45], ..., [135,165]
+        mem = InMemoryStore()
+        mongo = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        q = segs[0]["embedding"]
+        for store in (mem, mongo):
+            await store.upsert_segments("a", "A", [dict(s) for s in segs])
+            await store.upsert_segments("b", "B", _segments("b", 10, seed=6))
+            hits = await store.search(q, 10, "a", t_min=60.0, t_max=100.0)
+            assert sorted(d["start_time"] for d in hits) == [30.0, 45.0, 60.0, 75.0, 90.0]
+            library = await store.search(q, 50, None, t_min=150.0)
+            assert {d["start_time"] for d in library} == {120.0, 135.0}
+            assert len(await store.list_segments("a", t_max=20.0)) == 2
+
+    asyncio.run(run())
+
+
+def test_collapse_merges_overlapping_windows():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        # windows overlap by 15s; the query matches the first 4 windows almost equally
+        segs = _segments("a", 12, seed=7)
+        for i, s in enumerate(segs):
+            s["embedding"] = [1.0, 0.01 * i] + [0.0] * 6 if i < 4 else [0.0, 1.0] + [0.0] * 6
+        for store in (InMemoryStore(), MongoStore(client=mongomock_motor.AsyncMongoMockClient())):
+            await store.upsert_segments("a", "A", [dict(s) for s in segs])
+            plain = await store.search([1.0] + [0.0] * 7, 2, "a")
+            assert abs(plain[0]["start_time"] - plain[1]["start_time"]) == 15.0
+            spans = await store.search([1.0] + [0.0] * 7, 2, "a", collapse=True)
+            assert spans[0]["start_time"] == 0.0 and spans[0]["end_time"] == 45.0
+            assert spans[0]["merged"] == 3
+            assert spans[1]["start_time"] >= spans[0]["end_time"] or spans[1]["end_time"] <= spans[0]["start_time"]
+
+    asyncio.run(run())
+
+
+def test_collapse_fetches_deeper_until_k_spans(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "COLLAPSE_OVERFETCH", 1)
+
+    async def run():
+        # the 6 best windows chain into one span, so k hits are never enough
+        segs = _segments("a", 12, seed=7)
+        for i, s in enumerate(segs):
+            s["embedding"] = [1.0, 0.01 * i] + [0.0] * 6 if i < 6 else [0.2, 1.0 + 0.1 * i] + [0.0] * 6
+        spans = []
+        for store in (InMemoryStore(), MongoStore(client=mongomock_motor.AsyncMongoMockClient())):
+            await store.upsert_segments("a", "A", [dict(s) for s in segs])
+            spans.append([(d["start_time"], d["end_time"]) for d in await store.search([1.0] + [0.0] * 7, 3, "a", collapse=True)])
+        assert len(spans[0]) == 3 and spans[1] == spans[0]
+
+    asyncio.run(run())
+
+
+def test_pipelined_ingest_stages_writes_until_commit(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from app.config import settings
+    from app.services import db as db_service
+    from app.services import ingest as ingest_service
+    from app.services import search as search_service
+    from app.services.transcript import segment_transcript
+
+    monkeypatch.setattr(search_service, "embed_texts", lambda texts: [[float(len(t)), 1.0, 0.5] for t in texts])
+    monkeypatch.setattr(settings, "INGEST_EMBED_BATCH", 2)
+    monkeypatch.setattr(settings, "INGEST_QUEUE_SIZE", 1)
+    sentences = [(i * 10.0, i * 10.0 + 12.0, f"sentence number {i}") for i in range(30)]
+
+    async def run():
+        store = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        await store.ensure_indexes()
+        monkeypatch.setattr(db_service, "_store", store)
+        seen_while_running = []
+
+        def source():
+            for i in range(0, len(sentences), 4):
+                # nothing is searchable before the commit, even once earlier chunks were written
+                seen_while_running.append(len(asyncio.run_coroutine_threadsafe(
+                    store.list_segments("v"), loop).result()))
+                yield sentences[i:i + 4]
+
+        loop = asyncio.get_running_loop()
+        report = await ingest_service.run_ingest_pipeline("v", "V", source())
+        expected = segment_transcript(sentences)
+        assert report["segments"] == len(expected)
+        assert set(seen_while_running) == {0}
+        assert await store.col.count_documents({"ingest_id": {"$exists": True}}) == 0
+        stored = sorted((d["start_time"], d["text"]) for d in await store.list_segments("v"))
+        assert stored == sorted((s["start_time"], s["text"]) for s in expected)
+        assert report["stages"]["embed"]["items"] == len(expected)
+        # the sentences are kept with the video for re-segmentation
+        assert await store.get_transcript("v") == sentences
+
+    asyncio.run(run())
+
+
+def test_mongo_history_keyset_pages():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from app.services.db import VIDEO_FIELDS
+
+    async def run():
+        store = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        await store.ensure_indexes()
+        for v in ["a", "b", "c"]:
+            await store.upsert_segments(v, v.upper(), _segments(v, 2))
+        first = await store.get_videos(limit=2)
+        assert [d["video_id"] for d in first] == ["c", "b"]
+        assert set(first[0]) <= set(VIDEO_FIELDS)
+        last = first[-1]
+        rest = await store.get_videos(limit=2, after=(last["created_at"], last["video_id"]))
+        assert [d["video_id"] for d in rest] == ["a"]
+
+    asyncio.run(run())
+
+
+def test_shared_index_across_workers(tmp_path):
+    async def run():
+        # two stores on one dir stand in for two uvicorn workers
+        writer = InMemoryStore(snapshot_dir=str(tmp_path), shared=True, shards=2)
+        reader = InMemoryStore(snapshot_dir=str(tmp_path), shared=True, shards=2)
+        assert writer._writer and not reader._writer
+
+        # an upsert through either worker becomes visible to the other on its next sync
+        await reader.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        writer.sync()
+        assert len(await writer.list_segments("a")) == 4
+
+        await writer.snapshot()
+        await writer.upsert_segments("d", "D", _segments("d", 3, seed=2))
+        reader.sync()
+        # the reader re-mapped the new generation instead of keeping its private copy
+        # ("a" and "d" hash to different shards)
+        assert isinstance(reader._shards[reader._shard_of("a")].codes, np.memmap)
+        assert len(await reader.list_segments(None)) == 7
+        assert await reader.library_version() == await writer.library_version() == 2
+
+        q = _segments("d", 1, seed=2)[0]["embedding"]
+        assert (await reader.search(q, 2, None)) == (await writer.search(q, 2, None))
+
+        # the writer lock passes on when the writer goes away
+        await writer.close()
+        reader.sync()
+        assert reader._writer
+
+    asyncio.run(run())
+
+
+def test_failed_remap_keeps_serving_the_previous_generation(tmp_path, monkeypatch):
+    async def run():
+        writer = InMemoryStore(snapshot_dir=str(tmp_path), shared=True, shards=2)
+        reader = InMemoryStore(snapshot_dir=str(tmp_path), shared=True, shards=2)
+        await writer.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        await writer.snapshot()
+        reader.sync()
+        first = reader._snapshots.generation
+        assert len(await reader.list_segments(None)) == 4
+
+        await writer.upsert_segments("b", "B", _segments("b", 3, seed=2))
+        await writer.snapshot()
+        # the generation the reader still maps outlives one more write
+        assert os.path.exists(reader._snapshots._gen_dir(first))
+
+        load = reader._snapshots.load
+
+        def vanished(gen=None):
+            raise FileNotFoundError("replaced mid-load")
+
+        monkeypatch.setattr(reader._snapshots, "load", vanished)
+        reader.sync()
+        assert reader._snapshots.generation == first
+        # still the previous generation, plus the upsert tailed from its log
+        assert len(await reader.list_segments(None)) == 7
+        assert not isinstance(reader._shards[reader._shard_of("b")].codes, np.memmap)
+
+        # retried on the next sync
+        monkeypatch.setattr(reader._snapshots, "load", load)
+        reader.sync()
+        assert reader._snapshots.generation == writer._snapshots.generation
+        assert len(await reader.list_segments(None)) == 7
+
+    asyncio.run(run())
+
+
+def test_shared_upsert_in_a_superseded_model_is_refused(tmp_path, monkeypatch):
+    from app.config import settings
+    from app.services import db as db_service
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "old-model")
+
+    async def run():
+        writer = InMemoryStore(snapshot_dir=str(tmp_path), shared=True, shards=2)
+        reader = InMemoryStore(snapshot_dir=str(tmp_path), shared=True, shards=2)
+        await writer.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        reader.sync()
+
+        # the writer switches models; the reader has not polled yet
+        migration = await writer.begin_migration("new-model")
+        await migration.write(await writer.get_video("a"), await writer.list_segments("a"), [[1.0, 0.0]] * 4)
+        await migration.commit(await writer.library_version())
+        assert reader._model == "old-model"
+        with pytest.raises(db_service.EmbeddingSpaceChanged):
+            await reader.upsert_segments("b", "B", _segments("b", 3, seed=2), model="old-model")
+        assert reader._model == "new-model" and await reader.get_video("b") is None
+
+        # switched but not yet published: refused under the log lock, nothing is logged
+        writer._snapshots.switch_model("next-model")
+        with pytest.raises(db_service.EmbeddingSpaceChanged):
+            await reader.upsert_segments("c", "C", [dict(s, embedding=[1.0, 0.5]) for s in _segments("c", 2)])
+        assert await reader.get_video("c") is None
+        assert not [r for r in reader._snapshots.read_log({}) if r["video"]["video_id"] in ("b", "c")]
+
+    asyncio.run(run())
+
+
+def test_embedding_migration_switches_models_at_once(tmp_path, monkeypatch):
+    from app.config import settings
+    from app.services import db as db_service
+    from app.services import migration as migration_service
+    from app.services import search as search_service
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "old-model")
+    monkeypatch.setattr(settings, "MIGRATION_BATCH", 2)
+    monkeypatch.setattr(settings, "MIGRATION_PAUSE_S", 0.0)
+
+    async def run():
+        store = InMemoryStore(snapshot_dir=str(tmp_path), shards=2)
+        monkeypatch.setattr(db_service, "_store", store)
+        await store.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        await store.upsert_segments("d", "D", _segments("d", 3, seed=2))
+        stale = await store.begin_ingest("d", "D")
+        await stale.write(_segments("d", 2, seed=3))
+        old_query = _segments("a", 1, seed=1)[0]["embedding"]
+        loop = asyncio.get_running_loop()
+        served_during = []
+
+        def fake_embed(texts, model_name=None):
+            if not served_during:
+                # mid-migration: searches still use the old vectors, and a re-ingest lands
+                served_during.append(len(asyncio.run_coroutine_threadsafe(store.search(old_query, 3, None), loop).result()))
+                asyncio.run_coroutine_threadsafe(
+                    store.upsert_segments("a", "A2", _segments("a", 2, seed=4)), loop
+                ).result()
+            return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+        monkeypatch.setattr(search_service, "embed_texts", fake_embed)
+        monkeypatch.setattr(settings, "EMBEDDING_MODEL", "new-model")
+        before = await store.library_version()
+        report = await migration_service.migrate_embeddings()
+
+        assert served_during == [3]
+        assert report["state"] == "done" and report["source_model"] == "old-model"
+        assert await store.library_state() == (before + 2, "new-model")
+        assert {t.dim for t in store._shards if len(t)} == {3}
+        assert sorted(s["title"] for s in await store.list_segments("a")) == ["A2", "A2"]
+        assert len(await store.search([1.0, 1.0, 0.5], 3, None)) == 3
+        # an ingest embedded with the old model cannot publish into the new space
+        with pytest.raises(db_service.EmbeddingSpaceChanged):
+            await stale.commit()
+
+        restarted = InMemoryStore(snapshot_dir=str(tmp_path), shards=2)
+        assert await restarted.embedding_model() == "new-model"
+        assert len(await restarted.list_segments(None)) == 5
+
+    asyncio.run(run())
+
+
+def test_embedding_migration_gives_up_when_the_switch_keeps_losing(monkeypatch):
+    from app.config import settings
+    from app.services import db as db_service
+    from app.services import migration as migration_service
+    from app.services import search as search_service
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "old-model")
+    monkeypatch.setattr(settings, "MIGRATION_PAUSE_S", 0.0)
+    monkeypatch.setattr(settings, "MIGRATION_COMMIT_RETRIES", 3)
+    monkeypatch.setattr(search_service, "embed_texts", lambda texts, model_name=None: [[1.0, 0.0] for _ in texts])
+    attempts = []
+
+    async def losing_commit(self, version):
+        attempts.append(version)
+        return False
+
+    monkeypatch.setattr(db_service.MemoryMigration, "commit", losing_commit)
+
+    async def run():
+        store = InMemoryStore()
+        monkeypatch.setattr(db_service, "_store", store)
+        await store.upsert_segments("a", "A", _segments("a", 3))
+        monkeypatch.setattr(settings, "EMBEDDING_MODEL", "new-model")
+        with pytest.raises(RuntimeError):
+            await migration_service.migrate_embeddings()
+        assert len(attempts) == 3
+        assert migration_service.progress.state == "failed"
+        assert await store.embedding_model() == "old-model"
+
+    asyncio.run(run())
+
+
+def test_mongo_embedding_migration_publishes_one_version(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from app.config import settings
+    from app.services import db as db_service
+    from app.services import migration as migration_service
+    from app.services import search as search_service
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "old-model")
+    monkeypatch.setattr(settings, "MIGRATION_PAUSE_S", 0.0)
+    monkeypatch.setattr(search_service, "embed_texts", lambda texts, model_name=None: [[1.0, 0.0] for _ in texts])
+
+    async def run():
+        store = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        await store.ensure_indexes()
+        monkeypatch.setattr(db_service, "_store", store)
+        for v in ["a", "b"]:
+            await store.upsert_segments(v, v.upper(), _segments(v, 3))
+        old_version, model = await store.library_state()
+        assert model == "old-model"
+
+        monkeypatch.setattr(settings, "EMBEDDING_MODEL", "new-model")
+        await migration_service.migrate_embeddings(gc_grace_s=0.0)
+
+        version, model = await store.library_state()
+        assert (version, model) == (old_version + 1, "new-model")
+        live = [d async for d in store.col.find(await store._visible(None, version))]
+        assert len(live) == 6 and all(d["embedding"] == [1.0, 0.0] for d in live)
+        # the old vectors were garbage-collected after the grace period
+        assert await store.col.count_documents({}) == 6
+        assert await store.col.count_documents({"ingest_id": {"$exists": True}}) == 0
+        assert [len(v["centroid"]) async for v in store.videos_col.find({})] == [2, 2]
+
+    asyncio.run(run())
+
+
+def test_library_parquet_round_trip_memory_to_mongo(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from app.config import settings
+    from app.services import db as db_service
+    from app.services.library_io import export_library, import_library
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "export-model")
+
+    async def run():
+        source = InMemoryStore()
+        monkeypatch.setattr(db_service, "_store", source)
+        await source.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        await source.upsert_segments("b", "B", _segments("b", 3, seed=2))
+        report = await export_library(str(tmp_path), batch_size=3)
+        assert (report["videos"], report["segments"], report["dim"]) == (2, 7, 8)
+        version = report["library_version"]
+
+        # a fresh node configured for another model takes over the export's
+        monkeypatch.setattr(settings, "EMBEDDING_MODEL", "other-model")
+        target = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        await target.ensure_indexes()
+        monkeypatch.setattr(db_service, "_store", target)
+        report = await import_library(str(tmp_path), batch_size=3)
+        assert (report["videos"], report["segments"]) == (2, 7)
+        assert await target.embedding_model() == "export-model"
+
+        assert [s["text"] for s in await target.list_segments("b")] == [s["text"] for s in await source.list_segments("b")]
+        q = _segments("b", 1, seed=2)[0]["embedding"]
+        assert [(d["video_id"], d["start_time"]) for d in await target.search(q, 3, None)] == \
+            [(d["video_id"], d["start_time"]) for d in await source.search(q, 3, None)]
+        # a library in another model refuses the import instead of mixing embedding spaces
+        other = InMemoryStore()
+        await other.upsert_segments("c", "C", _segments("c", 2))
+        monkeypatch.setattr(db_service, "_store", other)
+        with pytest.raises(ValueError):
+            await import_library(str(tmp_path))
+
+        # one table at a time; a pair from different library versions is refused on import
+        monkeypatch.setattr(db_service, "_store", source)
+        mixed = tmp_path / "mixed"
+        report = await export_library(str(mixed), tables=["segments"])
+        assert report["videos"] is None and sorted(os.listdir(mixed)) == ["segments.parquet"]
+        assert report["library_version"] == version
+        await source.upsert_segments("c", "C", _segments("c", 2, seed=3))
+        assert (await export_library(str(mixed), tables=["videos"]))["library_version"] != version
+        with pytest.raises(ValueError, match="different exports"):
+            await import_library(str(mixed))
+
+    asyncio.run(run())
+
+
+def test_library_export_reads_one_version(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import pyarrow.parquet as pq
+    from app.services import db as db_service
+    from app.services.library_io import export_library
+
+    async def run():
+        store = MongoStore(client=mongomock_motor.AsyncMongoMockClient())
+        await store.ensure_indexes()
+        monkeypatch.setattr(db_service, "_store", store)
+        await store.upsert_segments("a", "A", _segments("a", 4, seed=1))
+        before = await store.library_version()
+        await store.upsert_segments("b", "B", _segments("b", 3, seed=2))
+        # segments are read at the requested version, not whatever is current
+        pinned = [n for batch in [b async for b in store.dump_segments(100, before)] for n in batch["video_id"]]
+        assert pinned == ["a"] * 4
+
+        # a commit landing mid-export makes it start over at the new version
+        dump_videos = store.dump_videos
+        calls = []
+
+        async def racing_dump_videos():
+            calls.append(1)
+            if len(calls) == 1:
+                await store.upsert_segments("c", "C", _segments("c", 2, seed=3))
+            return await dump_videos()
+
+        monkeypatch.setattr(store, "dump_videos", racing_dump_videos)
+        report = await export_library(str(tmp_path))
+        assert len(calls) == 2 and report["library_version"] == await store.library_version()
+        assert (report["videos"], report["segments"]) == (3, 9)
+        assert pq.read_table(str(tmp_path / "segments.parquet")).num_rows == 9
+
+    asyncio.run(run())
+
+
+def test_projection_first_pass_keeps_results_and_survives_restart(tmp_path, monkeypatch):
+    pytest.importorskip("sklearn")
+    from app.config import settings
+
+    # embeddings with a low-dimensional structure, like real sentence vectors
+    rng = np.random.default_rng(0)
+    basis = rng.normal(size=(6, 48))
+
+    def structured(video, n):
+        segs = _segments(video, n, dim=48)
+        vecs = rng.normal(size=(n, 6)) @ basis + 0.05 * rng.normal(size=(n, 48))
+        for s, v in zip(segs, vecs):
+            s["embedding"] = v.tolist()
+        return segs
+
+    monkeypatch.setattr(settings, "PROJECTION_DIM", 8)
+    monkeypatch.setattr(settings, "PROJECTION_MIN_ROWS", 10 ** 9)
+
+    async def run():
+        store = InMemoryStore(snapshot_dir=str(tmp_path), shards=2)
+        for v in "abcdef":
+            await store.upsert_segments(v, v.upper(), structured(v, 60))
+        queries = [rng.normal(size=6) @ basis for _ in range(10)]
+        full = [[(d["video_id"], d["start_time"]) for d in await store.search(q.tolist(), 5, None)] for q in queries]
+
+        header = await store.fit_projection()
+        assert header == {"version": 1, "model": settings.EMBEDDING_MODEL, "dim": 8, "rows": 360}
+        assert all(t.proj.shape == (len(t), 8) for t in store._shards)
+        reduced = [[(d["video_id"], d["start_time"]) for d in await store.search(q.tolist(), 5, None)] for q in queries]
+        assert reduced == full
+        # rows ingested later are reduced with the current projection
+        await store.upsert_segments("g", "G", structured("g", 20))
+        assert store._shards[store._shard_of("g")].proj is not None
+        await store.close()
+
+        restarted = InMemoryStore(snapshot_dir=str(tmp_path), shards=2)
+        assert restarted._projection.header()["version"] == 1
+        assert sum(t.proj.shape[0] for t in restarted._shards) == 380
+        # growth past PROJECTION_REFIT_GROWTH refits in the background
+        monkeypatch.setattr(settings, "PROJECTION_MIN_ROWS", 10)
+        monkeypatch.setattr(settings, "PROJECTION_REFIT_GROWTH", 1.0)
+        await restarted.upsert_segments("h", "H", structured("h", 10))
+        await restarted._projection_task
+        assert restarted._projection.version == 2 and restarted._projection.rows == 390
+
+    asyncio.run(run())
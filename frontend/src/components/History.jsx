@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react'
 
 export function History({ api, onSelectVideo, currentVideoId }) {
   const [videos, setVideos] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(false)
   const [showHistory, setShowHistory] = useState(false)
 
@@ -11,11 +12,13 @@ export function History({ api, onSelectVideo, currentVideoId }) {
     }
   }, [showHistory])
 
-  async function loadHistory() {
+  async function loadHistory(cursor) {
     try {
       setLoading(true)
-      const response = await api.getHistory()
-      setVideos(response.videos || [])
+      const response = await api.getHistory(cursor)
+      const page = response.videos || []
+      setVideos(cursor ? [...videos, ...page] : page)
+      setNextCursor(response.next_cursor || null)
     } catch (e) {
       console.error('Failed to load history:', e)
     } finally {
@@ -46,7 +49,7 @@ export function History({ api, onSelectVideo, currentVideoId }) {
       
       {showHistory && (
         <div className="vstack" style={{ gap: 8 }}>
-          {loading ? (
+          {loading && videos.length === 0 ? (
             <div>Loading history...</div>
           ) : videos.length === 0 ? (
             <div className="no-results">No videos processed yet.</div>
@@ -82,6 +85,11 @@ export function History({ api, onSelectVideo, currentVideoId }) {
               </div>
             ))
           )}
+          {nextCursor && (
+            <button className="button" disabled={loading} onClick={() => loadHistory(nextCursor)}>
+              {loading ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
     </div>
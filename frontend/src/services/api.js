@@ -13,8 +13,8 @@ export function useApi() {
       const res = await axios.post(`${API_BASE}/search_timestamps`, { query, k, video_id });
       return res.data;
     },
-    getHistory: async () => {
-      const res = await axios.get(`${API_BASE}/history`);
+    getHistory: async (cursor) => {
+      const res = await axios.get(`${API_BASE}/history`, { params: cursor ? { cursor } : {} });
       return res.data;
     },
     uploadVideo: async (file) => {